@@ -0,0 +1,106 @@
+"""
+Read-only Aadhaar demographic directory.
+
+``manage.py build_aadhaar_directory`` compiles ``aadhaar_data.json`` into a
+SQLite file with the Aadhaar number as a WITHOUT ROWID primary key, so a
+lookup is a single B-tree search (O(log n)) that reads a few pages from
+disk. Nothing is loaded at import time and worker memory does not grow
+with the directory; recently used entries are kept in a small LRU cache.
+Without a compiled index the JSON file is loaded on first use, which is
+fine for the demo data set. Running workers keep reading the index file
+they opened; restart them after a rebuild.
+"""
+import json
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+
+HOT_CACHE_SIZE = 4096
+BUILD_BATCH_SIZE = 10000
+
+
+def build_index(json_path, index_path):
+    """Compile ``json_path`` into a fresh index at ``index_path``; returns the entry count."""
+    with open(json_path, 'r') as f:
+        entries = json.load(f)
+
+    tmp_path = f'{index_path}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute('CREATE TABLE directory (aadhaar TEXT PRIMARY KEY, record TEXT NOT NULL) WITHOUT ROWID')
+        items = iter(entries.items())
+        while True:
+            batch = [(number, json.dumps(info)) for number, info in _take(items, BUILD_BATCH_SIZE)]
+            if not batch:
+                break
+            conn.executemany('INSERT OR REPLACE INTO directory VALUES (?, ?)', batch)
+        conn.commit()
+    finally:
+        conn.close()
+
+    # Swap atomically so running workers never see a half-built file.
+    os.replace(tmp_path, index_path)
+    return len(entries)
+
+
+def _take(iterator, n):
+    for _ in range(n):
+        try:
+            yield next(iterator)
+        except StopIteration:
+            return
+
+
+class AadhaarDirectory:
+    def __init__(self, index_path, json_path):
+        self.index_path = index_path
+        self.json_path = json_path
+        self._local = threading.local()
+        self._json_entries = None
+        self._lock = threading.Lock()
+        self._lookup = lru_cache(maxsize=HOT_CACHE_SIZE)(self._fetch)
+
+    def get(self, aadhaar_number, default=None):
+        """Return the record for ``aadhaar_number`` (a dict) or ``default``."""
+        record = self._lookup(aadhaar_number)
+        return default if record is None else dict(record)
+
+    def clear_cache(self):
+        self._lookup.cache_clear()
+        self._local = threading.local()
+        self._json_entries = None
+
+    def _fetch(self, aadhaar_number):
+        if os.path.exists(self.index_path):
+            row = self._connection().execute(
+                'SELECT record FROM directory WHERE aadhaar = ?', (aadhaar_number,)
+            ).fetchone()
+            return json.loads(row[0]) if row else None
+        return self._json().get(aadhaar_number)
+
+    def _connection(self):
+        # sqlite3 connections are per thread; open read-only.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.index_path}?mode=ro', uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def _json(self):
+        with self._lock:
+            if self._json_entries is None:
+                if os.path.exists(self.json_path):
+                    with open(self.json_path, 'r') as f:
+                        self._json_entries = json.load(f)
+                else:
+                    self._json_entries = {}
+            return self._json_entries
+
+
+directory = AadhaarDirectory(settings.AADHAAR_DIRECTORY_INDEX, settings.AADHAAR_DIRECTORY_SOURCE)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.aadhaar_directory import build_index
+
+
+class Command(BaseCommand):
+    help = "Compile the Aadhaar JSON data into the indexed on-disk directory used for lookups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=settings.AADHAAR_DIRECTORY_SOURCE)
+        parser.add_argument('--output', default=settings.AADHAAR_DIRECTORY_INDEX)
+
+    def handle(self, *args, **options):
+        count = build_index(options['source'], options['output'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} Aadhaar record(s) into {options['output']}."))
@@ -1,3 +1,15 @@
 from django.db import models
 
-# Create your models here.
+from patients.models import Patient
+
+
+class RememberToken(models.Model):
+    """A "keep me logged in" cookie token. Only its keyed hash is stored."""
+    token_hash = models.CharField(max_length=64, unique=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='remember_tokens')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.patient} (expires {self.expires_at:%Y-%m-%d})'
@@ -1,9 +1,151 @@
-from django.utils.crypto import get_random_string
-import hashlib
+import copy
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import get_random_string, salted_hmac
+
+from .models import RememberToken
+
+REMEMBER_COOKIE = "remember_token"
+REMEMBER_TOKEN_MAX_AGE = 30 * 24 * 3600  # 30 days
+
+# How long a resolved token stays in the process-local cache. Revocations
+# reach other processes through the shared cache backend (REVOKED_KEY, see
+# CACHES in settings); changes to the user (e.g. deactivation) are seen
+# within this many seconds.
+TOKEN_CACHE_TTL = 30
+TOKEN_CACHE_SIZE = 10000
+# last_used_at is only written when it is older than this.
+LAST_USED_RESOLUTION = 3600
+REVOKED_KEY = 'remember-token-revoked:{}'
+
 
 def make_remember_token():
     return get_random_string(48)
 
+
 def hash_token(token):
-    return hashlib.sha256(token.encode()).hexdigest()
+    """Keyed hash stored in the DB (never store the raw token)."""
+    return salted_hmac("aadhaar_token", token).hexdigest()
+
+
+class TokenCache:
+    """
+    Thread-safe LRU cache with per-entry expiry, mapping token hashes to
+    resolved users so returning visitors skip the database.
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def issue_remember_token(patient, previous=None):
+    """
+    Create a new remember token for ``patient`` and return the raw value for
+    the cookie. ``previous`` (the old cookie value, if any) is revoked so
+    each login rotates the token.
+    """
+    if previous:
+        revoke_remember_token(previous)
+    RememberToken.objects.filter(patient=patient, expires_at__lte=timezone.now()).delete()
+
+    token = make_remember_token()
+    RememberToken.objects.create(
+        token_hash=hash_token(token),
+        patient=patient,
+        expires_at=timezone.now() + timedelta(seconds=REMEMBER_TOKEN_MAX_AGE),
+    )
+    return token
+
+
+def revoke_remember_token(token):
+    hashed = hash_token(token)
+    # Other processes check this marker before trusting their cached entry.
+    cache.set(REVOKED_KEY.format(hashed), True, TOKEN_CACHE_TTL)
+    token_cache.invalidate(hashed)
+    RememberToken.objects.filter(token_hash=hashed).delete()
+
+
+def user_for_token(token):
+    """
+    Return the User a remember token belongs to, or None if it is unknown,
+    expired or revoked. Hits in ``token_cache`` only check the revocation
+    marker in the cache backend; misses cost one indexed lookup of the token.
+    """
+    hashed = hash_token(token)
+    cached = token_cache.get(hashed)
+    if cached is not None:
+        user, expires_at, last_used = cached
+        if expires_at > timezone.now() and not cache.get(REVOKED_KEY.format(hashed)):
+            if _touch(hashed, user, expires_at, last_used):
+                # Callers (login()) modify the user; keep the cached one intact.
+                return copy.copy(user)
+        token_cache.invalidate(hashed)
+        return None
+
+    record = (
+        RememberToken.objects.select_related('patient__user')
+        .filter(token_hash=hashed, expires_at__gt=timezone.now())
+        .first()
+    )
+    if record is None:
+        return None
+
+    user = record.patient.user
+    ttl = (record.expires_at - timezone.now()).total_seconds()
+    token_cache.set(hashed, (copy.copy(user), record.expires_at, record.last_used_at), ttl)
+    if not _touch(hashed, user, record.expires_at, record.last_used_at):
+        token_cache.invalidate(hashed)
+        return None
+    return user
+
 
+def _touch(hashed, user, expires_at, last_used):
+    """
+    Record token use, at most once per LAST_USED_RESOLUTION. Returns False
+    if the token no longer exists (revoked by another process).
+    """
+    now = timezone.now()
+    if last_used and (now - last_used).total_seconds() < LAST_USED_RESOLUTION:
+        return True
+    if not RememberToken.objects.filter(token_hash=hashed).update(last_used_at=now):
+        return False
+    token_cache.set(hashed, (copy.copy(user), expires_at, now), (expires_at - now).total_seconds())
+    return True
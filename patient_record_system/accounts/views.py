@@ -1,15 +1,12 @@
 import json
 import re
 import hashlib
-import secrets
-import os
 
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.http import JsonResponse
-from django.utils.crypto import salted_hmac
 from django.contrib.auth.forms import AuthenticationForm
 
 from patients.models import Patient
@@ -18,34 +15,13 @@ from .forms import (
     AadhaarVerifyOTPForm,
 )
 from .aadhaar_provider import provider  # mock or real provider
-
-# ============================================================
-# Load Aadhaar Dummy Data (external JSON)
-# ============================================================
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-AADHAAR_DATA_PATH = os.path.join(os.path.dirname(__file__), "aadhaar_data.json")
-
-
-if os.path.exists(AADHAAR_DATA_PATH):
-    with open(AADHAAR_DATA_PATH, "r") as f:
-        AADHAAR_DB = json.load(f)
-else:
-    AADHAAR_DB = {}
-
-
-# ============================================================
-# Utility Functions
-# ============================================================
-
-def make_remember_token():
-    """Generate a secure random token."""
-    return secrets.token_urlsafe(32)
-
-
-def hash_token(token):
-    """Return a consistent hash for storing in DB (never store raw token)."""
-    return salted_hmac("aadhaar_token", token).hexdigest()
-
+from .aadhaar_directory import directory  # indexed Aadhaar demo data
+from .token_utils import (
+    REMEMBER_COOKIE,
+    REMEMBER_TOKEN_MAX_AGE,
+    issue_remember_token,
+    revoke_remember_token,
+)
 
 # ============================================================
 # Aadhaar OTP–based authentication
@@ -58,8 +34,8 @@ def aadhaar_request_otp(request):
         if form.is_valid():
             aadhaar_number = form.cleaned_data["aadhaar_number"].strip()
 
-            # Validate if Aadhaar exists in our local JSON DB
-            aadhaar_info = AADHAAR_DB.get(aadhaar_number)
+            # Validate if Aadhaar exists in our local directory
+            aadhaar_info = directory.get(aadhaar_number)
             if not aadhaar_info:
                 messages.error(request, "Aadhaar not found in demo database.")
                 return render(request, "accounts/request_otp.html", {"form": form})
@@ -99,8 +75,8 @@ def aadhaar_verify_otp(request):
 
             resp = provider.verify_otp(aadhaar_number, txn_id, otp)
             if resp.get("status") == "OK":
-                # Fetch user info from JSON DB
-                info = AADHAAR_DB.get(aadhaar_number, {})
+                # Fetch user info from the directory
+                info = directory.get(aadhaar_number, {})
                 name = info.get("name", f"user_{aadhaar_number[-4:]}")
                 dob = info.get("dob", "1990-01-01")
                 masked = f"xxxx-xxxx-{aadhaar_number[-4:]}"
@@ -137,17 +113,15 @@ def aadhaar_verify_otp(request):
                 if updated:
                     patient.save()
 
-                # Generate secure token and set cookie
-                token = make_remember_token()
-                patient.aadhaar_token = hash_token(token)
-                patient.save()
+                # Generate secure token (rotating any previous one) and set cookie
+                token = issue_remember_token(patient, request.COOKIES.get(REMEMBER_COOKIE))
 
                 login(request, user)
                 response = redirect("home")
                 response.set_cookie(
-                    "remember_token",
+                    REMEMBER_COOKIE,
                     token,
-                    max_age=30 * 24 * 3600,  # 30 days
+                    max_age=REMEMBER_TOKEN_MAX_AGE,  # 30 days
                     secure=True,             # Use HTTPS in production
                     httponly=True,
                     samesite="Lax",
@@ -188,7 +162,7 @@ def qr_verify(request):
     # Simulate Aadhaar QR decode
     m = re.search(r"(\d{12})", qr_text.strip())
     aadhaar_number = m.group(1) if m else "000000000000"
-    info = AADHAAR_DB.get(aadhaar_number, {})
+    info = directory.get(aadhaar_number, {})
     name = info.get("name", "QR User")
     dob = info.get("dob", "1990-01-01")
     aadhaar_hash = hashlib.sha256(aadhaar_number.encode()).hexdigest()
@@ -200,17 +174,15 @@ def qr_verify(request):
         defaults={"name": name, "dob": dob, "aadhaar_hash": aadhaar_hash},
     )
 
-    # Generate secure token and cookie
-    token = make_remember_token()
-    patient.aadhaar_token = hash_token(token)
-    patient.save()
+    # Generate secure token (rotating any previous one) and cookie
+    token = issue_remember_token(patient, request.COOKIES.get(REMEMBER_COOKIE))
 
     login(request, user)
     response = JsonResponse({"status": "ok", "redirect": "/"})
     response.set_cookie(
-        "remember_token",
+        REMEMBER_COOKIE,
         token,
-        max_age=30 * 24 * 3600,
+        max_age=REMEMBER_TOKEN_MAX_AGE,
         secure=True,
         httponly=True,
         samesite="Lax",
@@ -243,8 +215,11 @@ def login_view(request):
 # ============================================================
 
 def logout_view(request):
-    """Logout and clear cookies"""
+    """Logout, revoke the remember token and clear cookies"""
+    token = request.COOKIES.get(REMEMBER_COOKIE)
+    if token:
+        revoke_remember_token(token)
     response = redirect("home")
-    response.delete_cookie("remember_token")
+    response.delete_cookie(REMEMBER_COOKIE)
     logout(request)
     return response
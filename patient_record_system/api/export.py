@@ -0,0 +1,232 @@
+"""
+Streaming export of patients' records for other systems.
+
+Two formats are produced:
+
+``ndjson``
+    One JSON object per line: a ``patient`` line, then that patient's
+    ``group`` lines, then their ``file`` lines.
+``fhir``
+    A FHIR R4 ``Bundle`` (type ``collection``) of ``Patient`` and
+    ``DocumentReference`` resources; the group of a document is given as
+    its ``category``.
+
+File contents are left out, linked (``url``) or inlined as base64.
+Patients, groups and files each come from a single query ordered by
+patient and read with ``.iterator()``; the three are walked side by side
+and inlined files are encoded a chunk at a time, so exporting every
+patient runs in constant memory.
+"""
+import base64
+import json
+import mimetypes
+
+from django.urls import reverse
+from django.utils import timezone
+
+from patients.models import PatientFile, RecordGroup
+
+FORMATS = ('ndjson', 'fhir')
+BINARIES = ('none', 'link', 'inline')
+ITERATOR_CHUNK_SIZE = 500
+# A multiple of 3, so base64 chunks can be concatenated without padding.
+INLINE_CHUNK_SIZE = 3 * 64 * 1024
+
+GROUP_SYSTEM = 'urn:patient-record-system:record-group'
+# Placeholder swapped for the base64 body while streaming an inlined file.
+_DATA = '\x00data\x00'
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+class _Cursor:
+    """Walks rows ordered by ``patient_id``, handing out one patient's rows at a time."""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.head = next(self.rows, None)
+
+    def take(self, patient_id):
+        while self.head is not None and self.head.patient_id < patient_id:
+            self.head = next(self.rows, None)
+        while self.head is not None and self.head.patient_id == patient_id:
+            yield self.head
+            self.head = next(self.rows, None)
+
+
+def _inline(text, file_obj):
+    """Yield ``text`` with the placeholder replaced by the file's content in base64."""
+    placeholder = json.dumps(_DATA)
+    try:
+        fh = file_obj.file.open('rb')
+    except OSError:
+        # Missing on disk: export the metadata without content.
+        yield text.replace(placeholder, 'null')
+        return
+    before, after = text.split(placeholder, 1)
+    yield before + '"'
+    with fh:
+        while True:
+            chunk = fh.read(INLINE_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield base64.b64encode(chunk).decode('ascii')
+    yield '"' + after
+
+
+class Exporter:
+    """
+    ``binaries`` is ``none``, ``link`` or ``inline``. Links are built from
+    ``base_url`` (e.g. ``request.build_absolute_uri('/')``); without it they are paths.
+    """
+
+    def __init__(self, format='ndjson', binaries='none', base_url=''):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format {format!r}; choose one of {', '.join(FORMATS)}.")
+        if binaries not in BINARIES:
+            raise ValueError(f"Unknown binaries option {binaries!r}; choose one of {', '.join(BINARIES)}.")
+        self.format = format
+        self.binaries = binaries
+        self.base_url = base_url.rstrip('/')
+
+    @property
+    def content_type(self):
+        return 'application/x-ndjson' if self.format == 'ndjson' else 'application/fhir+json'
+
+    @property
+    def extension(self):
+        return 'ndjson' if self.format == 'ndjson' else 'json'
+
+    def stream(self, patients):
+        """Yield the export of ``patients`` (a Patient queryset) as text chunks."""
+        patients = patients.order_by('id')
+        groups = _Cursor(
+            RecordGroup.objects.filter(patient__in=patients).order_by('patient_id', 'name', 'id')
+            .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        )
+        files = _Cursor(
+            PatientFile.objects.filter(patient__in=patients).select_related('blob')
+            .order_by('patient_id', 'uploaded_at', 'id').iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        )
+
+        if self.format == 'fhir':
+            yield json.dumps({
+                'resourceType': 'Bundle', 'type': 'collection', 'timestamp': timezone.now().isoformat(),
+            })[:-1] + ',"entry":['
+        first = True
+        for patient in patients.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            group_names = {}
+            records = [self.patient(patient)]
+            for group in groups.take(patient.id):
+                group_names[group.id] = group.name
+                if self.format == 'ndjson':
+                    records.append(self.group(group))
+            for record in records:
+                yield from self._write(record, None, first)
+                first = False
+            for file_obj in files.take(patient.id):
+                yield from self._write(self.file(file_obj, group_names), file_obj, first)
+        if self.format == 'fhir':
+            yield ']}\n'
+
+    def _write(self, record, file_obj, first):
+        if self.format == 'fhir':
+            record = {'resource': record}
+        text = json.dumps(record, separators=(',', ':'))
+        if self.format == 'fhir':
+            text = ('' if first else ',') + '\n' + text
+        else:
+            text += '\n'
+        if file_obj is not None and self.binaries == 'inline' and file_obj.file:
+            yield from _inline(text, file_obj)
+        else:
+            yield text
+
+    def _url(self, file_obj):
+        return self.base_url + reverse('patients:serve_file', args=[file_obj.id])
+
+    # -----------------------------------------
+    # Records
+    # -----------------------------------------
+    def patient(self, patient):
+        if self.format == 'ndjson':
+            return {
+                'type': 'patient',
+                'id': patient.id,
+                'name': patient.name,
+                'dob': _iso(patient.dob),
+                'contact_number': patient.contact_number,
+                'masked_aadhaar': patient.masked_aadhaar,
+            }
+        resource = {
+            'resourceType': 'Patient',
+            'id': str(patient.id),
+            'name': [{'text': patient.name}],
+        }
+        if patient.dob:
+            resource['birthDate'] = patient.dob.isoformat()
+        if patient.contact_number:
+            resource['telecom'] = [{'system': 'phone', 'value': patient.contact_number}]
+        return resource
+
+    def group(self, group):
+        return {
+            'type': 'group',
+            'id': group.id,
+            'patient_id': group.patient_id,
+            'name': group.name,
+            'created_at': _iso(group.created_at),
+        }
+
+    def file(self, file_obj, group_names):
+        content_type = mimetypes.guess_type(file_obj.filename)[0] or 'application/octet-stream'
+        sha256 = file_obj.blob.sha256 if file_obj.blob_id else None
+        if self.format == 'ndjson':
+            record = {
+                'type': 'file',
+                'id': file_obj.id,
+                'patient_id': file_obj.patient_id,
+                'group_id': file_obj.group_id,
+                'title': file_obj.title,
+                'description': file_obj.description,
+                'filename': file_obj.filename,
+                'content_type': content_type,
+                'size': file_obj.size,
+                'sha256': sha256,
+                'uploaded_at': _iso(file_obj.uploaded_at),
+            }
+            target = record
+        else:
+            attachment = {
+                'contentType': content_type,
+                'title': file_obj.filename,
+                'size': file_obj.size,
+                'creation': _iso(file_obj.uploaded_at),
+            }
+            record = {
+                'resourceType': 'DocumentReference',
+                'id': str(file_obj.id),
+                'status': 'current',
+                'subject': {'reference': f'Patient/{file_obj.patient_id}'},
+                'date': _iso(file_obj.uploaded_at),
+                'description': file_obj.title or file_obj.filename,
+                'content': [{'attachment': attachment}],
+            }
+            if sha256:
+                digest = base64.urlsafe_b64encode(bytes.fromhex(sha256)).rstrip(b'=').decode('ascii')
+                record['identifier'] = [{'system': 'urn:ietf:rfc:6920', 'value': f'ni:///sha-256;{digest}'}]
+            if file_obj.group_id:
+                record['category'] = [{'coding': [{
+                    'system': GROUP_SYSTEM,
+                    'code': str(file_obj.group_id),
+                    'display': group_names.get(file_obj.group_id, ''),
+                }]}]
+            target = attachment
+
+        if self.binaries == 'link':
+            target['url'] = self._url(file_obj)
+        elif self.binaries == 'inline' and file_obj.file:
+            target['data'] = _DATA
+        return record
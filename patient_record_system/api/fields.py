@@ -0,0 +1,52 @@
+"""
+Sparse field selection for API resources.
+
+Each resource declares its fields once: the model columns a field needs
+(so the query can ``.only()`` load those) and how to render it. Clients
+pick fields with ``?fields=a,b``; the primary key is always included.
+"""
+
+
+class FieldError(ValueError):
+    pass
+
+
+class Field:
+    def __init__(self, columns=(), render=None, related=None):
+        self.columns = tuple(columns)
+        self.render = render
+        # select_related() path needed by ``render``
+        self.related = related
+
+
+class Resource:
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def select(self, param):
+        """Field names requested by ``?fields=``; all fields when absent."""
+        if not param:
+            return list(self.fields)
+        names = [name.strip() for name in param.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise FieldError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(self.fields)}.")
+        if 'id' not in names:
+            names.insert(0, 'id')
+        return names
+
+    def restrict(self, queryset, names, always=('id',)):
+        """Load only the columns (and joins) the selected fields need."""
+        columns = set(always)
+        related = set()
+        for name in names:
+            field = self.fields[name]
+            columns.update(field.columns)
+            if field.related:
+                related.add(field.related)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
+    def render(self, obj, names):
+        return {name: self.fields[name].render(obj) for name in names}
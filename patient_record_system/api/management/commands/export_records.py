@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import BINARIES, FORMATS, Exporter
+from patients.models import Patient
+
+
+class Command(BaseCommand):
+    help = "Export patients' records as NDJSON or a FHIR DocumentReference bundle."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, action='append', help="Patient id (repeatable); all patients by default.")
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--binaries', choices=BINARIES, default='none',
+                            help="Leave file contents out, link to them or inline them as base64.")
+        parser.add_argument('--base-url', default='', help="Prefix for file links, e.g. https://records.example.org")
+        parser.add_argument('--output', help="File to write (default: standard output).")
+
+    def handle(self, *args, **options):
+        patients = Patient.objects.all()
+        if options['patient']:
+            patients = patients.filter(id__in=options['patient'])
+            if not patients.exists():
+                raise CommandError("No such patient.")
+
+        exporter = Exporter(options['format'], options['binaries'], options['base_url'])
+        if not options['output']:
+            for chunk in exporter.stream(patients):
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8') as out:
+            for chunk in exporter.stream(patients):
+                out.write(chunk)
@@ -0,0 +1,102 @@
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from patients.models import Patient, PatientFile, RecordGroup
+
+
+class ApiTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.user = User.objects.create_user('patient')
+        self.patient = Patient.objects.create(user=self.user, name='Test Patient')
+        self.client.force_login(self.user)
+
+    def add_file(self, name, group=None):
+        patient_file = PatientFile(
+            patient=self.patient, group=group, title=name, file=SimpleUploadedFile(name, name.encode()),
+        )
+        patient_file.save()
+        return patient_file
+
+    def changes(self, cursor=0):
+        return self.client.get(reverse('api:changes'), {'cursor': cursor}).json()
+
+
+class ConditionalRequestTests(ApiTestCase):
+    def test_unchanged_records_answer_304(self):
+        url = reverse('api:file_list')
+        etag = self.client.get(url)['ETag']
+
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        self.add_file('new.txt')
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_profile_edit_changes_the_etag(self):
+        url = reverse('api:patient_detail')
+        etag = self.client.get(url)['ETag']
+
+        self.patient.name = 'Renamed'
+        self.patient.save()
+
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Renamed')
+
+    def test_requires_a_patient_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api:patient_detail')).status_code, 401)
+
+
+class ListingTests(ApiTestCase):
+    def test_files_are_paged_and_filtered_by_group(self):
+        group = RecordGroup.objects.create(patient=self.patient, name='Lab')
+        for n in range(3):
+            self.add_file(f'grouped{n}.txt', group)
+        self.add_file('loose.txt')
+
+        first = self.client.get(reverse('api:file_list'), {'limit': 2, 'fields': 'id,title'}).json()
+        self.assertEqual(set(first['results'][0]), {'id', 'title'})
+        second = self.client.get(reverse('api:file_list'), {'limit': 2, 'cursor': first['next_cursor']}).json()
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(len(first['results']) + len(second['results']), 4)
+
+        ungrouped = self.client.get(reverse('api:file_list'), {'group': 'none'}).json()['results']
+        self.assertEqual([f['title'] for f in ungrouped], ['loose.txt'])
+        self.assertEqual(len(self.client.get(reverse('api:file_list'), {'group': group.id}).json()['results']), 3)
+
+    def test_unknown_field_is_a_bad_request(self):
+        response = self.client.get(reverse('api:file_list'), {'fields': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ChangeFeedTests(ApiTestCase):
+    def test_feed_reports_upserts_deletes_and_profile_edits(self):
+        kept = self.add_file('kept.txt')
+        removed = self.add_file('removed.txt')
+        removed_id = removed.id
+        removed.delete()
+        self.patient.contact_number = '5550100'
+        self.patient.save()
+
+        feed = self.changes()
+        entries = {(c['type'], c.get('id') or c['data']['id']): c for c in feed['changes']}
+
+        self.assertEqual(entries[('file', kept.id)]['action'], 'upsert')
+        self.assertEqual(entries[('file', removed_id)]['action'], 'delete')
+        self.assertEqual(entries[('patient', self.patient.id)]['data']['contact_number'], '5550100')
+        self.assertFalse(feed['has_more'])
+
+        self.assertEqual(self.changes(feed['cursor'])['changes'], [])
@@ -0,0 +1,14 @@
+from django.urls import path
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('patient/', views.patient_detail, name='patient_detail'),
+    path('groups/', views.group_list, name='group_list'),
+    path('groups/<int:group_id>/', views.group_detail, name='group_detail'),
+    path('files/', views.file_list, name='file_list'),
+    path('files/<int:file_id>/', views.file_detail, name='file_detail'),
+    path('changes/', views.changes, name='changes'),
+    path('export/', views.export, name='export'),
+]
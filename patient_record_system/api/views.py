@@ -0,0 +1,267 @@
+"""
+JSON API (v1) for a patient's own records.
+
+Every response carries a weak ETag derived from ``Patient.records_version``
+(bumped on any change to the patient's profile, files or groups) and the request's
+query string. ``If-None-Match`` is answered with 304 right after the
+patient row is loaded, before any listing query runs, so polling clients
+pay for one indexed lookup when nothing changed.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from patients.models import Patient, PatientFile, RecordChange
+from patients.pagination import PAGE_SIZE, keyset_page
+
+from .export import Exporter
+from .fields import Field, FieldError, Resource
+
+MAX_PAGE_SIZE = 200
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+PATIENT = Resource(
+    id=Field(['id'], lambda p: p.id),
+    name=Field(['name'], lambda p: p.name),
+    dob=Field(['dob'], lambda p: _iso(p.dob)),
+    contact_number=Field(['contact_number'], lambda p: p.contact_number),
+    masked_aadhaar=Field(['masked_aadhaar'], lambda p: p.masked_aadhaar),
+    records_version=Field(['records_version'], lambda p: p.records_version),
+)
+
+GROUP = Resource(
+    id=Field(['id'], lambda g: g.id),
+    name=Field(['name'], lambda g: g.name),
+    created_at=Field(['created_at'], lambda g: _iso(g.created_at)),
+    file_count=Field([], lambda g: g.file_count),
+)
+
+FILE = Resource(
+    id=Field(['id'], lambda f: f.id),
+    title=Field(['title'], lambda f: f.title),
+    description=Field(['description'], lambda f: f.description),
+    filename=Field(['original_name', 'file'], lambda f: f.filename),
+    size=Field(['size'], lambda f: f.size),
+    group=Field(['group'], lambda f: f.group_id),
+    uploaded_at=Field(['uploaded_at'], lambda f: _iso(f.uploaded_at)),
+    sha256=Field(['blob__sha256'], lambda f: f.blob.sha256 if f.blob_id else None, related='blob'),
+    url=Field([], lambda f: reverse('patients:serve_file', args=[f.id])),
+)
+
+
+def api_view(view):
+    """
+    Resolve the caller's Patient, answer conditional GETs and turn field
+    selection errors into 400s. The view is called as ``view(request, patient, ...)``.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return JsonResponse({'error': 'Method not allowed.'}, status=405)
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required.'}, status=401)
+        patient = Patient.objects.filter(user=request.user).first()
+        if patient is None:
+            return JsonResponse({'error': 'No patient profile for this account.'}, status=404)
+
+        query = hashlib.sha1(f'{request.path}?{request.GET.urlencode()}'.encode()).hexdigest()[:16]
+        etag = f'W/"{patient.id}.{patient.records_version}.{query}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            try:
+                response = view(request, patient, *args, **kwargs)
+            except FieldError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Cookie'])
+        return response
+    return wrapper
+
+
+def _page_size(request):
+    try:
+        return max(1, min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        return PAGE_SIZE
+
+
+def _listing(request, resource, queryset, names, field):
+    items, next_cursor = keyset_page(
+        resource.restrict(queryset, names, always=('id', field)),
+        request.GET.get('cursor'),
+        _page_size(request),
+        field,
+    )
+    return JsonResponse({
+        'results': [resource.render(obj, names) for obj in items],
+        'next_cursor': next_cursor,
+    })
+
+
+def _not_found():
+    return JsonResponse({'error': 'Not found.'}, status=404)
+
+
+# -----------------------------------------
+# Patient
+# -----------------------------------------
+@api_view
+def patient_detail(request, patient):
+    names = PATIENT.select(request.GET.get('fields'))
+    return JsonResponse(PATIENT.render(patient, names))
+
+
+# -----------------------------------------
+# Groups
+# -----------------------------------------
+def _groups(patient, names):
+    groups = patient.groups.all()
+    if 'file_count' in names:
+        groups = groups.annotate(file_count=Count('patientfile', filter=Q(patientfile__deleted_at__isnull=True)))
+    return groups
+
+
+@api_view
+def group_list(request, patient):
+    names = GROUP.select(request.GET.get('fields'))
+    return _listing(request, GROUP, _groups(patient, names), names, 'created_at')
+
+
+@api_view
+def group_detail(request, patient, group_id):
+    names = GROUP.select(request.GET.get('fields'))
+    group = GROUP.restrict(_groups(patient, names), names).filter(id=group_id).first()
+    if group is None:
+        return _not_found()
+    return JsonResponse(GROUP.render(group, names))
+
+
+# -----------------------------------------
+# Files
+# -----------------------------------------
+def _files(patient):
+    return PatientFile.objects.filter(patient=patient)
+
+
+@api_view
+def file_list(request, patient):
+    """Files newest first; ``?group=<id>`` or ``?group=none`` limits them to one group or to ungrouped files."""
+    names = FILE.select(request.GET.get('fields'))
+    files = _files(patient)
+    group = request.GET.get('group')
+    if group == 'none':
+        files = files.filter(group__isnull=True)
+    elif group:
+        files = files.filter(group_id=group) if group.isdigit() else files.none()
+    return _listing(request, FILE, files, names, 'uploaded_at')
+
+
+@api_view
+def file_detail(request, patient, file_id):
+    names = FILE.select(request.GET.get('fields'))
+    file_obj = FILE.restrict(_files(patient), names).filter(id=file_id).first()
+    if file_obj is None:
+        return _not_found()
+    return JsonResponse(FILE.render(file_obj, names))
+
+
+# -----------------------------------------
+# Delta Sync
+# -----------------------------------------
+@api_view
+def changes(request, patient):
+    """
+    Changes to the patient's groups and files after ``?cursor=<seq>``
+    (0 or absent for a full sync), oldest first. Each object appears once
+    with its current state, or as a deletion; pass the returned ``cursor``
+    on the next call and repeat while ``has_more`` is true.
+    """
+    try:
+        cursor = int(request.GET.get('cursor') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+    limit = _page_size(request)
+
+    entries = list(
+        patient.changes.filter(seq__gt=cursor).order_by('seq')
+        .values_list('seq', 'kind', 'object_id', 'action')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Keep only the latest entry per object within this page.
+    latest = {}
+    for seq, kind, object_id, action in entries:
+        latest.pop((kind, object_id), None)
+        latest[(kind, object_id)] = (seq, action)
+
+    def upserted(kind):
+        return [
+            object_id for (k, object_id), (_, action) in latest.items()
+            if k == kind and action == RecordChange.UPSERT
+        ]
+
+    file_names = list(FILE.fields)
+    group_names = list(GROUP.fields)
+    objects = {
+        RecordChange.FILE: FILE.restrict(_files(patient), file_names).in_bulk(upserted(RecordChange.FILE)),
+        RecordChange.GROUP: GROUP.restrict(_groups(patient, group_names), group_names)
+        .in_bulk(upserted(RecordChange.GROUP)),
+        RecordChange.PATIENT: {patient.id: patient},
+    }
+    resources = {
+        RecordChange.FILE: (FILE, file_names),
+        RecordChange.GROUP: (GROUP, group_names),
+        RecordChange.PATIENT: (PATIENT, list(PATIENT.fields)),
+    }
+
+    results = []
+    for (kind, object_id), (seq, action) in latest.items():
+        obj = objects[kind].get(object_id)
+        if action == RecordChange.UPSERT and obj is not None:
+            resource, names = resources[kind]
+            results.append({'seq': seq, 'type': kind, 'action': action, 'data': resource.render(obj, names)})
+        else:
+            # Also covers objects deleted after this entry was written.
+            results.append({'seq': seq, 'type': kind, 'action': RecordChange.DELETE, 'id': object_id})
+
+    return JsonResponse({
+        'changes': results,
+        'cursor': entries[-1][0] if entries else cursor,
+        'has_more': has_more,
+    })
+
+
+# -----------------------------------------
+# Export
+# -----------------------------------------
+@api_view
+def export(request, patient):
+    """
+    The patient's whole record as NDJSON or a FHIR bundle (``?format=ndjson|fhir``),
+    with file contents left out, linked or inlined (``?binaries=none|link|inline``).
+    """
+    try:
+        exporter = Exporter(
+            request.GET.get('format', 'ndjson'),
+            request.GET.get('binaries', 'none'),
+            base_url=request.build_absolute_uri('/'),
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response = StreamingHttpResponse(
+        exporter.stream(Patient.objects.filter(id=patient.id)), content_type=exporter.content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="records-{patient.id}.{exporter.extension}"'
+    return response
@@ -1,20 +1,112 @@
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.utils.deprecation import MiddlewareMixin
 from django.contrib.auth import login
-from patients.models import Patient
-from django.utils.crypto import salted_hmac
+from accounts.token_utils import REMEMBER_COOKIE, user_for_token
+
+from .profiling import QueryRecorder, registry
 
 class AutoLoginMiddleware(MiddlewareMixin):
     def process_request(self, request):
         if request.user.is_authenticated:
             return
 
-        token = request.COOKIES.get("remember_token")
+        token = request.COOKIES.get(REMEMBER_COOKIE)
         if not token:
             return
 
-        hashed = salted_hmac("aadhaar_token", token).hexdigest()
+        user = user_for_token(token)
+        if user is not None and user.is_active:
+            login(request, user)
+
+
+class ProfilingMiddleware:
+    """
+    Per-view request metrics (see ``core.profiling``), enabled with
+    ``REQUEST_PROFILING = True``. Streamed responses are measured until
+    their last chunk is sent, so queries run while streaming are counted.
+
+    Peak memory comes from ``tracemalloc``, which slows every allocation
+    down; it is only traced with ``REQUEST_PROFILING_MEMORY = True`` and is
+    approximate when threads serve requests concurrently.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.n_plus_one = getattr(settings, 'REQUEST_PROFILING_N_PLUS_ONE', 10)
+        self.trace_memory = getattr(settings, 'REQUEST_PROFILING_MEMORY', False)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _recording(self, recorder):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        return stack
+
+    def __call__(self, request):
+        recorder = QueryRecorder(time.perf_counter)
+        memory_base = self._memory_start()
+        start = time.perf_counter()
+        with self._recording(recorder):
+            response = self.get_response(request)
+
+        if response.streaming and not response.has_header('Content-Length'):
+            response.streaming_content = self._stream(
+                request, response, response.streaming_content, recorder, start, memory_base
+            )
+            return response
+
+        if response.has_header('Content-Length'):
+            size = int(response['Content-Length'])
+        else:
+            size = 0 if response.streaming else len(response.content)
+        elapsed = self._finish(request, response, recorder, start, memory_base, size)
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries", '
+            f'total;dur={elapsed * 1000:.1f}'
+        )
+        return response
+
+    def _stream(self, request, response, content, recorder, start, memory_base):
+        size = 0
         try:
-            patient = Patient.objects.get(aadhaar_token=hashed)
-            login(request, patient.user)
-        except Patient.DoesNotExist:
-            pass
+            with self._recording(recorder):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self._finish(request, response, recorder, start, memory_base, size)
+
+    def _memory_start(self):
+        if not self.trace_memory:
+            return None
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return current
+
+    def _finish(self, request, response, recorder, start, memory_base, size):
+        elapsed = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+
+        registry.count_request(view, request.method, response.status_code)
+        registry.observe('http_request_duration_seconds', view, elapsed)
+        registry.observe('http_request_db_queries', view, recorder.count)
+        registry.observe('http_request_db_duration_seconds', view, recorder.duration)
+        registry.observe('http_response_bytes', view, size)
+        if memory_base is not None:
+            _, peak = tracemalloc.get_traced_memory()
+            registry.observe('http_request_memory_peak_bytes', view, max(peak - memory_base, 0))
+
+        repeated = recorder.repeated(self.n_plus_one)
+        if repeated:
+            registry.report_n_plus_one(view, request.path, repeated)
+        return elapsed
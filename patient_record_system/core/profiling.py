@@ -0,0 +1,160 @@
+"""
+In-process request metrics for ``core.middleware.ProfilingMiddleware``.
+
+Per view, the middleware records wall time, number and time of database
+queries, response bytes and the peak Python memory allocated while the
+request ran. Values are aggregated here into cumulative histograms and
+rendered in the Prometheus text format by ``core.views.metrics``. Each
+process keeps its own numbers; scrape every worker (or run a single one)
+when profiling.
+
+Requests that run the same SELECT shape (the statement with literals
+stripped) at least ``REQUEST_PROFILING_N_PLUS_ONE`` times are counted
+and logged as N+1 suspects.
+"""
+import logging
+import re
+import threading
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600)
+MEMORY_BUCKETS = (65536, 262144, 1048576, 4194304, 16777216, 67108864, 268435456)
+
+# Most recent N+1 reports kept for the metrics page.
+N_PLUS_ONE_HISTORY = 20
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+
+
+def sql_shape(sql):
+    """The statement with literals and IN-lists collapsed, so repeats of one query compare equal."""
+    shape = _STRING_RE.sub('?', sql)
+    shape = _NUMBER_RE.sub('?', shape)
+    return _IN_LIST_RE.sub('(...)', shape)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` callback that counts and times queries of one request."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = self.clock()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += self.clock() - start
+            self.count += 1
+            if sql.lstrip()[:6].upper() == 'SELECT':
+                self.shapes[sql_shape(sql)] += 1
+
+    def repeated(self, threshold):
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+class MetricsRegistry:
+    HISTOGRAMS = (
+        ('http_request_duration_seconds', 'Wall time spent in the view and middleware.', DURATION_BUCKETS),
+        ('http_request_db_queries', 'Database queries per request.', QUERY_BUCKETS),
+        ('http_request_db_duration_seconds', 'Time spent in database queries per request.', DURATION_BUCKETS),
+        ('http_response_bytes', 'Response body size.', BYTES_BUCKETS),
+        ('http_request_memory_peak_bytes', 'Peak Python memory allocated during the request.', MEMORY_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: {} for name, _, _ in self.HISTOGRAMS}
+            self._requests = Counter()
+            self._n_plus_one = Counter()
+            self.n_plus_one_reports = deque(maxlen=N_PLUS_ONE_HISTORY)
+
+    def observe(self, name, view, value):
+        buckets = next(b for n, _, b in self.HISTOGRAMS if n == name)
+        with self._lock:
+            histogram = self._histograms[name].get(view)
+            if histogram is None:
+                histogram = self._histograms[name][view] = Histogram(buckets)
+            histogram.observe(value)
+
+    def count_request(self, view, method, status):
+        with self._lock:
+            self._requests[(view, method, status)] += 1
+
+    def report_n_plus_one(self, view, path, repeated):
+        with self._lock:
+            self._n_plus_one[view] += 1
+            self.n_plus_one_reports.append((view, path, repeated[:3]))
+        for shape, n in repeated[:3]:
+            logger.warning('Possible N+1 in %s (%s): %d x %s', view, path, n, shape)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP http_requests_total Requests handled, by view, method and status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (view, method, status), n in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{{view="{_escape(view)}",method="{method}",status="{status}"}} {n}')
+
+            for name, help_text, buckets in self.HISTOGRAMS:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for view, histogram in sorted(self._histograms[name].items()):
+                    label = f'view="{_escape(view)}"'
+                    cumulative = 0
+                    for bound, n in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += n
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label}}} {histogram.total:.6f}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.count}')
+
+            lines += [
+                '# HELP http_request_n_plus_one_total Requests that repeated one SQL shape many times.',
+                '# TYPE http_request_n_plus_one_total counter',
+            ]
+            for view, n in sorted(self._n_plus_one.items()):
+                lines.append(f'http_request_n_plus_one_total{{view="{_escape(view)}"}} {n}')
+            for view, path, repeated in self.n_plus_one_reports:
+                for shape, n in repeated:
+                    lines.append(f'# n+1 {view} {path}: {n} x {" ".join(shape.split())[:300]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
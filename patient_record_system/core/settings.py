@@ -42,14 +42,19 @@ INSTALLED_APPS = [
     'patients',
     'accounts',
     'hospitals',
+    'jobs',
+    'api',
 ]
 
 MIDDLEWARE = [
+    # Outermost so its timings cover the whole stack; inactive unless REQUEST_PROFILING
+    'core.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.AutoLoginMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -124,11 +129,82 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Where patient files are stored (see patients/storage.py). For example:
+#   S3 / MinIO:   {'BACKEND': 'patients.storage.ObjectStorage',
+#                  'OPTIONS': {'bucket': 'patient-records', 'endpoint_url': 'http://localhost:9000'}}
+#   Local S3 stand-in: {'BACKEND': 'patients.storage.ObjectStorage', 'OPTIONS': {'client': 'local'}}
+#   Hot disk + compressed cold tier: {'BACKEND': 'patients.storage.TieredStorage'}
+#   Encrypted at rest (wraps any of these): {'BACKEND': 'patients.storage.EncryptedStorage',
+#                  'OPTIONS': {'inner': {'BACKEND': 'patients.storage.TieredStorage'}}}
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# TieredStorage: cold copies (gzip) and after how many days without access
+# `manage.py tier_storage` moves an upload there
+COLD_STORAGE_ROOT = os.path.join(BASE_DIR, 'cold_storage')
+COLD_STORAGE_AFTER_DAYS = 180
+# EncryptedStorage master keys (base64, 32 bytes), newest first; older keys
+# only decrypt. Keep them out of the repository.
+FILE_ENCRYPTION_KEYS = [key for key in os.environ.get('FILE_ENCRYPTION_KEYS', '').split(',') if key]
+
+
+# Hand file transfers to the front-end server after the access check:
+# None (Django streams the file), 'x-sendfile' or 'x-accel-redirect'.
+# For nginx, PATIENT_FILE_ACCEL_PREFIX is an `internal` location aliased to MEDIA_ROOT.
+# Both need unencrypted files on local disk; other storages are streamed.
+PATIENT_FILE_SENDFILE = None
+PATIENT_FILE_ACCEL_PREFIX = '/protected-media/'
+
+# Background jobs (`manage.py run_jobs`). JOBS_EAGER runs them in the web
+# process instead, after the request's transaction commits (development only).
+JOBS_EAGER = False
+JOBS_WORKER_PROCESSES = 1
+JOBS_WORKER_THREADS = 2
+# Seconds without a lock refresh (running jobs refresh theirs every quarter of
+# this) before a job is considered abandoned by its worker and queued again
+JOBS_LOCK_TIMEOUT = 3600
+
+# Per-view request metrics served at /metrics/ (Prometheus text format).
+# REQUEST_PROFILING_MEMORY also traces peak memory, which slows requests down.
+REQUEST_PROFILING = False
+REQUEST_PROFILING_MEMORY = False
+# Log an N+1 suspect when one request runs the same SQL shape this often
+REQUEST_PROFILING_N_PLUS_ONE = 10
+
+# Shared by every worker process on this host, so remember-token revocations
+# reach them all. Use Redis or Memcached when web workers run on several hosts:
+#   {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    },
+}
 
 # Maximum size (in bytes) for request data (files)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10 MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760
 
+# Hash uploads as they stream in so the blob store can deduplicate them
+FILE_UPLOAD_HANDLERS = [
+    'patients.uploadhandlers.HashingMemoryFileUploadHandler',
+    'patients.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
+# Resumable (chunked) uploads are assembled here, outside MEDIA_ROOT
+RESUMABLE_UPLOAD_ROOT = os.path.join(BASE_DIR, 'upload_parts')
+RESUMABLE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024 * 1024  # 10 GB
+
+# Aadhaar demo directory: JSON source and the compiled index built from it
+# by `manage.py build_aadhaar_directory`
+AADHAAR_DIRECTORY_SOURCE = os.path.join(BASE_DIR, 'accounts', 'aadhaar_data.json')
+AADHAAR_DIRECTORY_INDEX = os.path.join(BASE_DIR, 'accounts', 'aadhaar_directory.sqlite3')
+
+# Full-text search backend: 'sqlite_fts', 'postgres' or 'like'.
+# Left unset, it follows the database engine.
+RECORD_SEARCH_BACKEND = None
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,17 +1,17 @@
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
 
 from . import views  # import your local core/views.py
 
 urlpatterns = [
     path('', views.home, name='home'),             # Homepage
     path('admin/', admin.site.urls),               # Django admin
+    path('metrics/', views.metrics, name='metrics'),  # Request profiling (staff only)
     path('patients/', include('patients.urls')),   # Patients app
     path('accounts/', include('accounts.urls')),   # Aadhaar & login system
+    path('hospitals/', include('hospitals.urls')), # Clinician access under consent
+    path('jobs/', include('jobs.urls')),           # Background job status
+    path('api/v1/', include('api.urls')),          # JSON API for mobile clients
 ]
 
-# Serve media files during development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Patient files are not served from MEDIA_URL; patients:serve_file checks access first.
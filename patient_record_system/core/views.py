@@ -1,32 +1,49 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
 from django.shortcuts import render
-from patients.models import Patient, RecordGroup, PatientFile
+from patients.models import Patient
+from patients.pagination import keyset_page
+from patients.search import search_page
+from patients.services import record_listing
+
+from .profiling import registry
 
 def home(request):
     patient = None
     groups = []
     records = []
-    query = request.GET.get("q")
-    group_filter = request.GET.get("group")
+    next_cursor = None
+    query = request.GET.get("q", "").strip()
+    group_filter = request.GET.get("group", "")
 
     if request.user.is_authenticated:
         patient = Patient.objects.filter(user=request.user).first()
         if patient:
-            groups = patient.groups.all()
-            # ✅ FIX: use patient.files instead of patient.records
-            records = patient.files.select_related("group").order_by("-uploaded_at")
-
-            # Optional search and filter
+            groups = patient.groups.order_by("name")
             if query:
-                records = records.filter(title__icontains=query)
-            if group_filter:
-                records = records.filter(group__id=group_filter)
+                # Ranked full-text search over titles, descriptions, groups and contents
+                records, next_cursor = search_page(patient, query, group=group_filter, cursor=request.GET.get("cursor"))
+            elif group_filter:
+                # One group ('none' for ungrouped files); further pages come from patients:records_page
+                records, next_cursor = keyset_page(
+                    record_listing(patient, group=group_filter),
+                    request.GET.get("cursor"),
+                )
 
     context = {
         "patient": patient,
         "groups": groups,
         "records": records,
-        "query": query or "",
-        "group_filter": int(group_filter) if group_filter else None,
+        "next_cursor": next_cursor,
+        "query": query,
+        "group_filter": group_filter,
+        "searched": bool(query or group_filter),
     }
 
     return render(request, "core/home.html", context)
+
+
+@staff_member_required
+def metrics(request):
+    """Request metrics from ``ProfilingMiddleware`` in the Prometheus text format (staff only)."""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,182 @@
+"""
+Consent checks for clinicians.
+
+A clinician's active grants are loaded with one indexed query and kept in
+a process-local LRU cache together with ``Clinician.grant_version``. Every
+grant, approval or revocation bumps that version in the database, so a
+cached entry is reused only while the version on the clinician row (which
+the request loads anyway) still matches; other processes notice the change
+on their next lookup. Entries also lapse when the earliest grant expires.
+Checking a whole listing of files is then done in memory.
+"""
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AccessRequest, Clinician, ConsentGrant
+
+GRANT_CACHE_SIZE = 5000
+MAX_GRANT_DAYS = 365
+
+
+class GrantSet:
+    """The patients and groups one clinician may currently read."""
+
+    def __init__(self, rows=()):
+        self.patients = set()
+        self.groups = {}
+        self.valid_until = None
+        for patient_id, group_id, expires_at in rows:
+            if group_id is None:
+                self.patients.add(patient_id)
+            else:
+                self.groups.setdefault(patient_id, set()).add(group_id)
+            if self.valid_until is None or expires_at < self.valid_until:
+                self.valid_until = expires_at
+
+    def allows_patient(self, patient_id):
+        """True if any of the patient's records are visible."""
+        return patient_id in self.patients or patient_id in self.groups
+
+    def allows(self, patient_id, group_id=None):
+        """True if a record of ``patient_id`` in ``group_id`` (None = ungrouped) is visible."""
+        if patient_id in self.patients:
+            return True
+        return group_id is not None and group_id in self.groups.get(patient_id, ())
+
+    def filter_files(self, files, patient_id):
+        """Restrict a PatientFile queryset of one patient to what the grants cover."""
+        if patient_id in self.patients:
+            return files
+        return files.filter(group_id__in=self.groups.get(patient_id, ()))
+
+    @property
+    def patient_ids(self):
+        return self.patients | set(self.groups)
+
+
+class GrantCache:
+    """Thread-safe LRU of ``clinician_id -> (grant_version, GrantSet)``."""
+
+    def __init__(self, max_size=GRANT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clinician_id, version):
+        with self._lock:
+            entry = self._entries.get(clinician_id)
+            if entry is None:
+                return None
+            cached_version, grants = entry
+            if cached_version != version or (grants.valid_until and grants.valid_until <= timezone.now()):
+                del self._entries[clinician_id]
+                return None
+            self._entries.move_to_end(clinician_id)
+            return grants
+
+    def set(self, clinician_id, version, grants):
+        with self._lock:
+            self._entries[clinician_id] = (version, grants)
+            self._entries.move_to_end(clinician_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, clinician_id):
+        with self._lock:
+            self._entries.pop(clinician_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+grant_cache = GrantCache()
+
+
+def clinician_for(user):
+    """
+    The Clinician profile of ``user`` or None. Always read fresh (one
+    indexed lookup) because its ``grant_version`` decides cache validity.
+    """
+    if not user.is_authenticated:
+        return None
+    return Clinician.objects.select_related('hospital').filter(user_id=user.id).first()
+
+
+def grants_for(clinician):
+    """Active grants of ``clinician``; served from ``grant_cache`` while its version is current."""
+    grants = grant_cache.get(clinician.id, clinician.grant_version)
+    if grants is None:
+        grants = GrantSet(
+            ConsentGrant.objects.active().filter(clinician=clinician)
+            .values_list('patient_id', 'group_id', 'expires_at')
+        )
+        grant_cache.set(clinician.id, clinician.grant_version, grants)
+    return grants
+
+
+def _bump_version(clinician_id):
+    Clinician.objects.filter(id=clinician_id).update(grant_version=F('grant_version') + 1)
+    grant_cache.invalidate(clinician_id)
+
+
+# -----------------------------------------
+# Granting and revoking
+# -----------------------------------------
+def request_access(clinician, patient, group=None, reason='', duration_days=7):
+    """Open (or return the already pending) request for the same scope."""
+    access_request, _ = AccessRequest.objects.get_or_create(
+        clinician=clinician, patient=patient, group=group, status=AccessRequest.PENDING,
+        defaults={'reason': reason, 'duration_days': min(duration_days, MAX_GRANT_DAYS)},
+    )
+    return access_request
+
+
+@transaction.atomic
+def grant_access(patient, clinician, group=None, days=7, access_request=None):
+    grant = ConsentGrant.objects.create(
+        patient=patient,
+        clinician=clinician,
+        group=group,
+        access_request=access_request,
+        expires_at=timezone.now() + timedelta(days=min(days, MAX_GRANT_DAYS)),
+    )
+    _bump_version(clinician.id)
+    return grant
+
+
+@transaction.atomic
+def respond_to_request(access_request, approve, days=None, group=None):
+    """
+    Approve (creating the grant) or deny a pending request; returns the grant or None.
+    An approval may narrow the request to ``group``. A request that was already
+    answered is left as it is, and ``access_request.status`` stays ``PENDING``.
+    """
+    changes = {
+        'status': AccessRequest.APPROVED if approve else AccessRequest.DENIED,
+        'responded_at': timezone.now(),
+    }
+    if approve and group is not None:
+        changes['group'] = group
+    updated = AccessRequest.objects.filter(id=access_request.id, status=AccessRequest.PENDING).update(**changes)
+    if not updated:
+        return None
+    for field, value in changes.items():
+        setattr(access_request, field, value)
+    if not approve:
+        return None
+    return grant_access(
+        access_request.patient, access_request.clinician, access_request.group,
+        days or access_request.duration_days, access_request,
+    )
+
+
+@transaction.atomic
+def revoke_grant(grant):
+    if ConsentGrant.objects.filter(id=grant.id, revoked_at__isnull=True).update(revoked_at=timezone.now()):
+        _bump_version(grant.clinician_id)
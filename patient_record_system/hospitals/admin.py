@@ -1,3 +1,7 @@
 from django.contrib import admin
+from .models import AccessRequest, Clinician, ConsentGrant, Hospital
 
-# Register your models here.
+admin.site.register(Hospital)
+admin.site.register(Clinician)
+admin.site.register(AccessRequest)
+admin.site.register(ConsentGrant)
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('patients', '0014_grouparchive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hospital',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('registration_number', models.CharField(max_length=50, unique=True)),
+                ('address', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Clinician',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('specialty', models.CharField(blank=True, max_length=100)),
+                ('grant_version', models.PositiveIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='clinician', to=settings.AUTH_USER_MODEL)),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clinicians', to='hospitals.hospital')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AccessRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.TextField(blank=True)),
+                ('duration_days', models.PositiveIntegerField(default=7)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('denied', 'Denied'), ('withdrawn', 'Withdrawn')], default='pending', max_length=20)),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('responded_at', models.DateTimeField(blank=True, null=True)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='patients.recordgroup')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_requests', to='patients.patient')),
+                ('clinician', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_requests', to='hospitals.clinician')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ConsentGrant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granted_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+                ('access_request', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='grant', to='hospitals.accessrequest')),
+                ('clinician', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grants', to='hospitals.clinician')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='patients.recordgroup')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consent_grants', to='patients.patient')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='accessrequest',
+            index=models.Index(fields=['patient', 'status'], name='accessrequest_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consentgrant',
+            index=models.Index(fields=['clinician', 'revoked_at', 'expires_at'], name='consentgrant_clinician_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consentgrant',
+            index=models.Index(fields=['patient', 'revoked_at'], name='consentgrant_patient_idx'),
+        ),
+    ]
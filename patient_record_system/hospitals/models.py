@@ -1,3 +1,91 @@
+from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+from patients.models import Patient, RecordGroup
+
+
+class Hospital(models.Model):
+    name = models.CharField(max_length=255)
+    registration_number = models.CharField(max_length=50, unique=True)
+    address = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Clinician(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='clinician')
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, related_name='clinicians')
+    name = models.CharField(max_length=200)
+    specialty = models.CharField(max_length=100, blank=True)
+    # Bumped on every grant/revoke so cached permissions in any process go stale.
+    grant_version = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name} ({self.hospital})'
+
+
+class AccessRequest(models.Model):
+    """A clinician asking a patient for access to their records (or one group)."""
+    PENDING = 'pending'
+    APPROVED = 'approved'
+    DENIED = 'denied'
+    WITHDRAWN = 'withdrawn'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (APPROVED, 'Approved'),
+        (DENIED, 'Denied'),
+        (WITHDRAWN, 'Withdrawn'),
+    ]
+
+    clinician = models.ForeignKey(Clinician, on_delete=models.CASCADE, related_name='access_requests')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='access_requests')
+    group = models.ForeignKey(RecordGroup, on_delete=models.CASCADE, null=True, blank=True)
+    reason = models.TextField(blank=True)
+    duration_days = models.PositiveIntegerField(default=7)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    responded_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'status'], name='accessrequest_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.clinician} -> {self.patient} ({self.status})'
+
+
+class ConsentGrantQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(revoked_at__isnull=True, expires_at__gt=timezone.now())
+
+
+class ConsentGrant(models.Model):
+    """
+    Permission for a clinician to read a patient's records until
+    ``expires_at``; limited to one RecordGroup when ``group`` is set.
+    """
+    clinician = models.ForeignKey(Clinician, on_delete=models.CASCADE, related_name='grants')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='consent_grants')
+    group = models.ForeignKey(RecordGroup, on_delete=models.CASCADE, null=True, blank=True)
+    access_request = models.OneToOneField(
+        AccessRequest, on_delete=models.SET_NULL, null=True, blank=True, related_name='grant'
+    )
+    granted_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ConsentGrantQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['clinician', 'revoked_at', 'expires_at'], name='consentgrant_clinician_idx'),
+            models.Index(fields=['patient', 'revoked_at'], name='consentgrant_patient_idx'),
+        ]
+
+    def __str__(self):
+        scope = self.group or 'all records'
+        return f'{self.clinician} may read {self.patient} ({scope}) until {self.expires_at:%Y-%m-%d}'
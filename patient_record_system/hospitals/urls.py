@@ -0,0 +1,18 @@
+from django.urls import path
+from . import views
+
+app_name = 'hospitals'
+
+urlpatterns = [
+    # Clinicians
+    path('', views.dashboard, name='dashboard'),
+    path('request/', views.request_access, name='request_access'),
+    path('patients/<int:patient_id>/', views.patient_records, name='patient_records'),
+    path('file/<int:file_id>/', views.clinician_file, name='clinician_file'),
+    path('records/bulk/', views.bulk_records, name='bulk_records'),
+
+    # Patients
+    path('consents/', views.consents, name='consents'),
+    path('consents/requests/<int:request_id>/', views.respond_to_request, name='respond_to_request'),
+    path('consents/grants/<int:grant_id>/revoke/', views.revoke_grant, name='revoke_grant'),
+]
@@ -1,3 +1,213 @@
-from django.shortcuts import render
+import hashlib
+import json
 
-# Create your views here.
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import require_http_methods, require_POST
+
+from patients import blobstore
+from patients.fileserve import patient_file_validators, serve_field_file
+from patients.models import Patient, PatientFile, RecordGroup
+from patients.pagination import keyset_page
+
+from . import access, bulk
+from .models import AccessRequest, ConsentGrant
+
+
+def _clinician_or_404(request):
+    clinician = access.clinician_for(request.user)
+    if clinician is None:
+        raise Http404("No clinician profile for this account.")
+    return clinician
+
+
+# -----------------------------------------
+# Clinician Dashboard
+# -----------------------------------------
+@login_required
+def dashboard(request):
+    clinician = _clinician_or_404(request)
+    grants = access.grants_for(clinician)
+    patients = Patient.objects.in_bulk(grants.patient_ids)
+    requests = (
+        AccessRequest.objects.filter(clinician=clinician)
+        .select_related('patient', 'group').order_by('-requested_at')[:50]
+    )
+    return render(request, 'hospitals/dashboard.html', {
+        'clinician': clinician,
+        'patients': sorted(patients.values(), key=lambda p: p.name),
+        'access_requests': requests,
+    })
+
+
+@login_required
+@require_POST
+def request_access(request):
+    """Ask a patient (found by Aadhaar number) for access to their records."""
+    clinician = _clinician_or_404(request)
+    aadhaar_number = request.POST.get('aadhaar_number', '').strip()
+    aadhaar_hash = hashlib.sha256(aadhaar_number.encode()).hexdigest()
+    patient = Patient.objects.filter(aadhaar_hash=aadhaar_hash).first() if aadhaar_number else None
+    if patient is None:
+        messages.error(request, "No patient found for that Aadhaar number.")
+        return redirect('hospitals:dashboard')
+
+    try:
+        days = int(request.POST.get('duration_days') or 7)
+    except ValueError:
+        days = 7
+    access.request_access(clinician, patient, reason=request.POST.get('reason', ''), duration_days=max(days, 1))
+    messages.success(request, f"Access request sent to {patient.masked_aadhaar or patient.name}.")
+    return redirect('hospitals:dashboard')
+
+
+# -----------------------------------------
+# Patient Records (clinician view)
+# -----------------------------------------
+@login_required
+def patient_records(request, patient_id):
+    clinician = _clinician_or_404(request)
+    grants = access.grants_for(clinician)
+    if not grants.allows_patient(patient_id):
+        raise Http404("No active consent for this patient.")
+
+    patient = get_object_or_404(Patient, id=patient_id)
+    files = grants.filter_files(
+        PatientFile.objects.filter(patient_id=patient_id).select_related('group').with_previews(), patient_id
+    )
+    files, next_cursor = keyset_page(files, request.GET.get('cursor'))
+    return render(request, 'hospitals/patient_records.html', {
+        'patient': patient,
+        'files': files,
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def clinician_file(request, file_id):
+    """Send a patient file after checking the clinician's consent."""
+    clinician = _clinician_or_404(request)
+    file_obj = get_object_or_404(PatientFile.objects.select_related('blob'), id=file_id)
+    if not file_obj.file or not access.grants_for(clinician).allows(file_obj.patient_id, file_obj.group_id):
+        raise Http404("No active consent for this file.")
+
+    etag, last_modified = patient_file_validators(file_obj)
+    blobstore.touch([file_obj.blob])
+    return serve_field_file(
+        request, file_obj.file, file_obj.filename, etag, last_modified,
+        as_attachment=request.GET.get('download') == '1',
+    )
+
+
+def _id_list(values):
+    ids = []
+    for value in values:
+        for part in str(value).split(','):
+            part = part.strip()
+            if part.isdigit():
+                ids.append(int(part))
+    return ids
+
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def bulk_records(request):
+    """
+    Metadata of many patients' records in one NDJSON response.
+
+    Patients are selected with ``patient`` and/or ``grant`` ids, given as
+    repeated or comma-separated query parameters, or as
+    ``{"patients": [...], "grants": [...]}`` in a POST body.
+    """
+    clinician = _clinician_or_404(request)
+    if request.method == 'POST' and request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+        patient_ids = _id_list(payload.get('patients') or [])
+        grant_ids = _id_list(payload.get('grants') or [])
+    else:
+        params = request.POST if request.method == 'POST' else request.GET
+        patient_ids = _id_list(params.getlist('patient'))
+        grant_ids = _id_list(params.getlist('grant'))
+
+    if grant_ids:
+        patient_ids += bulk.patients_for_grants(clinician, grant_ids)
+    if not patient_ids:
+        return JsonResponse({'error': 'Give at least one patient or grant id.'}, status=400)
+    if len(set(patient_ids)) > bulk.MAX_BULK_PATIENTS:
+        return JsonResponse({'error': f'At most {bulk.MAX_BULK_PATIENTS} patients per request.'}, status=400)
+
+    grants = access.grants_for(clinician)
+    response = StreamingHttpResponse(bulk.stream_records(grants, patient_ids), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+# -----------------------------------------
+# Consents (patient view)
+# -----------------------------------------
+@login_required
+def consents(request):
+    patient = get_object_or_404(Patient, user=request.user)
+    pending = (
+        patient.access_requests.filter(status=AccessRequest.PENDING)
+        .select_related('clinician__hospital', 'group').order_by('-requested_at')
+    )
+    grants = (
+        patient.consent_grants.active()
+        .select_related('clinician__hospital', 'group').order_by('expires_at')
+    )
+    return render(request, 'hospitals/consents.html', {
+        'pending': pending,
+        'grants': grants,
+        'groups': patient.groups.order_by('name'),
+    })
+
+
+@login_required
+@require_POST
+def respond_to_request(request, request_id):
+    access_request = get_object_or_404(
+        AccessRequest.objects.select_related('patient', 'clinician'), id=request_id, patient__user=request.user
+    )
+    if access_request.status != AccessRequest.PENDING:
+        messages.warning(request, "This request has already been answered.")
+        return redirect('hospitals:consents')
+
+    approve = request.POST.get('action') == 'approve'
+    group = None
+    if approve:
+        # The patient may narrow the request to one group.
+        group_id = request.POST.get('group')
+        if group_id:
+            group = get_object_or_404(RecordGroup, id=group_id, patient=access_request.patient)
+    try:
+        days = int(request.POST.get('days') or access_request.duration_days)
+    except ValueError:
+        days = access_request.duration_days
+
+    access.respond_to_request(access_request, approve, max(days, 1), group=group)
+    if access_request.status == AccessRequest.PENDING:
+        # Answered concurrently (another tab or a replayed form).
+        messages.warning(request, "This request has already been answered.")
+    elif approve:
+        messages.success(request, f"✅ Access granted to {access_request.clinician.name}.")
+    else:
+        messages.info(request, f"Request from {access_request.clinician.name} denied.")
+    return redirect('hospitals:consents')
+
+
+@login_required
+@require_POST
+def revoke_grant(request, grant_id):
+    grant = get_object_or_404(ConsentGrant.objects.select_related('clinician'), id=grant_id, patient__user=request.user)
+    access.revoke_grant(grant)
+    messages.success(request, f"🔒 Access for {grant.clinician.name} revoked.")
+    return redirect('hospitals:consents')
@@ -0,0 +1,56 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.worker import run_worker
+
+
+def _serve(threads, poll_interval, once):
+    """Entry point of a worker process."""
+    import django
+    django.setup()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    run_worker(threads, poll_interval, once, stop)
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=getattr(settings, 'JOBS_WORKER_PROCESSES', 1),
+                            help="Worker processes to start (use the machine's spare cores).")
+        parser.add_argument('--threads', type=int, default=getattr(settings, 'JOBS_WORKER_THREADS', 2),
+                            help="Job threads per process.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit when no runnable jobs are left.")
+
+    def handle(self, *args, **options):
+        processes = max(options['processes'], 1)
+        worker_args = (max(options['threads'], 1), options['poll_interval'], options['once'])
+        self.stdout.write(f"Starting {processes} worker process(es) with {worker_args[0]} thread(s) each.")
+
+        if processes == 1:
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *args: stop.set())
+            run_worker(*worker_args, stop=stop)
+            return
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        workers = [multiprocessing.Process(target=_serve, args=worker_args) for _ in range(processes)]
+        for process in workers:
+            process.start()
+        try:
+            for process in workers:
+                process.join()
+        except KeyboardInterrupt:
+            for process in workers:
+                process.terminate()
+            for process in workers:
+                process.join()
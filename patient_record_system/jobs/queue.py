@@ -0,0 +1,65 @@
+"""
+Database-backed background jobs.
+
+Task functions live in an app's ``tasks.py`` and are registered with
+``@task``; views queue them with ``func.enqueue(**kwargs)`` and return at
+once. ``manage.py run_jobs`` runs the queue in separate worker processes,
+so web workers stay free for interactive requests. A task is called as
+``func(job, **kwargs)``, may report progress with ``job.set_progress()``
+and returns a JSON-serialisable result. Failed tasks are retried with
+exponential backoff up to ``max_attempts``.
+
+With ``settings.JOBS_EAGER`` enabled jobs run in-process right after the
+surrounding transaction commits, which is handy in development when no
+worker is running.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Job
+
+Task = namedtuple('Task', 'name func max_attempts retry_delay')
+
+_registry = {}
+
+
+def task(name, max_attempts=3, retry_delay=30):
+    """Register ``func`` under ``name``; ``retry_delay`` (seconds) doubles after each failure."""
+    def decorator(func):
+        if name in _registry and _registry[name].func is not func:
+            raise ValueError(f'Task {name!r} is already registered.')
+        _registry[name] = Task(name, func, max_attempts, retry_delay)
+        func.task_name = name
+        func.enqueue = partial(enqueue, name)
+        return func
+    return decorator
+
+
+def get_task(name):
+    return _registry.get(name)
+
+
+def enqueue(name, user=None, delay=0, **kwargs):
+    """
+    Queue task ``name`` with ``kwargs`` and return the Job. Inside a
+    transaction the job only becomes visible to workers on commit.
+    """
+    registered = get_task(name)
+    if registered is None:
+        raise KeyError(f'Unknown task {name!r}.')
+    job = Job.objects.create(
+        name=name,
+        kwargs=kwargs,
+        user=user,
+        max_attempts=registered.max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    if getattr(settings, 'JOBS_EAGER', False):
+        from .worker import run_now
+        transaction.on_commit(partial(run_now, job.id))
+    return job
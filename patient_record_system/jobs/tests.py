@@ -0,0 +1,130 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import worker
+from .models import Job
+from .queue import enqueue, task
+
+
+@task('jobs.tests.count', max_attempts=2, retry_delay=10)
+def count_task(job, total):
+    for done in range(1, total + 1):
+        job.set_progress(done, total)
+    return {'counted': total}
+
+
+@task('jobs.tests.fail', max_attempts=2, retry_delay=10)
+def fail_task(job):
+    raise RuntimeError('broken')
+
+
+@task('jobs.tests.check_stale')
+def check_stale_task(job, seconds):
+    # Runs past the lock timeout; the heartbeat must keep the job from looking abandoned.
+    time.sleep(seconds)
+    return {'requeued': worker.requeue_stale()}
+
+
+def run_claimed(job_id):
+    job = worker.claim('test-worker')
+    assert job is not None and job.id == job_id
+    worker.execute(job)
+    return Job.objects.get(id=job_id)
+
+
+class ExecuteTests(TestCase):
+    def test_success_records_result_and_progress(self):
+        job = run_claimed(enqueue('jobs.tests.count', total=3).id)
+
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, {'counted': 3})
+        self.assertEqual((job.progress, job.progress_total), (3, 3))
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.locked_by, '')
+
+    def test_failures_are_retried_with_backoff_then_failed(self):
+        job_id = enqueue('jobs.tests.fail').id
+        with self.assertLogs('jobs.worker', 'ERROR'):
+            job = run_claimed(job_id)
+
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=5))
+        self.assertIsNone(worker.claim('test-worker'))
+
+        Job.objects.filter(id=job_id).update(run_after=timezone.now())
+        with self.assertLogs('jobs.worker', 'ERROR'):
+            job = run_claimed(job_id)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('RuntimeError', job.error)
+
+    def test_unknown_task_fails(self):
+        job = Job.objects.create(name='jobs.tests.missing')
+
+        job = run_claimed(job.id)
+
+        self.assertEqual(job.status, Job.FAILED)
+
+    def test_job_is_claimed_once(self):
+        job_id = enqueue('jobs.tests.count', total=1).id
+
+        self.assertEqual(worker.claim('first').id, job_id)
+        self.assertIsNone(worker.claim('second'))
+
+
+@override_settings(JOBS_LOCK_TIMEOUT=60)
+class RequeueStaleTests(TestCase):
+    def abandoned(self, age, attempts=1):
+        job = enqueue('jobs.tests.count', total=1)
+        Job.objects.filter(id=job.id).update(
+            status=Job.RUNNING, locked_by='gone', attempts=attempts,
+            locked_at=timezone.now() - timedelta(seconds=age),
+        )
+        return job
+
+    def test_only_jobs_with_old_locks_are_requeued(self):
+        stale = self.abandoned(age=120)
+        live = self.abandoned(age=10)
+        exhausted = self.abandoned(age=120, attempts=2)
+
+        self.assertEqual(worker.requeue_stale(), 2)
+
+        self.assertEqual(Job.objects.get(id=stale.id).status, Job.QUEUED)
+        self.assertEqual(Job.objects.get(id=live.id).status, Job.RUNNING)
+        self.assertEqual(Job.objects.get(id=exhausted.id).status, Job.FAILED)
+
+    def test_work_loop_picks_up_abandoned_jobs(self):
+        stale = self.abandoned(age=120)
+
+        worker.work_loop('test-worker', threading.Event(), poll_interval=0, once=True)
+
+        self.assertEqual(Job.objects.get(id=stale.id).status, Job.SUCCEEDED)
+
+
+class HeartbeatTests(TransactionTestCase):
+    @override_settings(JOBS_LOCK_TIMEOUT=0.4)
+    def test_running_job_keeps_its_lock(self):
+        job = run_claimed(enqueue('jobs.tests.check_stale', seconds=1).id)
+
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, {'requeued': 0})
+        self.assertEqual(job.attempts, 1)
+
+
+class JobStatusTests(TestCase):
+    def test_only_the_owner_can_poll(self):
+        owner = User.objects.create_user('owner')
+        job = enqueue('jobs.tests.count', user=owner, total=1)
+        url = reverse('jobs:job_status', args=[job.id])
+
+        self.client.force_login(User.objects.create_user('someone'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.force_login(owner)
+        data = self.client.get(url).json()
+        self.assertEqual((data['status'], data['finished']), (Job.QUEUED, False))
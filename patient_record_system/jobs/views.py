@@ -0,0 +1,25 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+
+from .models import Job
+
+
+# -----------------------------------------
+# Job Status (polled by the browser)
+# -----------------------------------------
+@login_required
+def job_status(request, job_id):
+    job = get_object_or_404(Job, id=job_id, user=request.user)
+    return JsonResponse({
+        'id': str(job.id),
+        'name': job.name,
+        'status': job.status,
+        'finished': job.is_finished,
+        'progress': job.progress,
+        'total': job.progress_total,
+        'attempts': job.attempts,
+        'result': job.result,
+        # Tracebacks stay in the admin; the client only learns that it failed.
+        'error': 'The job failed.' if job.status == Job.FAILED else None,
+    })
@@ -0,0 +1,178 @@
+"""
+Job execution for ``manage.py run_jobs``.
+
+Each worker thread claims one queued job at a time with a conditional
+UPDATE (``status='queued'`` -> ``'running'``), so any number of threads
+and processes can share the table without double-running a job. While a
+job runs its ``locked_at`` is refreshed regularly, so a job whose lock is
+older than ``settings.JOBS_LOCK_TIMEOUT`` seconds has lost its worker; the
+work loops look for such jobs every minute and put them back on the queue.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .queue import get_task
+
+logger = logging.getLogger(__name__)
+
+# How many candidates a thread looks at per claim attempt.
+CLAIM_BATCH = 10
+# Seconds between checks for jobs whose worker died.
+STALE_CHECK_INTERVAL = 60
+
+
+def lock_timeout():
+    return getattr(settings, 'JOBS_LOCK_TIMEOUT', 3600)
+
+
+def worker_name(suffix=''):
+    return f'{socket.gethostname()}:{os.getpid()}{suffix}'
+
+
+def claim(worker_id):
+    """Atomically take the next runnable job, or return None."""
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+        .order_by('run_after').values_list('id', flat=True)[:CLAIM_BATCH]
+    )
+    for job_id in candidates:
+        claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def execute(job):
+    """Run a claimed job and record success, a retry or the final failure."""
+    registered = get_task(job.name)
+    if registered is None:
+        _finish(job, Job.FAILED, error=f'Unknown task {job.name!r}.')
+        return
+
+    try:
+        with heartbeat(job):
+            result = registered.func(job, **job.kwargs)
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %s', job.id, job.name, job.attempts)
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = registered.retry_delay * 2 ** (job.attempts - 1)
+            Job.objects.filter(id=job.id).update(
+                status=Job.QUEUED, error=error, locked_by='', locked_at=None,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+        else:
+            _finish(job, Job.FAILED, error=error)
+    else:
+        _finish(job, Job.SUCCEEDED, result=result)
+
+
+def _beat(job, stop, interval):
+    while not stop.wait(interval):
+        try:
+            Job.objects.filter(id=job.id, status=Job.RUNNING, locked_by=job.locked_by).update(
+                locked_at=timezone.now(),
+            )
+        except Exception:
+            logger.exception('Could not refresh the lock of job %s', job.id)
+    connection.close()
+
+
+@contextmanager
+def heartbeat(job):
+    """Keep ``job.locked_at`` fresh while the block runs, so only jobs of dead workers look stale."""
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=_beat, args=(job, stop, lock_timeout() / 4), name=f'jobs-heartbeat-{job.id}', daemon=True,
+    )
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _finish(job, status, result=None, error=''):
+    Job.objects.filter(id=job.id).update(
+        status=status, result=result, error=error, locked_by='', locked_at=None, finished_at=timezone.now(),
+    )
+
+
+def run_now(job_id):
+    """Claim and run one specific job in this process (``JOBS_EAGER``)."""
+    claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+        status=Job.RUNNING, locked_by=worker_name(), locked_at=timezone.now(), attempts=F('attempts') + 1,
+    )
+    if claimed:
+        execute(Job.objects.get(id=job_id))
+
+
+def requeue_stale():
+    """Return jobs stuck in 'running' past the lock timeout to the queue; returns the count."""
+    cutoff = timezone.now() - timedelta(seconds=lock_timeout())
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, error='Worker stopped responding.', locked_by='', locked_at=None,
+        finished_at=timezone.now(),
+    )
+    return failed + stale.update(status=Job.QUEUED, locked_by='', locked_at=None)
+
+
+def work_loop(worker_id, stop, poll_interval=1.0, once=False):
+    """Claim and run jobs until ``stop`` is set (or the queue is empty with ``once``)."""
+    next_stale_check = 0
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            if time.monotonic() >= next_stale_check:
+                requeue_stale()
+                next_stale_check = time.monotonic() + STALE_CHECK_INTERVAL
+            job = claim(worker_id)
+            if job is not None:
+                execute(job)
+                continue
+        except Exception:
+            logger.exception('Worker %s could not process the queue', worker_id)
+        finally:
+            close_old_connections()
+        if once:
+            return
+        stop.wait(poll_interval)
+
+
+def run_worker(threads=1, poll_interval=1.0, once=False, stop=None):
+    """Run ``threads`` work loops in this process and wait for them."""
+    stop = stop or threading.Event()
+    workers = [
+        threading.Thread(
+            target=work_loop, args=(worker_name(f'/{n}'), stop, poll_interval, once),
+            name=f'jobs-{n}', daemon=True,
+        )
+        for n in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    try:
+        for thread in workers:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in workers:
+            thread.join()
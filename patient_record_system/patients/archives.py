@@ -0,0 +1,173 @@
+"""
+Prebuilt ZIP archives of record groups.
+
+Each group has at most one cached archive, identified by a content version
+derived from the group's newest ``uploaded_at`` and the ids and content
+hashes of its files. Downloads compare the stored version with the
+current one (a single query): a match is served from disk through
+``serve_field_file`` (sendfile, ETag, Range), anything else is streamed
+on the fly while a ``patients.build_group_archive`` job refreshes the cache.
+
+Files are added to the end of an archive (listings are ordered by upload
+time), so when the cached archive's entries are a prefix of the group's
+current files the new files are appended to a copy of it rather than
+re-reading and re-compressing everything. Removals trigger a full rebuild.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import enqueue
+
+from .models import GroupArchive, PatientFile, RecordGroup, archive_upload_to
+from .storage import store_file, temp_dir
+from .zipstream import ZIP_CHUNK_SIZE, compress_type_for, unique_arcname
+
+
+def group_files(group):
+    """Live files of ``group`` in archive order."""
+    return (
+        PatientFile.objects.filter(group=group).exclude(file='')
+        .select_related('blob').order_by('uploaded_at', 'id')
+    )
+
+
+def _digest(patient_file):
+    return patient_file.blob.sha256 if patient_file.blob_id else patient_file.file.name
+
+
+def content_version(files):
+    """Version string for a list of files in archive order."""
+    h = hashlib.sha256()
+    if files:
+        h.update(max(f.uploaded_at for f in files).isoformat().encode())
+    for f in files:
+        h.update(f'\n{f.id}:{_digest(f)}'.encode())
+    return h.hexdigest()
+
+
+def current_archive(group, files):
+    """
+    Return ``(archive, version)`` for ``group`` whose files are ``files``;
+    ``archive`` is None unless the cached copy is up to date.
+    """
+    version = content_version(files)
+    archive = GroupArchive.objects.filter(group=group, version=version).exclude(file='').first()
+    if archive is not None and not default_storage.exists(archive.file.name):
+        archive = None
+    return archive, version
+
+
+def _write_entries(zip_file, files, used):
+    for f in files:
+        try:
+            source = f.file.open('rb')
+        except (OSError, ValueError):
+            continue
+        info = zipfile.ZipInfo(unique_arcname(f.filename, used), date_time=f.uploaded_at.timetuple()[:6])
+        info.compress_type = compress_type_for(f.filename)
+        with source, zip_file.open(info, 'w', force_zip64=True) as dest:
+            for chunk in source.chunks(ZIP_CHUNK_SIZE):
+                dest.write(chunk)
+
+
+def build_archive(group):
+    """
+    Bring the cached archive of ``group`` up to date and return it (None for
+    an empty group). Returns ``(archive, mode)`` where mode is ``'fresh'``,
+    ``'appended'``, ``'rebuilt'``, ``'removed'`` or ``'stale'`` (the files
+    changed, or another build finished first, while this one ran; the
+    stored archive is left as it is).
+    """
+    files = list(group_files(group))
+    archive = GroupArchive.objects.filter(group=group).first()
+    if not files:
+        if archive is not None:
+            archive.delete()
+        return None, 'removed'
+
+    version = content_version(files)
+    old_name = archive.file.name if archive is not None and archive.file else ''
+    has_old = bool(old_name) and default_storage.exists(old_name)
+    if archive is not None and archive.version == version and has_old:
+        return archive, 'fresh'
+
+    if archive is None:
+        archive = GroupArchive(group=group)
+    keys = [[f.id, _digest(f)] for f in files]
+    cached = archive.entries if has_old else []
+    append = bool(cached) and keys[:len(cached)] == cached
+
+    archive.version = version
+    name = archive_upload_to(archive, '')
+    # Built on local disk (next to the archives when storage is local), then stored.
+    fd, tmp_path = tempfile.mkstemp(dir=temp_dir(os.path.dirname(name)), suffix='.tmp')
+    os.close(fd)
+
+    # Arcnames are assigned in order, so the prefix keeps the names it had.
+    used = set()
+    for f in files[:len(cached) if append else 0]:
+        unique_arcname(f.filename, used)
+
+    try:
+        if append:
+            try:
+                with default_storage.open(old_name, 'rb') as src, open(tmp_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, ZIP_CHUNK_SIZE)
+            except FileNotFoundError:
+                # A concurrent build replaced the archive; start over from its result.
+                return build_archive(group)
+            with zipfile.ZipFile(tmp_path, 'a', allowZip64=True) as zip_file:
+                _write_entries(zip_file, files[len(cached):], used)
+        else:
+            with zipfile.ZipFile(tmp_path, 'w', allowZip64=True) as zip_file:
+                _write_entries(zip_file, files, used)
+        size = os.path.getsize(tmp_path)
+        name = store_file(name, tmp_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    # Builds of one group may overlap (a new job can start while another runs):
+    # store the result only if it still matches the group's files.
+    with transaction.atomic():
+        RecordGroup.objects.select_for_update().filter(id=group.id).first()
+        current = GroupArchive.objects.filter(group=group).first()
+        if version != content_version(list(group_files(group))) or (
+            current is not None and current.version == version and current.file
+        ):
+            stale = True
+        else:
+            stale = False
+            archive = current or archive
+            old_name = archive.file.name if archive.file else ''
+            archive.version = version
+            archive.file.name = name
+            archive.entries = keys
+            archive.size = size
+            archive.built_at = timezone.now()
+            archive.save()
+    if stale:
+        if current is None or current.file.name != name:
+            default_storage.delete(name)
+        return current, 'stale'
+    if old_name and old_name != name:
+        default_storage.delete(old_name)
+    return archive, 'appended' if append else 'rebuilt'
+
+
+def schedule_archives(group_ids):
+    """Queue a rebuild for each group that does not already have one waiting."""
+    for group_id in set(filter(None, group_ids)):
+        waiting = Job.objects.filter(
+            name='patients.build_group_archive', status=Job.QUEUED, kwargs__group_id=group_id,
+        ).exists()
+        if not waiting:
+            enqueue('patients.build_group_archive', group_id=group_id)
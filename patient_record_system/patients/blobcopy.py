@@ -0,0 +1,41 @@
+"""
+Copy a file while hashing it, in one pass over the data.
+
+Used by ``import_records`` in a multiprocessing pool, so this module only
+imports the standard library: worker processes never touch Django or the
+database.
+"""
+import hashlib
+import os
+import tempfile
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def copy_and_hash(task):
+    """
+    Copy ``source`` to a new temporary file in ``temp_dir``.
+
+    ``task`` is ``(index, source, temp_dir)``; returns
+    ``(index, sha256, size, temp_path, error)``, with ``error`` set (and
+    nothing left behind) when the file could not be read or written.
+    """
+    index, source, temp_dir = task
+    hasher = hashlib.sha256()
+    size = 0
+    buffer = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buffer)
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as dst, open(source, 'rb', buffering=0) as src:
+            while True:
+                n = src.readinto(buffer)
+                if not n:
+                    break
+                hasher.update(view[:n])
+                dst.write(view[:n])
+                size += n
+    except OSError as e:
+        os.unlink(temp_path)
+        return index, None, 0, None, str(e)
+    return index, hasher.hexdigest(), size, temp_path, None
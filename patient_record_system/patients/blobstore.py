@@ -0,0 +1,207 @@
+"""
+Content-addressed storage for patient uploads.
+
+Every upload is keyed by its SHA-256 digest and stored once under
+``blobs/<aa>/<bb>/``. ``FileBlob.ref_count`` tracks how many PatientFile
+rows point at a blob; the physical file is removed when the count drops
+to zero.
+"""
+import hashlib
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import FileBlob
+
+# Downloads update ``last_accessed_at`` at most this often per blob.
+ACCESS_RESOLUTION = timedelta(days=1)
+
+
+def content_digest(upload):
+    """
+    Return ``(sha256, size)`` for an uploaded file.
+
+    Uploads parsed by ``HashingUploadHandler`` already carry their digest;
+    anything else is hashed chunk by chunk.
+    """
+    digest = getattr(upload, 'sha256', None)
+    if digest:
+        return digest, upload.size
+
+    hasher = hashlib.sha256()
+    size = 0
+    for chunk in upload.chunks():
+        hasher.update(chunk)
+        size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def acquire(upload):
+    """
+    Return the blob holding ``upload``'s content, taking one reference to it.
+
+    When the content is already stored only the reference count changes and
+    nothing is written to disk.
+    """
+    digest, size = content_digest(upload)
+
+    if FileBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1):
+        return FileBlob.objects.get(sha256=digest)
+
+    blob = FileBlob(sha256=digest, size=size, ref_count=1)
+    blob.file.save(getattr(upload, 'name', None) or digest, upload, save=False)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # Another request stored the same content first; share its copy.
+        blob.file.delete(save=False)
+        return acquire(upload)
+    blob.is_new = True
+    return blob
+
+
+def acquire_many(uploads):
+    """
+    Batch version of acquire(): return one blob per upload, in order.
+
+    Content not yet in the store is written first; then one lookup, one
+    ``bulk_create`` and one reference-count update per distinct
+    multiplicity run inside a single transaction. Content another upload
+    stored in the meantime is shared, as in acquire(). Blobs created by this
+    call are flagged ``is_new`` so callers can remove their files if a
+    surrounding transaction rolls back.
+    """
+    digests = [content_digest(upload) for upload in uploads]
+    counts = Counter(digest for digest, _ in digests)
+    existing = FileBlob.objects.in_bulk(list(counts), field_name='sha256')
+
+    new_blobs = {}
+    try:
+        for upload, (digest, size) in zip(uploads, digests):
+            if digest in existing or digest in new_blobs:
+                continue
+            blob = FileBlob(sha256=digest, size=size, ref_count=counts[digest])
+            blob.file.save(getattr(upload, 'name', None) or digest, upload, save=False)
+            blob.is_new = True
+            new_blobs[digest] = blob
+
+        with transaction.atomic():
+            create_blobs(new_blobs, existing)
+            by_count = defaultdict(list)
+            for digest, blob in existing.items():
+                by_count[counts[digest]].append(blob.id)
+            for count, ids in by_count.items():
+                FileBlob.objects.filter(id__in=ids).update(ref_count=F('ref_count') + count)
+    except Exception:
+        discard(new_blobs.values())
+        raise
+
+    stored = {**existing, **new_blobs}
+    return [stored[digest] for digest, _ in digests]
+
+
+def create_blobs(new_blobs, existing):
+    """
+    Insert ``new_blobs`` (``{sha256: FileBlob}``). Content a concurrent
+    upload stored after ``existing`` was read is moved over to
+    ``existing`` so its row is shared, as acquire() does.
+    """
+    while new_blobs:
+        try:
+            with transaction.atomic():
+                FileBlob.objects.bulk_create(new_blobs.values())
+            return
+        except IntegrityError:
+            raced = FileBlob.objects.in_bulk(list(new_blobs), field_name='sha256')
+            if not raced:
+                raise
+            for digest, blob in raced.items():
+                copy = new_blobs.pop(digest)
+                if copy.file.name != blob.file.name:
+                    copy.file.delete(save=False)
+                existing[digest] = blob
+
+
+def discard(blobs):
+    """Remove the files of blobs created by acquire() or acquire_many() whose rows were rolled back."""
+    for blob in blobs:
+        if getattr(blob, 'is_new', False):
+            blob.file.delete(save=False)
+
+
+def release(blob_ids):
+    """
+    Drop one reference per entry in ``blob_ids`` and delete blobs nobody uses.
+    """
+    counts = Counter(blob_id for blob_id in blob_ids if blob_id)
+    if not counts:
+        return
+
+    by_count = defaultdict(list)
+    for blob_id, count in counts.items():
+        by_count[count].append(blob_id)
+    for count, ids in by_count.items():
+        FileBlob.objects.filter(id__in=ids).update(ref_count=F('ref_count') - count)
+    purge(counts)
+
+
+def purge(blob_ids):
+    """Delete the blobs among ``blob_ids`` that nobody references any more, with their files."""
+    for blob in FileBlob.objects.filter(id__in=blob_ids, ref_count__lte=0):
+        # Re-check inside the DELETE so a concurrent acquire() keeps the blob alive.
+        derivatives = list(blob.derivatives.exclude(file=''))
+        deleted, _ = FileBlob.objects.filter(id=blob.id, ref_count__lte=0).delete()
+        if deleted:
+            blob.file.delete(save=False)
+            for derivative in derivatives:
+                derivative.file.delete(save=False)
+
+
+# -----------------------------------------
+# Access tracking and cold storage
+# -----------------------------------------
+def touch(blobs):
+    """Record a download of ``blobs``; no query unless one was last marked before today."""
+    now = timezone.now()
+    stale = {
+        blob.id for blob in blobs
+        if blob is not None and (blob.last_accessed_at is None or blob.last_accessed_at < now - ACCESS_RESOLUTION)
+    }
+    if stale:
+        FileBlob.objects.filter(id__in=stale).update(last_accessed_at=now)
+
+
+def touch_files(files):
+    """Record a download of the blobs behind a PatientFile queryset, in one UPDATE."""
+    now = timezone.now()
+    FileBlob.objects.filter(id__in=files.values('blob_id')).filter(
+        Q(last_accessed_at__isnull=True) | Q(last_accessed_at__lt=now - ACCESS_RESOLUTION)
+    ).update(last_accessed_at=now)
+
+
+def idle_blobs(days):
+    """Blobs in use that nobody has downloaded for ``days`` days (or ever, if older than that)."""
+    cutoff = timezone.now() - timedelta(days=days)
+    return (
+        FileBlob.objects.filter(ref_count__gt=0)
+        .annotate(last_used=Coalesce('last_accessed_at', 'created_at'))
+        .filter(last_used__lt=cutoff)
+    )
+
+
+def archive_idle_blobs(days, storage=default_storage, batch_size=500):
+    """
+    Move idle blobs to the cold tier of a ``TieredStorage``. Blobs that are
+    already cold cost one existence check each. Returns the number moved.
+    """
+    moved = 0
+    for name in idle_blobs(days).values_list('file', flat=True).iterator(chunk_size=batch_size):
+        if storage.archive(name):
+            moved += 1
+    return moved
@@ -0,0 +1,144 @@
+"""
+Background garbage collection for deleted patient files.
+
+Bulk deletes only tombstone rows (``PatientFile.deleted_at``), so the
+request returns immediately. ``collect_deleted_files`` later removes the
+rows in batches and releases their blobs; ``scan_orphans`` reconciles what
+is in storage with what the database still references.
+"""
+import time
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F
+
+from .blobstore import purge, release
+from .models import Derivative, FileBlob, GroupArchive, PatientFile
+
+# Directories of the default storage that hold patient uploads and files derived from them.
+MEDIA_DIRS = ('patient_files', 'blobs', 'previews', 'archives')
+
+
+def collect_deleted_files(batch_size=500):
+    """
+    Permanently remove one batch of tombstoned files.
+
+    Returns the number of rows removed; 0 means nothing is left to collect.
+    """
+    batch = list(
+        PatientFile.all_objects.filter(deleted_at__isnull=False)
+        .order_by('deleted_at', 'id')
+        .values_list('id', 'blob_id', 'file')[:batch_size]
+    )
+    if not batch:
+        return 0
+
+    ids = [file_id for file_id, _, _ in batch]
+    blob_ids = [blob_id for _, blob_id, _ in batch if blob_id]
+    legacy_names = [name for _, blob_id, name in batch if not blob_id and name]
+
+    with transaction.atomic():
+        PatientFile.all_objects.filter(id__in=ids).delete()
+    release(blob_ids)
+
+    for name in legacy_names:
+        default_storage.delete(name)
+    return len(ids)
+
+
+def collect_all(batch_size=500, pause=0):
+    """Collect batches until no tombstones remain; returns the total removed."""
+    total = 0
+    while True:
+        removed = collect_deleted_files(batch_size)
+        total += removed
+        if removed < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
+
+
+def reconcile_ref_counts(fix=False, batch_size=500):
+    """
+    Find FileBlob.ref_count drift (e.g. after an interrupted release) and
+    blobs that nothing references any more. With ``fix``, correct the counts
+    and delete the unused blobs; otherwise only count them.
+
+    Returns ``(drifted, unused)``.
+    """
+    drifted = 0
+    unused = []
+    # Tombstoned rows still hold their reference until they are collected.
+    blobs = FileBlob.objects.annotate(refs=Count('references')).exclude(ref_count=F('refs'))
+
+    for blob in blobs.iterator(chunk_size=batch_size):
+        if not fix:
+            drifted += 1
+            if blob.refs == 0:
+                unused.append(blob.id)
+            continue
+        with transaction.atomic():
+            # Recount under the row lock and apply the difference, so a
+            # concurrent acquire() or release() is not overwritten.
+            locked = FileBlob.objects.select_for_update().filter(id=blob.id).values_list('ref_count', flat=True).first()
+            if locked is None:
+                continue
+            refs = PatientFile.all_objects.filter(blob_id=blob.id).count()
+            if refs != locked:
+                FileBlob.objects.filter(id=blob.id).update(ref_count=F('ref_count') + (refs - locked))
+                drifted += 1
+        if refs == 0:
+            unused.append(blob.id)
+
+    # Blobs already at zero (e.g. left by an interrupted release) are unused too.
+    unused.extend(
+        FileBlob.objects.annotate(refs=Count('references')).filter(refs=0, ref_count__lte=0)
+        .exclude(id__in=unused).values_list('id', flat=True)
+    )
+    if fix:
+        purge(unused)
+    return drifted, len(unused)
+
+
+def _walk(storage, path):
+    """Yield the names of all files under ``path`` in ``storage``, a directory at a time."""
+    try:
+        dirs, files = storage.listdir(path)
+    except FileNotFoundError:
+        return
+    yield [f'{path}/{name}' for name in files]
+    for name in dirs:
+        yield from _walk(storage, f'{path}/{name}')
+
+
+def scan_orphans(delete=False, min_age=timedelta(hours=1), batch_size=500):
+    """
+    Walk the upload and preview directories of the default storage and
+    yield the name of every file the database does not reference.
+
+    Files younger than ``min_age`` are skipped because uploads write the
+    file before the row that points at it. With ``delete=True`` orphans
+    are removed as they are found.
+    """
+    cutoff = time.time() - min_age.total_seconds()
+
+    for media_dir in MEDIA_DIRS:
+        for names in _walk(default_storage, media_dir):
+            for start in range(0, len(names), batch_size):
+                chunk = names[start:start + batch_size]
+                known = set(PatientFile.all_objects.filter(file__in=chunk).values_list('file', flat=True))
+                known.update(FileBlob.objects.filter(file__in=chunk).values_list('file', flat=True))
+                known.update(Derivative.objects.filter(file__in=chunk).values_list('file', flat=True))
+                known.update(GroupArchive.objects.filter(file__in=chunk).values_list('file', flat=True))
+                for name in chunk:
+                    if name in known:
+                        continue
+                    try:
+                        if default_storage.get_modified_time(name).timestamp() > cutoff:
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    if delete:
+                        default_storage.delete(name)
+                    yield name
@@ -0,0 +1,237 @@
+"""
+Chunked authenticated encryption of stored files.
+
+Each file gets its own random 256-bit data key, wrapped (AES-GCM) by a
+master key from ``FILE_ENCRYPTION_KEYS``. The plaintext is cut into
+64 KiB chunks, each sealed with AES-256-GCM under a nonce made of a
+per-file prefix, the chunk number and a last-chunk flag, with the header
+as associated data. Chunks cannot be reordered, dropped or moved between
+files, and a file cut short at a chunk boundary fails to decrypt.
+
+Layout::
+
+    magic (8) | key id (8) | wrapped data key (60) | nonce prefix (7)
+    chunk 0: ciphertext (64 KiB) + tag (16)
+    ...
+    last chunk: ciphertext (0-64 KiB) + tag (16)
+
+Every chunk but the last has the same size, so the plaintext size follows
+from the stored size and a byte offset from its chunk number: reads seek
+straight to the chunk they need and decrypt only that one. Encryption
+and decryption are streamed a chunk at a time.
+
+Needs the optional ``cryptography`` package.
+"""
+import base64
+import hashlib
+import io
+import os
+import struct
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # pragma: no cover - optional dependency
+    AESGCM = None
+
+MAGIC = b'PRSENC\x00\x01'
+CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+KEY_ID_SIZE = 8
+WRAPPED_KEY_SIZE = 12 + 32 + TAG_SIZE
+NONCE_PREFIX_SIZE = 7
+HEADER_SIZE = len(MAGIC) + KEY_ID_SIZE + WRAPPED_KEY_SIZE + NONCE_PREFIX_SIZE
+SEALED_CHUNK_SIZE = CHUNK_SIZE + TAG_SIZE
+
+
+class DecryptionError(OSError):
+    """A stored file is corrupt, truncated or sealed with an unknown key."""
+
+
+def key_id(master_key):
+    return hashlib.sha256(master_key).digest()[:KEY_ID_SIZE]
+
+
+class Keyring:
+    """
+    Master keys, newest first. New files are sealed with the first key;
+    the others are kept so files sealed before a rotation stay readable.
+    """
+
+    def __init__(self, keys):
+        if AESGCM is None:
+            raise ImproperlyConfigured("File encryption needs the cryptography package (pip install cryptography).")
+        self.keys = {}
+        for encoded in keys:
+            master_key = base64.b64decode(encoded)
+            if len(master_key) != 32:
+                raise ImproperlyConfigured("FILE_ENCRYPTION_KEYS entries must be base64-encoded 32-byte keys.")
+            self.keys.setdefault(key_id(master_key), AESGCM(master_key))
+        if not self.keys:
+            raise ImproperlyConfigured("FILE_ENCRYPTION_KEYS is empty.")
+        self.current_id = next(iter(self.keys))
+
+    @classmethod
+    def from_settings(cls):
+        return cls(getattr(settings, 'FILE_ENCRYPTION_KEYS', []))
+
+    def wrap(self, data_key):
+        nonce = os.urandom(12)
+        return self.current_id, nonce + self.keys[self.current_id].encrypt(nonce, data_key, MAGIC + self.current_id)
+
+    def unwrap(self, kid, wrapped):
+        if kid not in self.keys:
+            raise DecryptionError(f'Sealed with unknown master key {kid.hex()}.')
+        try:
+            return self.keys[kid].decrypt(wrapped[:12], wrapped[12:], MAGIC + kid)
+        except InvalidTag:
+            raise DecryptionError('Data key does not match its master key.')
+
+
+def _nonce(prefix, index, last):
+    return prefix + struct.pack('>IB', index, last)
+
+
+def is_sealed(header):
+    return header[:len(MAGIC)] == MAGIC
+
+
+def header_key_id(header):
+    return header[len(MAGIC):len(MAGIC) + KEY_ID_SIZE]
+
+
+def plaintext_size(sealed_size):
+    """Size of the plaintext of a sealed file that takes ``sealed_size`` bytes."""
+    body = sealed_size - HEADER_SIZE
+    chunks = max(1, -(-body // SEALED_CHUNK_SIZE))
+    return body - chunks * TAG_SIZE
+
+
+def _read_full(source, size):
+    """Read ``size`` bytes, fewer only at the end of ``source``."""
+    parts = []
+    while size:
+        data = source.read(size)
+        if not data:
+            break
+        parts.append(data)
+        size -= len(data)
+    return b''.join(parts)
+
+
+def encrypt_stream(source, keyring):
+    """Yield the sealed form of the file-like ``source``, a chunk at a time."""
+    data_key = AESGCM.generate_key(bit_length=256)
+    kid, wrapped = keyring.wrap(data_key)
+    prefix = os.urandom(NONCE_PREFIX_SIZE)
+    header = MAGIC + kid + wrapped + prefix
+    cipher = AESGCM(data_key)
+    yield header
+
+    # Read one chunk ahead to know which chunk is the last.
+    index = 0
+    chunk = _read_full(source, CHUNK_SIZE)
+    while True:
+        following = _read_full(source, CHUNK_SIZE) if len(chunk) == CHUNK_SIZE else b''
+        last = not following
+        yield cipher.encrypt(_nonce(prefix, index, last), chunk, header)
+        if last:
+            return
+        chunk = following
+        index += 1
+
+
+class EncryptingReader(io.RawIOBase):
+    """Readable stream of the sealed form of ``source``, for handing to a storage backend."""
+
+    def __init__(self, source, keyring):
+        self.pieces = encrypt_stream(source, keyring)
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.pieces, None)
+            if self.pending is None:
+                self.pending = b''
+                return 0
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+class DecryptingReader(io.RawIOBase):
+    """
+    Seekable plaintext view of a sealed file. ``raw`` is the stored file,
+    opened for reading and seekable; only the chunks that are read are
+    fetched and decrypted.
+    """
+
+    def __init__(self, raw, sealed_size, keyring):
+        self.raw = raw
+        raw.seek(0)
+        self.header = _read_full(raw, HEADER_SIZE)
+        if len(self.header) < HEADER_SIZE or not is_sealed(self.header):
+            raise DecryptionError('Not an encrypted file.')
+        offset = len(MAGIC)
+        kid = self.header[offset:offset + KEY_ID_SIZE]
+        offset += KEY_ID_SIZE
+        wrapped = self.header[offset:offset + WRAPPED_KEY_SIZE]
+        self.prefix = self.header[offset + WRAPPED_KEY_SIZE:]
+        self.cipher = AESGCM(keyring.unwrap(kid, wrapped))
+
+        self.size = plaintext_size(sealed_size)
+        self.chunks = max(1, -(-(sealed_size - HEADER_SIZE) // SEALED_CHUNK_SIZE))
+        self.position = 0
+        self.cached_index = None
+        self.cached = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def _chunk(self, index):
+        if index != self.cached_index:
+            self.raw.seek(HEADER_SIZE + index * SEALED_CHUNK_SIZE)
+            sealed = _read_full(self.raw, SEALED_CHUNK_SIZE)
+            try:
+                self.cached = self.cipher.decrypt(
+                    _nonce(self.prefix, index, index == self.chunks - 1), sealed, self.header
+                )
+            except InvalidTag:
+                raise DecryptionError(f'Chunk {index} failed authentication.')
+            self.cached_index = index
+        return self.cached
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        index, offset = divmod(self.position, CHUNK_SIZE)
+        data = self._chunk(index)[offset:offset + len(buffer)]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+        super().close()
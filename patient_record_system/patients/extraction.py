@@ -0,0 +1,53 @@
+"""
+Plain-text extraction from uploaded documents for the search index.
+
+Text files are read directly; PDFs need the optional ``pypdf`` package and
+are skipped without it. Extraction is capped so a huge upload cannot blow
+up worker memory or the index.
+"""
+import mimetypes
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - optional dependency
+    PdfReader = None
+
+# Upper bounds on what a single document contributes to the index.
+MAX_TEXT_BYTES = 1024 * 1024
+MAX_PDF_PAGES = 50
+
+TEXT_MIME_TYPES = {'application/json', 'application/xml', 'application/csv'}
+
+
+def extract_text(field_file, filename):
+    """Return searchable text for ``field_file`` or an empty string."""
+    mime_type, _ = mimetypes.guess_type(filename)
+    try:
+        if mime_type and (mime_type.startswith('text/') or mime_type in TEXT_MIME_TYPES):
+            return _extract_plain(field_file)
+        if mime_type == 'application/pdf' and PdfReader is not None:
+            return _extract_pdf(field_file)
+    except Exception:
+        # A document we cannot parse is still indexed by title and description.
+        return ''
+    return ''
+
+
+def _extract_plain(field_file):
+    with field_file.open('rb') as f:
+        data = f.read(MAX_TEXT_BYTES)
+    return data.decode('utf-8', errors='ignore')
+
+
+def _extract_pdf(field_file):
+    parts = []
+    size = 0
+    with field_file.open('rb') as f:
+        reader = PdfReader(f)
+        for page in reader.pages[:MAX_PDF_PAGES]:
+            text = page.extract_text() or ''
+            parts.append(text)
+            size += len(text)
+            if size >= MAX_TEXT_BYTES:
+                break
+    return '\n'.join(parts)[:MAX_TEXT_BYTES]
@@ -0,0 +1,141 @@
+"""
+Efficient delivery of stored patient files.
+
+After the view has checked access, the transfer is either handed to the
+front-end web server (``X-Sendfile`` for Apache/lighttpd,
+``X-Accel-Redirect`` for nginx) or streamed by Django itself. The
+pure-Python path supports single-range ``Range`` requests (seeking in
+large PDFs and videos), ``If-Range``, ``ETag``/``Last-Modified`` and
+``304 Not Modified``.
+
+Settings:
+
+* ``PATIENT_FILE_SENDFILE`` - ``None`` (default), ``'x-sendfile'`` or ``'x-accel-redirect'``
+* ``PATIENT_FILE_ACCEL_PREFIX`` - internal nginx location that maps to MEDIA_ROOT
+"""
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import local_path
+
+RANGE_CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Return ``(start, end)`` (inclusive) for a single-range ``Range`` header,
+    ``None`` to send the whole file, or ``False`` if the range cannot be
+    satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        # Absent, malformed and multi-range requests get the full file.
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _range_iter(f, start, length):
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining:
+            data = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def _content_disposition(filename, as_attachment):
+    disposition = 'attachment' if as_attachment else 'inline'
+    return f"{disposition}; filename*=UTF-8''{quote(filename)}"
+
+
+def serve_field_file(request, field_file, filename, etag, last_modified, as_attachment=False):
+    """
+    Build the response for ``field_file``.
+
+    ``etag`` must be a quoted strong validator and ``last_modified`` a Unix
+    timestamp; both describe the content, not the row.
+    """
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if conditional is not None:
+        return conditional
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    backend = getattr(settings, 'PATIENT_FILE_SENDFILE', None)
+    # The web server needs a file on local disk; other storages are streamed.
+    path = local_path(field_file.name, field_file.storage) if backend else None
+
+    if path is not None:
+        response = HttpResponse(content_type=content_type)
+        if backend == 'x-accel-redirect':
+            prefix = settings.PATIENT_FILE_ACCEL_PREFIX.rstrip('/')
+            response['X-Accel-Redirect'] = quote(f'{prefix}/{field_file.name}')
+        else:
+            response['X-Sendfile'] = path
+    else:
+        size = field_file.size
+        byte_range = parse_range(request.headers.get('Range'), size) if _if_range_matches(
+            request, etag, last_modified) else None
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        f = field_file.storage.open(field_file.name, 'rb')
+        if byte_range is None:
+            response = FileResponse(f, content_type=content_type)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(_range_iter(f, start, length), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(length)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['Content-Disposition'] = _content_disposition(filename, as_attachment)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def patient_file_validators(patient_file):
+    """``(etag, last_modified)`` for a PatientFile; blob-backed files use their content hash."""
+    last_modified = patient_file.uploaded_at.timestamp()
+    if patient_file.blob_id:
+        return f'"{patient_file.blob.sha256}"', last_modified
+    size = patient_file.size or patient_file.file.size
+    return f'"{patient_file.id}-{int(last_modified)}-{size}"', last_modified
@@ -0,0 +1,313 @@
+"""
+Bulk import of existing scans (``manage.py import_records``).
+
+Entries come either from a directory tree::
+
+    <root>/<patient>/<file>                 ungrouped
+    <root>/<patient>/<group>/.../<file>     in <group>
+
+where ``<patient>`` is the patient's Aadhaar hash (or number), or from a
+CSV/NDJSON manifest with ``path``, ``aadhaar_hash`` or ``aadhaar`` and
+optional ``group``, ``title`` and ``description`` columns.
+
+Files are copied into the blob store and hashed in the same pass by a
+pool of worker processes. Each batch of results is then written with a
+handful of queries (one ``bulk_create`` per table), and while that runs
+the pool is already copying the next batch. After every committed batch
+the position in the input is saved to a checkpoint file so an interrupted
+import resumes where it stopped; files a patient already has (same
+content, name and group) are skipped, so overlapping runs are harmless.
+"""
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections import Counter, defaultdict, namedtuple
+from itertools import islice
+from multiprocessing import Pool
+
+from django.db import connections, transaction
+from django.db.models import F
+
+from . import search
+from .archives import schedule_archives
+from .blobcopy import copy_and_hash
+from .blobstore import create_blobs
+from .models import FileBlob, Patient, PatientFile, RecordChange, RecordGroup, blob_upload_to, record_changes
+from .previews import schedule_previews
+from .storage import store_file, temp_dir
+from .tasks import index_documents
+
+BATCH_SIZE = 1000
+# Copies of batches in flight are staged here, on the same filesystem as the blobs when storage is local.
+TEMP_DIR = 'blobs/.import'
+
+Entry = namedtuple('Entry', 'path patient_key group title description')
+
+
+def hash_aadhaar(number):
+    return hashlib.sha256(number.strip().encode()).hexdigest()
+
+
+def _title(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# -----------------------------------------
+# Sources
+# -----------------------------------------
+def walk_directory(root, key='aadhaar_hash'):
+    """Entries of a ``<patient>/<group>/<file>`` tree in a stable order."""
+    patient_dirs = sorted(
+        (e for e in os.scandir(root) if e.is_dir() and not e.name.startswith('.')), key=lambda e: e.name
+    )
+    for patient_dir in patient_dirs:
+        patient_key = hash_aadhaar(patient_dir.name) if key == 'aadhaar' else patient_dir.name
+        for dirpath, dirnames, filenames in os.walk(patient_dir.path):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            relative = os.path.relpath(dirpath, patient_dir.path)
+            group = None if relative == os.curdir else relative.split(os.sep)[0]
+            for name in sorted(filenames):
+                if not name.startswith('.'):
+                    yield Entry(os.path.join(dirpath, name), patient_key, group, _title(name), '')
+
+
+def read_manifest(manifest, root=None):
+    """Entries of a CSV or NDJSON manifest; relative paths are taken from ``root`` (default: the manifest's folder)."""
+    root = root or os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, newline='', encoding='utf-8') as fh:
+        if manifest.endswith(('.ndjson', '.jsonl')):
+            rows = (json.loads(line) for line in fh if line.strip())
+        else:
+            rows = csv.DictReader(fh)
+        for row in rows:
+            path = os.path.join(root, row.get('path') or '')
+            patient_key = (row.get('aadhaar_hash') or '').strip()
+            if not patient_key and row.get('aadhaar'):
+                patient_key = hash_aadhaar(str(row['aadhaar']))
+            yield Entry(
+                path,
+                patient_key,
+                (row.get('group') or '').strip() or None,
+                row.get('title') or _title(path),
+                row.get('description') or '',
+            )
+
+
+# -----------------------------------------
+# Checkpoints
+# -----------------------------------------
+class Checkpoint:
+    """Progress of one import; saved atomically after every committed batch."""
+
+    FIELDS = ('position', 'imported', 'deduplicated', 'already_imported', 'skipped', 'bytes')
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    @classmethod
+    def load(cls, path, source):
+        checkpoint = cls(path, source)
+        with open(path) as fh:
+            data = json.load(fh)
+        if data.get('source') != source:
+            raise ValueError(f"checkpoint belongs to {data.get('source')!r}, not {source!r}")
+        for field in cls.FIELDS:
+            setattr(checkpoint, field, data.get(field, 0))
+        return checkpoint
+
+    def save(self):
+        data = {'source': self.source, **{field: getattr(self, field) for field in self.FIELDS}}
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as fh:
+            json.dump(data, fh)
+        os.replace(temp_path, self.path)
+
+
+# -----------------------------------------
+# Import
+# -----------------------------------------
+def _batches(entries, size):
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _groups_for(pairs):
+    """``{(patient_id, name): RecordGroup}`` for ``pairs``, creating the missing groups."""
+    groups = {}
+    if not pairs:
+        return groups, []
+    existing = RecordGroup.objects.filter(
+        patient_id__in={pid for pid, _ in pairs}, name__in={name for _, name in pairs},
+    ).order_by('-id')
+    for group in existing:
+        # The oldest group wins when a patient has several with the same name.
+        groups[(group.patient_id, group.name)] = group
+    created = RecordGroup.objects.bulk_create([
+        RecordGroup(patient_id=pid, name=name) for pid, name in sorted(pairs) if (pid, name) not in groups
+    ])
+    groups.update({(g.patient_id, g.name): g for g in created})
+    return groups, created
+
+
+def _commit(batch, patients, copies, checkpoint, report):
+    """Write one batch of copied files; ``copies`` maps entry index to ``(sha256, size, temp_path)``."""
+    rows = []
+    for index, entry in enumerate(batch):
+        if index in copies:
+            rows.append((entry, patients[entry.patient_key], *copies[index]))
+
+    # Skip files the patient already has in the same group (a resumed or repeated import).
+    already = set(
+        PatientFile.objects.filter(
+            patient_id__in={patient.id for _, patient, _, _, _ in rows},
+            blob__sha256__in={digest for _, _, digest, _, _ in rows},
+        ).values_list('patient_id', 'blob__sha256', 'original_name', 'group__name')
+    )
+    unique = []
+    for row in rows:
+        entry, patient, digest, size, temp_path = row
+        key = (patient.id, digest, os.path.basename(entry.path), entry.group)
+        if key in already:
+            os.unlink(temp_path)
+            checkpoint.already_imported += 1
+        else:
+            already.add(key)
+            unique.append(row)
+
+    counts = Counter(digest for _, _, digest, _, _ in unique)
+    existing = FileBlob.objects.in_bulk(list(counts), field_name='sha256')
+    new_blobs = {}
+    try:
+        for entry, _, digest, size, temp_path in unique:
+            if digest in existing or digest in new_blobs:
+                os.unlink(temp_path)
+                continue
+            blob = FileBlob(sha256=digest, size=size, ref_count=counts[digest])
+            blob.file.name = store_file(blob_upload_to(blob, os.path.basename(entry.path)), temp_path)
+            new_blobs[digest] = blob
+
+        with transaction.atomic():
+            create_blobs(new_blobs, existing)
+            by_count = defaultdict(list)
+            for digest, blob in existing.items():
+                by_count[counts[digest]].append(blob.id)
+            for count, ids in by_count.items():
+                FileBlob.objects.filter(id__in=ids).update(ref_count=F('ref_count') + count)
+
+            blobs = {**existing, **new_blobs}
+            groups, new_groups = _groups_for({(patient.id, e.group) for e, patient, _, _, _ in unique if e.group})
+            records = PatientFile.objects.bulk_create([
+                PatientFile(
+                    patient=patient,
+                    group=groups[(patient.id, entry.group)] if entry.group else None,
+                    file=blobs[digest].file.name,
+                    blob=blobs[digest],
+                    original_name=os.path.basename(entry.path),
+                    size=size,
+                    title=entry.title,
+                    description=entry.description,
+                )
+                for entry, patient, digest, size, _ in unique
+            ])
+
+            search.index_files(records, extract=False)
+            if records:
+                index_documents.enqueue(file_ids=[record.id for record in records])
+            schedule_previews(blob.id for blob in new_blobs.values())
+            schedule_archives({record.group_id for record in records if record.group_id})
+            record_changes(
+                [(g.patient_id, RecordChange.GROUP, g.id, RecordChange.UPSERT) for g in new_groups]
+                + [(r.patient_id, RecordChange.FILE, r.id, RecordChange.UPSERT) for r in records]
+            )
+    except Exception:
+        # Names are content-addressed: keep files a committed row (e.g. a concurrent upload) points at.
+        names = {blob.file.name for blob in new_blobs.values()}
+        names -= set(FileBlob.objects.filter(file__in=names).values_list('file', flat=True))
+        for blob in new_blobs.values():
+            if blob.file.name in names:
+                blob.file.delete(save=False)
+        raise
+
+    checkpoint.position += len(batch)
+    checkpoint.imported += len(records)
+    checkpoint.deduplicated += len(records) - len(new_blobs)
+    checkpoint.bytes += sum(size for _, _, _, size, _ in unique)
+    checkpoint.save()
+    report(checkpoint)
+
+
+class _Done:
+    """Stands in for ``AsyncResult`` when files are copied without a pool."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def import_entries(entries, checkpoint, processes=None, batch_size=BATCH_SIZE, report=None, skip=None):
+    """
+    Import ``entries`` after the first ``checkpoint.position`` of them.
+
+    ``processes`` is the size of the copy pool (0 copies in this process).
+    ``report(checkpoint)`` is called after every batch and
+    ``skip(entry, reason)`` for entries that could not be imported.
+    """
+    report = report or (lambda checkpoint: None)
+    skip = skip or (lambda entry, reason: None)
+    copy_dir = tempfile.mkdtemp(dir=temp_dir(TEMP_DIR))
+
+    # Forked workers must not share the parent's database connections.
+    connections.close_all()
+    pool = Pool(processes) if processes != 0 else None
+
+    def start(batch):
+        keys = {entry.patient_key for entry in batch if entry.patient_key}
+        patients = Patient.objects.in_bulk(list(keys), field_name='aadhaar_hash')
+        tasks = []
+        for index, entry in enumerate(batch):
+            if entry.patient_key in patients:
+                tasks.append((index, entry.path, copy_dir))
+            else:
+                skip(entry, 'unknown patient')
+        if pool:
+            return batch, patients, pool.map_async(copy_and_hash, tasks, chunksize=8)
+        return batch, patients, _Done([copy_and_hash(task) for task in tasks])
+
+    def finish(batch, patients, pending):
+        copies = {}
+        for index, digest, size, temp_path, error in pending.get():
+            if error:
+                skip(batch[index], error)
+            else:
+                copies[index] = (digest, size, temp_path)
+        checkpoint.skipped += len(batch) - len(copies)
+        _commit(batch, patients, copies, checkpoint, report)
+
+    # The next batch is being copied while the previous one is written.
+    pending = []
+    try:
+        for batch in _batches(islice(entries, checkpoint.position, None), batch_size):
+            pending.append(start(batch))
+            if len(pending) > 1:
+                finish(*pending.pop(0))
+        while pending:
+            finish(*pending.pop(0))
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+        # Copies of batches that were never committed.
+        shutil.rmtree(copy_dir, ignore_errors=True)
+    return checkpoint
@@ -0,0 +1,242 @@
+"""
+Benchmark the records hot paths in-process with the Django test client.
+
+A synthetic patient is created for the run (and removed afterwards), each
+scenario is requested ``--iterations`` times after ``--warmup`` unmeasured
+runs, and latency percentiles, query counts and the process's peak RSS are
+written as JSON. Pass an earlier result as ``--compare`` to print the change.
+Uploads and deletes really happen, so run it against a scratch database.
+"""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+from itertools import cycle
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.profiling import QueryRecorder
+from patients import synthetic
+from patients.models import RecordGroup
+from patients.services import ingest_files
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ['my_records', 'search', 'batch_upload', 'download_group', 'delete_all_files_in_group']
+SEARCH_TERMS = ['blood', 'x-ray', 'prescription', 'mri', 'report', 'discharge summary']
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Measure latency, query counts and memory of the main record views."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help="Scenario to run (repeatable); all by default.")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--files', type=int, default=500, help="Files of the benchmark patient.")
+        parser.add_argument('--groups', type=int, default=10, help="Groups of the benchmark patient.")
+        parser.add_argument('--median-size', type=int, default=200 * 1024, help="Median synthetic file size in bytes.")
+        parser.add_argument('--upload-files', type=int, default=10,
+                            help="Files per batch upload and per group deleted.")
+        parser.add_argument('--upload-size', type=int, default=64 * 1024, help="Size of each uploaded file in bytes.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmark.json', help="Where to write the results.")
+        parser.add_argument('--compare', help="Earlier results file to compare against.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as fh:
+                    baseline = json.load(fh)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        self.options = options
+        prefix = f'benchmark-{uuid.uuid4().hex[:8]}'
+        self.stdout.write(f"Creating benchmark patient with {options['files']} file(s)...")
+        self.patient = synthetic.generate(
+            patients=1, groups=options['groups'], files=options['files'], median_size=options['median_size'],
+            max_size=max(options['median_size'] * 20, 1), prefix=prefix, seed=options['seed'],
+        )[0]
+        self.client = Client()
+        self.client.force_login(self.patient.user)
+
+        results = {}
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], DEBUG=False):
+                for name in options['scenario'] or SCENARIOS:
+                    results[name] = self.run_scenario(name)
+                    self.stdout.write(self.format_line(name, results[name]))
+        finally:
+            synthetic.remove(prefix)
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'files': options['files'],
+                'groups': options['groups'],
+                'median_size': options['median_size'],
+                'upload_files': options['upload_files'],
+                'upload_size': options['upload_size'],
+                'seed': options['seed'],
+            },
+            'iterations': options['iterations'],
+            'warmup': options['warmup'],
+            'scenarios': results,
+        }
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+
+        if baseline:
+            self.compare(baseline, report)
+
+    # -----------------------------------------
+    # Scenarios
+    # -----------------------------------------
+    def uploads(self, count):
+        size = self.options['upload_size']
+        return [SimpleUploadedFile(f'scan_{n}.pdf', os.urandom(size)) for n in range(count)]
+
+    def scenario(self, name):
+        """``(setup, request)`` for a scenario; ``setup(i)`` runs unmeasured and its result is passed to ``request``."""
+        client = self.client
+        if name == 'my_records':
+            return None, lambda _: client.get(reverse('patients:my_records'))
+
+        if name == 'search':
+            terms = cycle(SEARCH_TERMS)
+            return (lambda i: next(terms)), lambda term: client.get(reverse('home'), {'q': term})
+
+        if name == 'batch_upload':
+            def upload(files):
+                return client.post(reverse('patients:batch_upload'), {
+                    'files': files, 'title': 'Benchmark upload', 'new_group_name': f'Benchmark {uuid.uuid4().hex[:8]}',
+                })
+            return (lambda i: self.uploads(self.options['upload_files'])), upload
+
+        if name == 'download_group':
+            group = max(self.patient.groups.all(), key=lambda g: g.patientfile_set.count(), default=None)
+            if group is None:
+                raise CommandError("download_group needs --groups of at least 1.")
+            return None, lambda _: client.get(reverse('patients:download_group', args=[group.id]))
+
+        if name == 'delete_all_files_in_group':
+            def setup(i):
+                group = RecordGroup.objects.create(patient=self.patient, name=f'Benchmark delete {i}')
+                ingest_files(self.patient, self.uploads(self.options['upload_files']), group=group)
+                return group.id
+            return setup, lambda group_id: client.post(
+                reverse('patients:delete_all_files_in_group', args=[group_id])
+            )
+
+    def run_scenario(self, name):
+        setup, request = self.scenario(name)
+        latencies = []
+        queries = []
+        statuses = {}
+        for i in range(self.options['warmup'] + self.options['iterations']):
+            arg = setup(i) if setup else None
+            recorder = QueryRecorder(time.perf_counter)
+            start = time.perf_counter()
+            with connection.execute_wrapper(recorder):
+                response = request(arg)
+                # Streamed responses do their work while being read.
+                size = sum(len(chunk) for chunk in response.streaming_content) if response.streaming else len(response.content)
+            elapsed = time.perf_counter() - start
+            response.close()
+            if i < self.options['warmup']:
+                continue
+            latencies.append(elapsed * 1000)
+            queries.append(recorder.count)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+        latencies.sort()
+        return {
+            'latency_ms': {
+                'min': latencies[0] if latencies else None,
+                'p50': percentile(latencies, 50),
+                'p90': percentile(latencies, 90),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': latencies[-1] if latencies else None,
+                'mean': sum(latencies) / len(latencies) if latencies else None,
+            },
+            'queries': {
+                'min': min(queries, default=None),
+                'max': max(queries, default=None),
+                'mean': sum(queries) / len(queries) if queries else None,
+            },
+            'response_bytes': size if latencies else None,
+            'status_codes': statuses,
+            'peak_rss_kb': peak_rss_kb(),
+        }
+
+    # -----------------------------------------
+    # Output
+    # -----------------------------------------
+    def format_line(self, name, result):
+        latency = result['latency_ms']
+        if latency['p50'] is None:
+            return f"{name:<28} no measured iterations"
+        return (
+            f"{name:<28} p50 {latency['p50']:8.1f} ms  p95 {latency['p95']:8.1f} ms  "
+            f"queries {result['queries']['max']:4d}  peak RSS {result['peak_rss_kb'] or 0} KB"
+        )
+
+    def compare(self, baseline, report):
+        self.stdout.write(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+        for name, result in report['scenarios'].items():
+            before = baseline.get('scenarios', {}).get(name)
+            if not before or before['latency_ms']['p50'] is None or result['latency_ms']['p50'] is None:
+                continue
+            changes = []
+            for pct in ('p50', 'p95'):
+                old, new = before['latency_ms'][pct], result['latency_ms'][pct]
+                changes.append(f"{pct} {old:.1f} -> {new:.1f} ms ({(new - old) / old * 100:+.0f}%)" if old else pct)
+            changes.append(f"queries {before['queries']['max']} -> {result['queries']['max']}")
+            self.stdout.write(f"{name:<28} " + '  '.join(changes))
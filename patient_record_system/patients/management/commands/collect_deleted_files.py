@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from patients.collector import collect_all
+
+
+class Command(BaseCommand):
+    help = "Permanently remove tombstoned patient files and release their blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between batches.")
+        parser.add_argument('--loop', action='store_true', help="Keep running and collect new tombstones as they appear.")
+        parser.add_argument('--interval', type=float, default=30, help="Seconds between passes with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            removed = collect_all(options['batch_size'], options['pause'])
+            if removed or not options['loop']:
+                self.stdout.write(f"Collected {removed} deleted file(s).")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from patients.models import RecordChange
+
+
+class Command(BaseCommand):
+    help = "Drop change-feed entries that a later entry for the same file or group supersedes."
+
+    def handle(self, *args, **options):
+        newer = RecordChange.objects.filter(
+            patient=OuterRef('patient'),
+            kind=OuterRef('kind'),
+            object_id=OuterRef('object_id'),
+            seq__gt=OuterRef('seq'),
+        )
+        # Sync cursors stay valid: every object keeps its latest entry.
+        deleted, _ = RecordChange.objects.filter(Exists(newer)).delete()
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} superseded change(s)."))
@@ -0,0 +1,38 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.models import Derivative, FileBlob, GroupArchive, PatientFile
+
+
+class Command(BaseCommand):
+    help = (
+        "Encrypt files stored before EncryptedStorage was enabled, and re-encrypt "
+        "files sealed with a master key that is no longer the newest."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not hasattr(default_storage, 'seal'):
+            raise CommandError("The default storage does not encrypt; configure patients.storage.EncryptedStorage.")
+
+        sources = (
+            FileBlob.objects.all(),
+            PatientFile.all_objects.filter(blob__isnull=True),
+            Derivative.objects.all(),
+            GroupArchive.objects.all(),
+        )
+        sealed = checked = 0
+        for queryset in sources:
+            names = queryset.exclude(file='').values_list('file', flat=True)
+            for name in names.iterator(chunk_size=options['batch_size']):
+                checked += 1
+                try:
+                    if default_storage.seal(name):
+                        sealed += 1
+                except FileNotFoundError:
+                    self.stderr.write(f"Missing: {name}")
+                if checked % options['batch_size'] == 0:
+                    self.stdout.write(f"{checked} checked, {sealed} encrypted")
+        self.stdout.write(self.style.SUCCESS(f"Encrypted {sealed} of {checked} file(s)."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+
+from patients.models import Derivative, FileBlob
+from patients.previews import SIZES, generate_for_blob
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails and previews for blobs that are missing them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help="Also retry blobs whose rendering failed.")
+        parser.add_argument('--all', action='store_true', help="Regenerate every blob's derivatives.")
+
+    def handle(self, *args, **options):
+        blobs = FileBlob.objects.filter(ref_count__gt=0)
+        if not options['all']:
+            settled = [Derivative.READY, Derivative.UNSUPPORTED]
+            if not options['retry_failed']:
+                settled.append(Derivative.FAILED)
+            blobs = blobs.annotate(
+                settled=Count('derivatives', filter=Q(derivatives__status__in=settled))
+            ).filter(settled__lt=len(SIZES))
+
+        count = 0
+        for blob_id in blobs.values_list('id', flat=True).iterator():
+            for kind in SIZES:
+                Derivative.objects.get_or_create(blob_id=blob_id, kind=kind)
+            generate_for_blob(blob_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Processed {count} blob(s)."))
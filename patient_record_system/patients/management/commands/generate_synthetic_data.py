@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from patients import synthetic
+
+
+class Command(BaseCommand):
+    help = "Create synthetic patients, groups and (sparse) files for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10)
+        parser.add_argument('--groups', type=int, default=4, help="Groups per patient.")
+        parser.add_argument('--files', type=int, default=50, help="Files per patient.")
+        parser.add_argument('--median-size', type=int, default=200 * 1024, help="Median file size in bytes.")
+        parser.add_argument('--size-sigma', type=float, default=1.5,
+                            help="Spread of the log-normal size distribution (0 = every file the median size).")
+        parser.add_argument('--max-size', type=int, default=50 * 1024 * 1024, help="Largest file size in bytes.")
+        parser.add_argument('--ungrouped', type=float, default=0.2, help="Share of files outside any group.")
+        parser.add_argument('--duplicates', type=float, default=0.1, help="Share of files reusing earlier content.")
+        parser.add_argument('--seed', type=int, help="Random seed for a repeatable data set.")
+        parser.add_argument('--prefix', default=synthetic.DEFAULT_PREFIX, help="Username prefix of the synthetic users.")
+        parser.add_argument('--remove', action='store_true', help="Delete the synthetic data under --prefix instead.")
+
+    def handle(self, *args, **options):
+        if options['remove']:
+            count = synthetic.remove(options['prefix'])
+            self.stdout.write(self.style.SUCCESS(f"Removed {count} synthetic patient(s)."))
+            return
+
+        patients = synthetic.generate(
+            patients=options['patients'],
+            groups=options['groups'],
+            files=options['files'],
+            median_size=options['median_size'],
+            sigma=options['size_sigma'],
+            max_size=options['max_size'],
+            ungrouped_ratio=options['ungrouped'],
+            duplicate_ratio=options['duplicates'],
+            prefix=options['prefix'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(patients)} patient(s) with {options['groups']} group(s) "
+            f"and {options['files']} file(s) each."
+        ))
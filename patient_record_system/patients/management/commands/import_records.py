@@ -0,0 +1,78 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients import importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Import existing scans from a <patient>/<group>/<file> directory tree "
+        "or a CSV/NDJSON manifest. Interrupted imports continue with --resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="Directory tree, or a .csv/.ndjson manifest.")
+        parser.add_argument('--root', help="Base folder for relative manifest paths (default: the manifest's folder).")
+        parser.add_argument('--patient-key', choices=['aadhaar_hash', 'aadhaar'], default='aadhaar_hash',
+                            help="What the patient folder names of a directory tree are.")
+        parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                            help="Copy/hash worker processes (0 = copy in this process).")
+        parser.add_argument('--batch-size', type=int, default=importer.BATCH_SIZE)
+        parser.add_argument('--checkpoint', help="Progress file (default: import-<source name>.checkpoint.json).")
+        parser.add_argument('--resume', action='store_true', help="Continue from the checkpoint file.")
+        parser.add_argument('--errors', help="Write skipped entries to this NDJSON file.")
+
+    def handle(self, *args, **options):
+        source = os.path.abspath(options['source'])
+        if os.path.isdir(source):
+            entries = importer.walk_directory(source, options['patient_key'])
+        elif os.path.isfile(source):
+            entries = importer.read_manifest(source, options['root'])
+        else:
+            raise CommandError(f"{source} does not exist.")
+
+        checkpoint_path = options['checkpoint'] or f'import-{os.path.basename(source)}.checkpoint.json'
+        if options['resume']:
+            try:
+                checkpoint = importer.Checkpoint.load(checkpoint_path, source)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot resume from {checkpoint_path}: {e}")
+            self.stdout.write(f"Resuming after {checkpoint.position} entries.")
+        elif os.path.exists(checkpoint_path):
+            raise CommandError(f"{checkpoint_path} exists; pass --resume to continue that import or remove it.")
+        else:
+            checkpoint = importer.Checkpoint(checkpoint_path, source)
+
+        errors = open(options['errors'], 'a', encoding='utf-8') if options['errors'] else None
+        started = time.monotonic()
+        start_bytes = checkpoint.bytes
+
+        def skip(entry, reason):
+            if errors:
+                errors.write(json.dumps({'path': entry.path, 'patient': entry.patient_key, 'error': reason}) + '\n')
+            elif options['verbosity'] > 1:
+                self.stderr.write(f"Skipped {entry.path}: {reason}")
+
+        def report(checkpoint):
+            rate = (checkpoint.bytes - start_bytes) / max(time.monotonic() - started, 1e-6) / 1024 / 1024
+            self.stdout.write(
+                f"{checkpoint.position} entries: {checkpoint.imported} imported "
+                f"({checkpoint.deduplicated} deduplicated), {checkpoint.already_imported} already present, "
+                f"{checkpoint.skipped} skipped, {rate:.1f} MB/s"
+            )
+
+        try:
+            importer.import_entries(
+                entries, checkpoint, processes=options['processes'], batch_size=options['batch_size'],
+                report=report, skip=skip,
+            )
+        finally:
+            if errors:
+                errors.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {checkpoint.imported} file(s); {checkpoint.skipped} skipped. "
+            f"Progress is in {checkpoint_path}."
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from patients import media_layout
+
+
+class Command(BaseCommand):
+    help = (
+        "Move files stored as patient_files/<patient_id>/<timestamp>_<name> to the sharded "
+        "patient_files/<aa>/<bb>/<uuid> layout. Safe to interrupt and run again; do not run "
+        "scan_orphan_files --delete at the same time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help="Files copied in parallel.")
+        parser.add_argument('--batch-size', type=int, default=media_layout.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Only count the files that would be moved.")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f"{media_layout.legacy_files().count()} file(s) to move.")
+            return
+
+        def skip(patient_file, reason):
+            self.stderr.write(f"Skipped {patient_file.file.name}: {reason}")
+
+        def report(moved, skipped):
+            self.stdout.write(f"{moved} moved, {skipped} skipped")
+
+        moved, skipped = media_layout.migrate_all(
+            threads=options['threads'], batch_size=options['batch_size'], report=report, skip=skip,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} file(s); {skipped} skipped."))
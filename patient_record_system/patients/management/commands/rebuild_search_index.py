@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from patients import search
+from patients.models import PatientFile
+
+
+class Command(BaseCommand):
+    help = "Re-extract document text and rebuild the full-text search index for all files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch = []
+        total = 0
+        for f in PatientFile.objects.select_related('group').iterator(chunk_size=batch_size):
+            batch.append(f)
+            if len(batch) >= batch_size:
+                search.index_files(batch)
+                total += len(batch)
+                batch = []
+        search.index_files(batch)
+        total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} file(s)."))
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from patients.collector import reconcile_ref_counts, scan_orphans
+
+
+class Command(BaseCommand):
+    help = "Reconcile uploaded files and previews in storage against the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help="Remove orphaned files and fix blob reference counts instead of only listing them.")
+        parser.add_argument('--min-age', type=float, default=1, help="Ignore files modified within this many hours.")
+
+    def handle(self, *args, **options):
+        drifted, unused = reconcile_ref_counts(fix=options['delete'])
+        if options['delete']:
+            self.stdout.write(f"Fixed {drifted} blob reference count(s); deleted {unused} unused blob(s).")
+        else:
+            self.stdout.write(f"Found {drifted} wrong blob reference count(s) and {unused} unused blob(s).")
+
+        count = 0
+        for name in scan_orphans(delete=options['delete'], min_age=timedelta(hours=options['min_age'])):
+            self.stdout.write(name)
+            count += 1
+
+        action = "Deleted" if options['delete'] else "Found"
+        self.stdout.write(self.style.SUCCESS(f"{action} {count} orphaned file(s)."))
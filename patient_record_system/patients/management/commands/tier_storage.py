@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.blobstore import archive_idle_blobs
+
+
+class Command(BaseCommand):
+    help = "Move blobs that have not been read for a while to the cold storage tier."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'COLD_STORAGE_AFTER_DAYS', 180),
+            help="Archive blobs not read for this many days.",
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help="Keep running and archive blobs as they go idle.")
+        parser.add_argument('--interval', type=float, default=3600, help="Seconds between passes with --loop.")
+
+    def handle(self, *args, **options):
+        if not hasattr(default_storage, 'archive'):
+            raise CommandError("The default storage has no cold tier; configure patients.storage.TieredStorage.")
+        while True:
+            moved = archive_idle_blobs(options['days'], batch_size=options['batch_size'])
+            if moved or not options['loop']:
+                self.stdout.write(f"Moved {moved} blob(s) to cold storage.")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
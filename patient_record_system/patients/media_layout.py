@@ -0,0 +1,138 @@
+"""
+Move files stored before the sharded layout (``manage.py migrate_media_layout``).
+
+Early uploads were stored as ``patient_files/<patient_id>/<timestamp>_<name>``:
+one flat directory per patient, where two uploads of the same name in the
+same second collided. ``patient_file_upload_to`` now fans files
+out as ``patient_files/<aa>/<bb>/<uuid><ext>``, like blobs and previews, so
+no directory grows past a few thousand entries.
+
+Rows are migrated in batches. The files of a batch are copied to their
+new names by a pool of threads (a hard link on local disk, so nothing is
+rewritten), then the batch's paths are updated in one transaction, and
+only then are the old names removed. An interruption leaves at worst an
+unreferenced copy, which ``scan_orphan_files`` cleans up; re-running the
+command picks up the rows that still have old paths.
+
+New copies get a fresh modification time so the orphan scan's age check
+protects them until their rows are updated. Even so, do not run
+``scan_orphan_files --delete`` while a migration is in progress.
+"""
+import os
+import shutil
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .archives import schedule_archives
+from .models import PatientFile, patient_file_upload_to
+from .storage import local_path
+
+BATCH_SIZE = 500
+# Names already in the layout of patient_file_upload_to.
+SHARDED_RE = r'^patient_files/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}'
+
+Move = namedtuple('Move', 'file_id old_name new_name')
+
+
+def legacy_files():
+    """Files (including tombstoned ones) still stored outside the blob store under old names."""
+    return (
+        PatientFile.all_objects.filter(blob__isnull=True, file__startswith='patient_files/')
+        .exclude(file__regex=SHARDED_RE)
+    )
+
+
+def _copy(move, storage=default_storage):
+    """Give ``move.old_name``'s content the new name; returns ``(move, error)``."""
+    old_path = local_path(move.old_name, storage)
+    try:
+        if old_path is not None:
+            new_path = local_path(move.new_name, storage)
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            try:
+                os.link(old_path, new_path)
+            except OSError:
+                if not os.path.exists(old_path):
+                    raise
+                # Hard links unsupported here (or across devices): copy instead.
+                shutil.copyfile(old_path, new_path)
+            # A link shares the old file's mtime; the orphan scan must see a new file.
+            os.utime(new_path)
+        else:
+            with storage.open(move.old_name, 'rb') as fh:
+                saved = storage.save(move.new_name, File(fh, name=os.path.basename(move.new_name)))
+            if saved != move.new_name:
+                storage.delete(saved)
+                raise OSError(f'{move.new_name} already exists')
+    except FileNotFoundError:
+        return move, 'file not found'
+    except OSError as e:
+        return move, str(e)
+    return move, None
+
+
+def migrate_batch(files, pool, skip):
+    """
+    Move one batch of ``PatientFile`` rows to sharded names; returns the
+    number moved. ``skip(patient_file, reason)`` is called for files that
+    could not be copied, which keep their old name.
+    """
+    by_id = {f.id: f for f in files}
+    moves = [Move(f.id, f.file.name, patient_file_upload_to(f, f.file.name)) for f in files]
+    done = []
+    for move, error in pool.imap_unordered(_copy, moves):
+        if error:
+            skip(by_id[move.file_id], error)
+        else:
+            done.append(move)
+    if not done:
+        return 0
+
+    updated = []
+    for move in done:
+        f = by_id[move.file_id]
+        # Keep the name users see; it used to come from the stored name.
+        f.original_name = f.original_name or os.path.basename(move.old_name)
+        f.file.name = move.new_name
+        updated.append(f)
+    with transaction.atomic():
+        PatientFile.all_objects.bulk_update(updated, ['file', 'original_name'])
+    # Archive versions of legacy files include their stored name.
+    schedule_archives({f.group_id for f in updated if f.deleted_at is None})
+
+    # Rows sharing a stored name each get their own copy; the last one removes it.
+    old_names = {move.old_name for move in done}
+    old_names -= set(PatientFile.all_objects.filter(file__in=old_names).values_list('file', flat=True))
+    list(pool.imap_unordered(default_storage.delete, old_names))
+    return len(done)
+
+
+def migrate_all(threads=8, batch_size=BATCH_SIZE, report=None, skip=None):
+    """
+    Move every legacy file; returns ``(moved, skipped)``. ``report(moved, skipped)``
+    is called after every batch.
+    """
+    report = report or (lambda moved, skipped: None)
+    skipped_ids = []
+
+    def on_skip(patient_file, reason):
+        skipped_ids.append(patient_file.id)
+        if skip:
+            skip(patient_file, reason)
+
+    moved = 0
+    last_id = 0
+    with ThreadPool(threads) as pool:
+        while True:
+            # Keyset over ids, so files that failed are not fetched again.
+            batch = list(legacy_files().filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            moved += migrate_batch(batch, pool, on_skip)
+            report(moved, len(skipped_ids))
+    return moved, len(skipped_ids)
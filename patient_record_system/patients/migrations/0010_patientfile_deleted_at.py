@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0009_uploadsession_uploadchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientfile',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0010_patientfile_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientfile',
+            index=models.Index(fields=['patient', 'group', 'uploaded_at'], name='patientfile_listing_idx'),
+        ),
+    ]
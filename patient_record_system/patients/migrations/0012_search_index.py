@@ -0,0 +1,56 @@
+# Full-text search index tables (see patients/search.py)
+
+from django.db import migrations
+
+
+SQLITE_CREATE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS patients_search_fts USING fts5(
+    patient_id UNINDEXED, title, description, group_name, body,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE IF NOT EXISTS patients_search_pg (
+        file_id bigint PRIMARY KEY,
+        patient_id bigint NOT NULL,
+        title text NOT NULL DEFAULT '',
+        description text NOT NULL DEFAULT '',
+        group_name text NOT NULL DEFAULT '',
+        body text NOT NULL DEFAULT '',
+        document tsvector
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS patients_search_pg_document ON patients_search_pg USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS patients_search_pg_patient ON patients_search_pg (patient_id)",
+]
+
+
+def create_search_tables(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_tables(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS patients_search_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS patients_search_pg")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0011_patientfile_patientfile_listing_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:59
+
+import django.db.models.deletion
+import patients.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0012_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Derivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('thumbnail', 'Thumbnail'), ('preview', 'Preview')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed'), ('unsupported', 'Unsupported')], default='pending', max_length=20)),
+                ('file', models.FileField(blank=True, upload_to=patients.models.derivative_upload_to)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='derivatives', to='patients.fileblob')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('blob', 'kind'), name='unique_blob_derivative')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:04
+
+import django.db.models.deletion
+import patients.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0013_derivative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=64)),
+                ('file', models.FileField(blank=True, upload_to=patients.models.archive_upload_to)),
+                ('entries', models.JSONField(default=list)),
+                ('size', models.BigIntegerField(default=0)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='patients.recordgroup')),
+            ],
+        ),
+    ]
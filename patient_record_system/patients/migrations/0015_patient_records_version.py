@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0014_grouparchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='records_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
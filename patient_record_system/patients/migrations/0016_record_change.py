@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_change_log(apps, schema_editor):
+    """Start each patient's feed with the groups and files that already exist."""
+    Patient = apps.get_model('patients', 'Patient')
+    RecordGroup = apps.get_model('patients', 'RecordGroup')
+    PatientFile = apps.get_model('patients', 'PatientFile')
+    RecordChange = apps.get_model('patients', 'RecordChange')
+
+    for patient in Patient.objects.all().iterator():
+        entries = [
+            ('group', pk) for pk in RecordGroup.objects.filter(patient=patient).order_by('id').values_list('id', flat=True)
+        ]
+        entries += [
+            ('file', pk) for pk in PatientFile.objects.filter(patient=patient, deleted_at__isnull=True)
+            .order_by('id').values_list('id', flat=True)
+        ]
+        if not entries:
+            continue
+        first = patient.records_version + 1
+        RecordChange.objects.bulk_create([
+            RecordChange(patient=patient, seq=first + n, kind=kind, object_id=pk, action='upsert')
+            for n, (kind, pk) in enumerate(entries)
+        ], batch_size=1000)
+        Patient.objects.filter(id=patient.id).update(records_version=first + len(entries) - 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0015_patient_records_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField()),
+                ('kind', models.CharField(choices=[('file', 'File'), ('group', 'Group')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Created or updated'), ('delete', 'Deleted')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='patients.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'kind', 'object_id'], name='recordchange_object_idx')],
+                'constraints': [models.UniqueConstraint(fields=('patient', 'seq'), name='unique_patient_change_seq')],
+            },
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0016_record_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileblob',
+            name='last_accessed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0017_fileblob_last_accessed_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recordchange',
+            name='kind',
+            field=models.CharField(choices=[('file', 'File'), ('group', 'Group'), ('patient', 'Patient')], max_length=10),
+        ),
+    ]
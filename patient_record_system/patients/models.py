@@ -1,14 +1,23 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 import os
+import uuid
 
 
 # ---------- Helper Function ----------
 def patient_file_upload_to(instance, filename):
-    """Store files under /media/patient_files/<patient_id>/timestamp_filename"""
-    timestamp = int(timezone.now().timestamp())
-    return f'patient_files/{instance.patient.id}/{timestamp}_{filename}'
+    """Store files under /media/patient_files/<aa>/<bb>/<uuid><ext>"""
+    ext = os.path.splitext(filename)[1].lower()[:10]
+    key = uuid.uuid4().hex
+    return f'patient_files/{key[:2]}/{key[2:4]}/{key}{ext}'
+
+
+def blob_upload_to(instance, filename):
+    """Store blobs under /media/blobs/<aa>/<bb>/<sha256><ext>"""
+    ext = os.path.splitext(filename)[1].lower()[:10]
+    digest = instance.sha256
+    return f'blobs/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
 
 
 # ---------- Core Models ----------
@@ -19,10 +28,93 @@ class Patient(models.Model):
     contact_number = models.CharField(max_length=15, blank=True, null=True)
     aadhaar_hash = models.CharField(max_length=128, blank=True, null=True, unique=True)
     masked_aadhaar = models.CharField(max_length=20, blank=True, null=True)
+    # Sequence number of the latest RecordChange; also used for API ETags.
+    records_version = models.PositiveBigIntegerField(default=0)
+
+    # Fields served by the API; changing one adds a change-feed entry.
+    PROFILE_FIELDS = ('name', 'dob', 'contact_number', 'masked_aadhaar')
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_profile = instance._profile()
+        return instance
+
+    def _profile(self):
+        return tuple(self.__dict__.get(name) for name in self.PROFILE_FIELDS)
+
+    def save(self, *args, **kwargs):
+        """
+        Never write ``records_version`` back (only record_changes() advances
+        it), and record profile edits so API ETags and the change feed move on.
+        """
+        creating = self._state.adding
+        if not creating and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'records_version'
+            ]
+        super().save(*args, **kwargs)
+
+        if not creating and self._profile() != getattr(self, '_saved_profile', None):
+            record_changes([(self.id, RecordChange.PATIENT, self.id, RecordChange.UPSERT)])
+            self.records_version = Patient.objects.filter(id=self.id).values_list('records_version', flat=True).get()
+        self._saved_profile = self._profile()
+
+
+class FileBlob(models.Model):
+    """One physical copy of an uploaded file, shared by every PatientFile with the same content."""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_upload_to)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last download, to the day; idle blobs move to cold storage (tier_storage).
+    last_accessed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.sha256
+
+
+def derivative_upload_to(instance, filename):
+    """Store previews under /media/previews/<aa>/<bb>/<sha256>-<kind>.webp"""
+    digest = instance.blob.sha256
+    return f'previews/{digest[:2]}/{digest[2:4]}/{digest}-{instance.kind}.webp'
+
+
+class Derivative(models.Model):
+    """A generated thumbnail or preview image, shared by all files with the same content."""
+    THUMBNAIL = 'thumbnail'
+    PREVIEW = 'preview'
+    KIND_CHOICES = [(THUMBNAIL, 'Thumbnail'), (PREVIEW, 'Preview')]
+
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    UNSUPPORTED = 'unsupported'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+        (UNSUPPORTED, 'Unsupported'),
+    ]
+
+    blob = models.ForeignKey(FileBlob, on_delete=models.CASCADE, related_name='derivatives')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    file = models.FileField(upload_to=derivative_upload_to, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['blob', 'kind'], name='unique_blob_derivative'),
+        ]
+
+    def __str__(self):
+        return f'{self.blob} {self.kind} ({self.status})'
+
 
 class RecordGroup(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='groups')
@@ -33,25 +125,220 @@ class RecordGroup(models.Model):
         return self.name
 
 
+def archive_upload_to(instance, filename):
+    """
+    Store group archives under /media/archives/<aa>/<bb>/<group_id>-<version>-<build>.zip;
+    every build gets its own name, so overlapping builds never write the same file.
+    """
+    version = instance.version
+    return f'archives/{version[:2]}/{version[2:4]}/{instance.group_id}-{version[:16]}-{uuid.uuid4().hex[:8]}.zip'
+
+
+class GroupArchive(models.Model):
+    """A prebuilt ZIP of a RecordGroup, valid while ``version`` matches the group's files."""
+    group = models.OneToOneField(RecordGroup, on_delete=models.CASCADE, related_name='archive')
+    version = models.CharField(max_length=64)
+    file = models.FileField(upload_to=archive_upload_to, blank=True)
+    # [file_id, content digest] in archive order, so new files can be appended.
+    entries = models.JSONField(default=list)
+    size = models.BigIntegerField(default=0)
+    built_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.group} ({self.version[:12]})'
+
+
+class PatientFileQuerySet(models.QuerySet):
+    def with_previews(self):
+        """Annotate ``has_thumbnail`` so listings only request thumbnails that exist."""
+        return self.annotate(has_thumbnail=models.Exists(Derivative.objects.filter(
+            blob=models.OuterRef('blob'), kind=Derivative.THUMBNAIL, status=Derivative.READY,
+        )))
+
+    def tombstone(self):
+        """Mark files as deleted; collect_deleted_files removes rows and blobs later."""
+        files = list(self.values_list('patient_id', 'id'))
+        count = self.update(deleted_at=timezone.now())
+        record_changes(
+            (patient_id, RecordChange.FILE, file_id, RecordChange.DELETE) for patient_id, file_id in files
+        )
+        return count
+
+
+class LiveFileManager(models.Manager.from_queryset(PatientFileQuerySet)):
+    """Hide files that are waiting for the background collector."""
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class PatientFile(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='files')
     group = models.ForeignKey(RecordGroup, on_delete=models.SET_NULL, null=True, blank=True)
     title = models.CharField(max_length=255, blank=True)
     description = models.TextField(blank=True)
     file = models.FileField(upload_to=patient_file_upload_to)
+    blob = models.ForeignKey(FileBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='references')
+    original_name = models.CharField(max_length=255, blank=True)
+    size = models.BigIntegerField(default=0)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = LiveFileManager()
+    all_objects = PatientFileQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves keyset-paginated listings per patient and per group.
+            models.Index(fields=['patient', 'group', 'uploaded_at'], name='patientfile_listing_idx'),
+        ]
 
     def __str__(self):
-        return self.title or os.path.basename(self.file.name)
+        return self.title or self.filename
 
-    def delete(self, *args, **kwargs):
+    @property
+    def filename(self):
+        return self.original_name or os.path.basename(self.file.name)
+
+    def save(self, *args, **kwargs):
         """
-        Ensure the physical file is deleted from /media when record is deleted.
+        Route new uploads through the blob store so identical content is stored once.
+        The blob reference is taken in the same transaction as the row.
         """
+        if not self.file or self.file._committed:
+            return super().save(*args, **kwargs)
+
+        from .blobstore import acquire, discard
+
+        upload_name = self.file.name
+        blob = None
         try:
-            if self.file and os.path.isfile(self.file.path):
-                os.remove(self.file.path)
+            with transaction.atomic():
+                blob = acquire(self.file.file)
+                self.original_name = self.original_name or os.path.basename(upload_name)
+                self.blob = blob
+                self.size = blob.size
+                self.file.name = blob.file.name
+                self.file._committed = True
+                super().save(*args, **kwargs)
         except Exception:
-            pass
+            if blob is not None:
+                discard([blob])
+                self.blob = None
+                self.file.name = upload_name
+                self.file._committed = False
+            raise
+
+    def delete(self, *args, **kwargs):
+        """
+        Ensure the physical file is deleted from /media when record is deleted.
+        Blob-backed files are only removed once their last reference goes.
+        """
+        blob_id = self.blob_id
+        if not blob_id:
+            remove_legacy_file(self.file)
+
+        result = super().delete(*args, **kwargs)
+
+        if blob_id:
+            from .blobstore import release
+
+            release([blob_id])
+        return result
+
+
+def remove_legacy_file(field_file):
+    """Delete a file stored outside the blob store (pre-deduplication uploads)."""
+    try:
+        if field_file:
+            field_file.storage.delete(field_file.name)
+    except Exception:
+        pass
+
+
+class UploadSession(models.Model):
+    """A resumable (tus-style) upload whose chunks are written straight to disk."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='upload_sessions')
+    group = models.ForeignKey(RecordGroup, on_delete=models.SET_NULL, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, blank=True)
+    description = models.TextField(blank=True)
+    length = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    patient_file = models.ForeignKey(PatientFile, on_delete=models.SET_NULL, null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.id})'
+
+
+class UploadChunk(models.Model):
+    """A byte range of an UploadSession, received and checksummed or (``sha256`` pending) being written."""
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    offset = models.BigIntegerField()
+    length = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'offset'], name='unique_upload_chunk_offset'),
+        ]
+
+
+class RecordChange(models.Model):
+    """One entry in a patient's change feed, read by offline clients to sync."""
+    FILE = 'file'
+    GROUP = 'group'
+    PATIENT = 'patient'
+    KIND_CHOICES = [(FILE, 'File'), (GROUP, 'Group'), (PATIENT, 'Patient')]
+
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTION_CHOICES = [(UPSERT, 'Created or updated'), (DELETE, 'Deleted')]
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='changes')
+    seq = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'seq'], name='unique_patient_change_seq'),
+        ]
+        indexes = [
+            models.Index(fields=['patient', 'kind', 'object_id'], name='recordchange_object_idx'),
+        ]
+
+    def __str__(self):
+        return f'#{self.seq} {self.action} {self.kind} {self.object_id}'
+
+
+def record_changes(changes):
+    """
+    Append ``(patient_id, kind, object_id, action)`` entries to the change
+    feed. Each patient's ``records_version`` is advanced by the number of
+    entries and numbers them, so sequence numbers only ever grow per patient.
+    """
+    by_patient = {}
+    for patient_id, kind, object_id, action in changes:
+        if patient_id:
+            by_patient.setdefault(patient_id, []).append((kind, object_id, action))
+    if not by_patient:
+        return
 
-        super().delete(*args, **kwargs)
+    rows = []
+    with transaction.atomic():
+        for patient_id, entries in by_patient.items():
+            # The UPDATE locks the patient row until commit, so concurrent writers get later numbers.
+            if not Patient.objects.filter(id=patient_id).update(
+                    records_version=models.F('records_version') + len(entries)):
+                continue
+            last = Patient.objects.filter(id=patient_id).values_list('records_version', flat=True).get()
+            first = last - len(entries) + 1
+            rows.extend(
+                RecordChange(patient_id=patient_id, seq=first + n, kind=kind, object_id=object_id, action=action)
+                for n, (kind, object_id, action) in enumerate(entries)
+            )
+        RecordChange.objects.bulk_create(rows)
@@ -0,0 +1,56 @@
+"""
+Keyset (cursor) pagination for record listings.
+
+Pages are ordered newest first on ``(<timestamp field>, id)`` and each page
+continues strictly after the last row of the previous one, so fetching
+page 100 costs the same as page 1, unlike OFFSET pagination.
+"""
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+PAGE_SIZE = 50
+
+
+def encode_cursor(timestamp, pk):
+    raw = f'{timestamp.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(timestamp, pk)`` or None for a missing or malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if timestamp is None:
+        return None
+    return timestamp, pk
+
+
+def keyset_page(queryset, cursor=None, page_size=PAGE_SIZE, field='uploaded_at'):
+    """
+    Return ``(items, next_cursor)`` for one page of ``queryset``.
+
+    ``next_cursor`` is None on the last page.
+    """
+    queryset = queryset.order_by(f'-{field}', '-id')
+    position = decode_cursor(cursor)
+    if position:
+        timestamp, pk = position
+        queryset = queryset.filter(Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk}))
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return items, next_cursor
@@ -0,0 +1,128 @@
+"""
+Thumbnail and preview generation for uploaded images and PDFs.
+
+Derivatives are WebP images rendered from the first page of a document and
+keyed by the content hash of its blob, so a duplicated upload reuses the
+previews already made. New uploads queue a ``patients.generate_previews``
+background job; ``manage.py generate_previews`` fills in anything missing
+(e.g. for uploads made before previews existed).
+
+PDF rendering needs the optional PyMuPDF package (``fitz``); without it
+PDFs are marked unsupported and listings show no preview.
+"""
+import logging
+import mimetypes
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+try:
+    import fitz
+except ImportError:  # pragma: no cover - optional dependency
+    fitz = None
+
+from jobs.queue import enqueue
+
+from .models import Derivative, FileBlob
+from .storage import local_path
+
+logger = logging.getLogger(__name__)
+
+SIZES = {
+    Derivative.THUMBNAIL: (200, 200),
+    Derivative.PREVIEW: (1000, 1000),
+}
+WEBP_QUALITY = 80
+# Refuse to decode images larger than this many pixels.
+MAX_SOURCE_PIXELS = 100_000_000
+
+
+def render_first_page(blob):
+    """Return a PIL image of the blob's content (first page for PDFs), or None if unsupported."""
+    mime_type, _ = mimetypes.guess_type(blob.file.name)
+    largest = max(SIZES.values())
+
+    if mime_type and mime_type.startswith('image/'):
+        with blob.file.open('rb') as f:
+            image = Image.open(f)
+            if image.width * image.height > MAX_SOURCE_PIXELS:
+                raise ValueError('Image is too large to preview.')
+            # Let JPEG decode at reduced scale instead of full resolution.
+            image.draft('RGB', largest)
+            image = ImageOps.exif_transpose(image)
+            image.load()
+        return image
+
+    if mime_type == 'application/pdf' and fitz is not None:
+        path = local_path(blob.file.name)
+        if path is not None:
+            document = fitz.open(path)
+        else:
+            with blob.file.open('rb') as fh:
+                document = fitz.open(stream=fh.read(), filetype='pdf')
+        try:
+            page = document[0]
+            zoom = max(largest) / max(page.rect.width, page.rect.height)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+        finally:
+            document.close()
+
+    return None
+
+
+def generate_for_blob(blob_id):
+    """Render every derivative of one blob, recording the outcome on its Derivative rows."""
+    blob = FileBlob.objects.filter(id=blob_id).first()
+    if blob is None:
+        return
+    derivatives = {d.kind: d for d in Derivative.objects.filter(blob=blob)}
+
+    try:
+        image = render_first_page(blob)
+    except Exception:
+        logger.exception('Preview rendering failed for blob %s', blob.sha256)
+        Derivative.objects.filter(blob=blob).update(status=Derivative.FAILED)
+        return
+
+    if image is None:
+        Derivative.objects.filter(blob=blob).update(status=Derivative.UNSUPPORTED)
+        return
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    for kind, size in SIZES.items():
+        derivative = derivatives.get(kind) or Derivative(blob=blob, kind=kind)
+        resized = image.copy()
+        resized.thumbnail(size)
+        buffer = BytesIO()
+        resized.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+        if derivative.file:
+            derivative.file.delete(save=False)
+        derivative.file.save(f'{kind}.webp', ContentFile(buffer.getvalue()), save=False)
+        derivative.status = Derivative.READY
+        derivative.save()
+
+
+def schedule_previews(blob_ids):
+    """
+    Queue derivative generation for blobs that have none yet.
+
+    Pending rows are created right away; rendering happens in a job that
+    workers pick up once the surrounding transaction commits.
+    """
+    blob_ids = set(filter(None, blob_ids))
+    if not blob_ids:
+        return
+    known = set(Derivative.objects.filter(blob_id__in=blob_ids).values_list('blob_id', flat=True))
+    new_ids = blob_ids - known
+    if not new_ids:
+        return
+
+    Derivative.objects.bulk_create(
+        [Derivative(blob_id=blob_id, kind=kind) for blob_id in new_ids for kind in SIZES],
+        ignore_conflicts=True,
+    )
+    enqueue('patients.generate_previews', blob_ids=sorted(new_ids))
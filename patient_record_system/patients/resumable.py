@@ -0,0 +1,230 @@
+"""
+Resumable chunked uploads (a subset of the tus 1.0 protocol).
+
+A client creates an upload with its total length, then PATCHes chunks at
+any offset, in any order and in parallel. Each chunk is streamed straight
+into a preallocated file under ``RESUMABLE_UPLOAD_ROOT`` and checksummed;
+only chunks that arrive complete are recorded, so a dropped connection
+costs just the chunk in flight. A chunk reserves its byte range before it
+is written, and chunks overlapping another range are refused (409), so
+bytes once acknowledged never change. Once every byte is present the file is
+handed to the blob store and a PatientFile is created.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import PatientFile, UploadChunk, UploadSession
+
+TUS_VERSION = '1.0.0'
+READ_SIZE = 64 * 1024
+# sha256 of a chunk that is still being written, followed by its writer's token.
+PENDING = 'pending:'
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def part_path(session):
+    return os.path.join(settings.RESUMABLE_UPLOAD_ROOT, f'{session.id}.part')
+
+
+def parse_metadata(header):
+    """Decode a tus ``Upload-Metadata`` header: ``key base64value,key2 base64value2``."""
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in (header or '').split(','))):
+        key, _, value = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(value).decode() if value else ''
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(f"Invalid Upload-Metadata value for '{key}'.")
+    return metadata
+
+
+def parse_checksum(header):
+    """Return the expected hex SHA-256 from an ``Upload-Checksum: sha256 <base64>`` header."""
+    if not header:
+        return None
+    algorithm, _, value = header.partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise UploadError('Only sha256 checksums are supported.')
+    try:
+        return base64.b64decode(value).hex()
+    except binascii.Error:
+        raise UploadError('Invalid Upload-Checksum value.')
+
+
+def create_session(patient, length, metadata):
+    if length < 0:
+        raise UploadError('Upload-Length must not be negative.')
+    if length > settings.RESUMABLE_UPLOAD_MAX_SIZE:
+        raise UploadError('Upload is larger than the allowed maximum.', status=413)
+
+    group = None
+    group_id = metadata.get('group')
+    if group_id:
+        group = patient.groups.filter(id=group_id).first()
+        if group is None:
+            raise UploadError('Unknown record group.')
+
+    filename = os.path.basename(metadata.get('filename', '')) or 'upload'
+    session = UploadSession.objects.create(
+        patient=patient,
+        group=group,
+        filename=filename,
+        title=metadata.get('title', ''),
+        description=metadata.get('description', ''),
+        length=length,
+    )
+
+    # Preallocate a sparse file so chunks can be written at any offset.
+    os.makedirs(settings.RESUMABLE_UPLOAD_ROOT, exist_ok=True)
+    with open(part_path(session), 'wb') as part:
+        part.truncate(length)
+    return session
+
+
+def received_ranges(session):
+    """Merge recorded chunks into sorted, non-overlapping ``(start, end)`` ranges."""
+    ranges = []
+    chunks = session.chunks.exclude(sha256__startswith=PENDING).order_by('offset')
+    for offset, length in chunks.values_list('offset', 'length'):
+        end = offset + length
+        if ranges and offset <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([offset, end])
+    return [tuple(r) for r in ranges]
+
+
+def received_offset(session):
+    """Length of the contiguous prefix received so far (tus ``Upload-Offset``)."""
+    ranges = received_ranges(session)
+    if ranges and ranges[0][0] == 0:
+        return ranges[0][1]
+    return 0
+
+
+def _reserve(session, offset, length):
+    """
+    Claim the range for one writer. Returns ``(token, None)`` for a new range,
+    or ``(None, sha256)`` when exactly this range was already received.
+    """
+    token = PENDING + uuid.uuid4().hex
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.completed_at:
+            raise UploadError('Upload already completed.', status=409)
+        chunks = session.chunks.annotate(end=F('offset') + F('length'))
+        clashes = list(chunks.filter(Q(offset=offset) | Q(offset__lt=offset + length, end__gt=offset)))
+        if any(c.offset != offset or c.length != length for c in clashes):
+            raise UploadError('Chunk overlaps bytes already received or being written.', status=409)
+        if clashes and not clashes[0].sha256.startswith(PENDING):
+            return None, clashes[0].sha256
+        # A pending range is taken over by an exact resend: its first attempt dropped.
+        UploadChunk.objects.update_or_create(
+            session=session, offset=offset, defaults={'length': length, 'sha256': token},
+        )
+    return token, None
+
+
+def _read_chunk(stream, length, part=None):
+    """Hash ``length`` bytes of ``stream``, writing them to ``part`` if given; returns the hex digest."""
+    hasher = hashlib.sha256()
+    remaining = length
+    while remaining:
+        data = stream.read(min(READ_SIZE, remaining))
+        if not data:
+            raise UploadError('Chunk was truncated; resend it.')
+        if part is not None:
+            part.write(data)
+        hasher.update(data)
+        remaining -= len(data)
+    return hasher.hexdigest()
+
+
+def write_chunk(session, offset, length, stream, checksum=None):
+    """
+    Stream ``length`` bytes from ``stream`` into the part file at ``offset``.
+
+    Chunks may not overlap bytes already received (or being written), which
+    stay as they were checksummed; resending exactly a received chunk only
+    verifies it. Returns the UploadSession's PatientFile once the last
+    missing chunk lands, otherwise None.
+    """
+    if session.completed_at:
+        raise UploadError('Upload already completed.', status=409)
+    if offset < 0 or length < 0 or offset + length > session.length:
+        raise UploadError('Chunk lies outside the upload.', status=416)
+
+    token, received = _reserve(session, offset, length)
+    if token is None:
+        digest = _read_chunk(stream, length)
+        if checksum and checksum != digest:
+            raise UploadError('Checksum mismatch.', status=460)
+        if digest != received:
+            raise UploadError('Chunk differs from the bytes already received.', status=409)
+    else:
+        reservation = UploadChunk.objects.filter(session=session, offset=offset, sha256=token)
+        try:
+            with open(part_path(session), 'r+b') as part:
+                part.seek(offset)
+                digest = _read_chunk(stream, length, part)
+            if checksum and checksum != digest:
+                raise UploadError('Checksum mismatch.', status=460)
+        except BaseException:
+            reservation.delete()
+            raise
+        if not reservation.update(sha256=digest):
+            raise UploadError('Chunk was resent while it was being written; resend it.', status=409)
+
+    if received_offset(session) == session.length:
+        return finalize(session)
+    return None
+
+
+def finalize(session):
+    """Turn a fully received upload into a PatientFile in the chosen group."""
+    # Claim the session so parallel final chunks only finalize once.
+    if not UploadSession.objects.filter(pk=session.pk, completed_at__isnull=True).update(completed_at=timezone.now()):
+        session.refresh_from_db()
+        return session.patient_file
+
+    path = part_path(session)
+    try:
+        with open(path, 'rb') as part:
+            upload = File(part, name=session.filename)
+            patient_file = PatientFile.objects.create(
+                patient=session.patient,
+                group=session.group,
+                title=session.title or session.filename,
+                description=session.description,
+                file=upload,
+            )
+    except Exception:
+        UploadSession.objects.filter(pk=session.pk).update(completed_at=None)
+        raise
+
+    UploadSession.objects.filter(pk=session.pk).update(patient_file=patient_file)
+    session.chunks.all().delete()
+    os.remove(path)
+    return patient_file
+
+
+def abort(session):
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
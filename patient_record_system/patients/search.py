@@ -0,0 +1,265 @@
+"""
+Full-text search over patient records.
+
+Each PatientFile is indexed with its title, description, group name and
+the text extracted from the document itself. The index lives in a
+backend-specific table next to the regular schema:
+
+* ``sqlite_fts`` - an FTS5 virtual table ranked with bm25 (default on SQLite)
+* ``postgres``   - a weighted tsvector column with a GIN index (default on PostgreSQL)
+* ``like``       - no index; falls back to ``icontains`` on title/description
+
+The backend is picked from the database vendor unless
+``settings.RECORD_SEARCH_BACKEND`` names one. The index is kept up to date
+incrementally: single saves/deletes through signals, bulk paths
+(``ingest_files``, regrouping) by calling ``index_files``/``refresh_files``.
+New uploads are indexed by metadata at once; reading the document text
+is done by a background job.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .extraction import extract_text
+from .models import PatientFile
+from .pagination import PAGE_SIZE
+
+SQLITE_TABLE = 'patients_search_fts'
+POSTGRES_TABLE = 'patients_search_pg'
+
+FILE_TABLE = PatientFile._meta.db_table
+
+# Most results a single search returns.
+SEARCH_LIMIT = 100
+MAX_QUERY_TERMS = 8
+
+_backend = None
+
+
+def query_terms(query):
+    return re.findall(r'\w+', (query or '').lower())[:MAX_QUERY_TERMS]
+
+
+def _live_files(group):
+    """SQL condition on the joined PatientFile row ``f``: not deleted, and in ``group`` (0 = ungrouped) if given."""
+    if group is None:
+        return 'f.deleted_at IS NULL', []
+    if group == 0:
+        return 'f.deleted_at IS NULL AND f.group_id IS NULL', []
+    return 'f.deleted_at IS NULL AND f.group_id = %s', [group]
+
+
+class LikeBackend:
+    """No index; used when the database has no full-text support."""
+
+    def index(self, rows):
+        pass
+
+    def update_metadata(self, rows):
+        return set()
+
+    def remove(self, file_ids):
+        pass
+
+    def search(self, patient_id, terms, limit, offset=0, group=None):
+        match = Q()
+        for term in terms:
+            match &= Q(title__icontains=term) | Q(description__icontains=term) | Q(group__name__icontains=term)
+        files = PatientFile.objects.filter(match, patient_id=patient_id)
+        if group is not None:
+            files = files.filter(group_id=group or None)
+        return list(files.order_by('-uploaded_at', '-id').values_list('id', flat=True)[offset:offset + limit])
+
+
+class SQLiteFTSBackend:
+    def index(self, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {SQLITE_TABLE} '
+                '(rowid, patient_id, title, description, group_name, body) VALUES (%s, %s, %s, %s, %s, %s)',
+                rows,
+            )
+
+    def update_metadata(self, rows):
+        """Update title/description/group name; returns ids that are not indexed yet."""
+        ids = [row[0] for row in rows]
+        with connection.cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f'SELECT rowid FROM {SQLITE_TABLE} WHERE rowid IN ({placeholders})', ids)
+            indexed = {row[0] for row in cursor.fetchall()}
+            cursor.executemany(
+                f'UPDATE {SQLITE_TABLE} SET title = %s, description = %s, group_name = %s WHERE rowid = %s',
+                [(title, description, group_name, file_id)
+                 for file_id, title, description, group_name in rows if file_id in indexed],
+            )
+        return set(ids) - indexed
+
+    def remove(self, file_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s', [(i,) for i in file_ids])
+
+    def search(self, patient_id, terms, limit, offset=0, group=None):
+        match = ' '.join('"%s"*' % term for term in terms)
+        where, params = _live_files(group)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT s.rowid FROM {SQLITE_TABLE} s JOIN {FILE_TABLE} f ON f.id = s.rowid '
+                f'WHERE {SQLITE_TABLE} MATCH %s AND s.patient_id = %s AND {where} '
+                # Column weights: patient_id, title, description, group_name, body
+                f'ORDER BY bm25({SQLITE_TABLE}, 0, 10.0, 4.0, 4.0, 1.0), s.rowid DESC LIMIT %s OFFSET %s',
+                [match, patient_id, *params, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresBackend:
+    DOCUMENT = (
+        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(group_name, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(body, '')), 'C')"
+    )
+
+    def index(self, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {POSTGRES_TABLE} (file_id, patient_id, title, description, group_name, body) '
+                'VALUES (%s, %s, %s, %s, %s, %s) '
+                'ON CONFLICT (file_id) DO UPDATE SET patient_id = EXCLUDED.patient_id, title = EXCLUDED.title, '
+                'description = EXCLUDED.description, group_name = EXCLUDED.group_name, body = EXCLUDED.body',
+                rows,
+            )
+            cursor.execute(
+                f'UPDATE {POSTGRES_TABLE} SET document = {self.DOCUMENT} WHERE file_id = ANY(%s)',
+                [[row[0] for row in rows]],
+            )
+
+    def update_metadata(self, rows):
+        ids = [row[0] for row in rows]
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT file_id FROM {POSTGRES_TABLE} WHERE file_id = ANY(%s)', [ids])
+            indexed = {row[0] for row in cursor.fetchall()}
+            cursor.executemany(
+                f'UPDATE {POSTGRES_TABLE} SET title = %s, description = %s, group_name = %s WHERE file_id = %s',
+                [(title, description, group_name, file_id)
+                 for file_id, title, description, group_name in rows if file_id in indexed],
+            )
+            cursor.execute(
+                f'UPDATE {POSTGRES_TABLE} SET document = {self.DOCUMENT} WHERE file_id = ANY(%s)',
+                [list(indexed)],
+            )
+        return set(ids) - indexed
+
+    def remove(self, file_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {POSTGRES_TABLE} WHERE file_id = ANY(%s)', [list(file_ids)])
+
+    def search(self, patient_id, terms, limit, offset=0, group=None):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        where, params = _live_files(group)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT s.file_id FROM {POSTGRES_TABLE} s JOIN {FILE_TABLE} f ON f.id = s.file_id, "
+                "to_tsquery('simple', %s) query "
+                f'WHERE s.patient_id = %s AND s.document @@ query AND {where} '
+                'ORDER BY ts_rank(s.document, query) DESC, s.file_id DESC LIMIT %s OFFSET %s',
+                [tsquery, patient_id, *params, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite_fts': SQLiteFTSBackend,
+    'postgres': PostgresBackend,
+    'like': LikeBackend,
+}
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'RECORD_SEARCH_BACKEND', None)
+        if not name:
+            name = {'sqlite': 'sqlite_fts', 'postgresql': 'postgres'}.get(connection.vendor, 'like')
+        _backend = BACKENDS[name]()
+    return _backend
+
+
+# -----------------------------------------
+# Index maintenance
+# -----------------------------------------
+def _group_name(file):
+    return file.group.name if file.group_id else ''
+
+
+def index_files(files, extract=True):
+    """
+    (Re)index ``files``. With ``extract=False`` only the metadata is
+    indexed and the document text is left for a ``patients.index_documents`` job.
+    """
+    rows = []
+    bodies = {}
+    for f in files:
+        # Deduplicated uploads share a blob, so extract each blob once.
+        key = f.blob_id or f.file.name
+        if key not in bodies:
+            bodies[key] = extract_text(f.file, f.filename) if extract and f.file else ''
+        rows.append((f.id, f.patient_id, f.title, f.description, _group_name(f), bodies[key]))
+    if rows:
+        get_backend().index(rows)
+
+
+def refresh_files(files):
+    """Re-index metadata (title, description, group) without re-reading documents."""
+    files = list(files)
+    if not files:
+        return
+    missing = get_backend().update_metadata(
+        [(f.id, f.title, f.description, _group_name(f)) for f in files]
+    )
+    if missing:
+        index_files([f for f in files if f.id in missing])
+
+
+def remove_files(file_ids):
+    file_ids = list(file_ids)
+    if file_ids:
+        get_backend().remove(file_ids)
+
+
+def _group_id(group):
+    """None for any group, 0 for ungrouped files (``'none'``), else the group id; False if invalid."""
+    if not group:
+        return None
+    if group == 'none':
+        return 0
+    return int(group) if str(group).isdigit() else False
+
+
+def search_files(patient, query, group=None, limit=SEARCH_LIMIT, offset=0):
+    """
+    Live files of ``patient`` matching ``query`` (prefix match on every
+    term), best first, optionally limited to one group (``'none'`` for
+    ungrouped files). The group filter and ``offset`` are applied by the
+    index, so later results can be paged through.
+    """
+    terms = query_terms(query)
+    group = _group_id(group)
+    if not terms or group is False:
+        return []
+    ids = get_backend().search(patient.id, terms, limit, offset, group)
+    by_id = PatientFile.objects.select_related('group').with_previews().in_bulk(ids)
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def search_page(patient, query, group=None, cursor=None, page_size=PAGE_SIZE):
+    """
+    One page of search results in rank order: ``(files, next_cursor)``.
+    The cursor is the offset of the next page (None on the last one).
+    """
+    offset = int(cursor) if cursor and str(cursor).isdigit() else 0
+    files = search_files(patient, query, group=group, limit=page_size + 1, offset=offset)
+    next_cursor = str(offset + page_size) if len(files) > page_size else None
+    return files[:page_size], next_cursor
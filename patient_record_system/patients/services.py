@@ -0,0 +1,99 @@
+import os
+
+from django.db import transaction
+
+from . import search
+from .archives import schedule_archives
+from .blobstore import acquire_many, discard
+from .models import PatientFile, RecordChange, record_changes
+from .previews import schedule_previews
+from .tasks import index_documents
+
+
+def record_listing(patient, group=None):
+    """
+    A patient's live files, optionally limited to one group (``'none'`` for
+    ungrouped files). Searches are paged by ``search.search_page`` instead.
+    """
+    files = patient.files.select_related('group').with_previews()
+    if group == 'none':
+        files = files.filter(group__isnull=True)
+    elif group:
+        files = files.filter(group_id=group) if str(group).isdigit() else files.none()
+    return files
+
+
+def ingest_files(patient, uploads=(), group=None, title='', description='', existing_ids=()):
+    """
+    Add uploaded files and move existing files into ``group`` in one go.
+
+    Uploads are written to the blob store first; the PatientFile rows are
+    then inserted with a single ``bulk_create`` and existing files are
+    regrouped with a single ``update``, all inside one transaction, so the
+    number of queries does not grow with the number of files and either
+    every file is saved or none is.
+
+    Returns one result dict per upload and per existing id, with ``name``,
+    ``status`` (``stored``, ``deduplicated``, ``grouped`` or ``not_found``)
+    and ``file_id``.
+    """
+    uploads = list(uploads)
+    existing_ids = {int(fid) for fid in existing_ids if str(fid).isdigit()}
+    results = []
+
+    with transaction.atomic():
+        blobs = acquire_many(uploads)
+        try:
+            records = PatientFile.objects.bulk_create([
+                PatientFile(
+                    patient=patient,
+                    group=group,
+                    file=blob.file.name,
+                    blob=blob,
+                    original_name=os.path.basename(upload.name),
+                    size=blob.size,
+                    title=title or upload.name,
+                    description=description,
+                )
+                for upload, blob in zip(uploads, blobs)
+            ])
+
+            found = set()
+            touched_groups = {group.id} if group else set()
+            if existing_ids:
+                files = PatientFile.objects.filter(id__in=existing_ids, patient=patient)
+                for file_id, group_id in files.values_list('id', 'group_id'):
+                    found.add(file_id)
+                    touched_groups.add(group_id)
+                files.update(group=group)
+
+            search.index_files(records, extract=False)
+            if records:
+                index_documents.enqueue(file_ids=[record.id for record in records])
+            schedule_previews(blob.id for blob in blobs)
+            search.refresh_files(PatientFile.objects.filter(id__in=found).select_related('group'))
+            schedule_archives(touched_groups)
+            record_changes(
+                (patient.id, RecordChange.FILE, file_id, RecordChange.UPSERT)
+                for file_id in [record.id for record in records] + sorted(found)
+            )
+        except Exception:
+            discard(blobs)
+            raise
+
+    stored = set()
+    for upload, blob, record in zip(uploads, blobs, records):
+        is_new = getattr(blob, 'is_new', False) and blob.sha256 not in stored
+        stored.add(blob.sha256)
+        results.append({
+            'name': upload.name,
+            'status': 'stored' if is_new else 'deduplicated',
+            'file_id': record.id,
+        })
+    for fid in sorted(existing_ids):
+        results.append({
+            'name': str(fid),
+            'status': 'grouped' if fid in found else 'not_found',
+            'file_id': fid if fid in found else None,
+        })
+    return results
@@ -0,0 +1,97 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import search
+from .archives import schedule_archives
+from .blobstore import release
+from .models import GroupArchive, Patient, PatientFile, RecordChange, RecordGroup, record_changes
+from .previews import schedule_previews
+from .tasks import index_documents
+
+
+def _deleted_directly(origin):
+    """
+    False when a row goes away because its Patient (or User) is being
+    deleted; the patient's change feed is deleted with it.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (PatientFile, RecordGroup)
+
+
+@receiver(post_save, sender=PatientFile)
+def index_saved_file(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        search.index_files([instance], extract=False)
+        index_documents.enqueue(file_ids=[instance.id])
+        schedule_previews([instance.blob_id])
+    else:
+        search.refresh_files([instance])
+    schedule_archives([instance.group_id])
+    record_changes([(instance.patient_id, RecordChange.FILE, instance.id, RecordChange.UPSERT)])
+
+
+@receiver(post_delete, sender=PatientFile)
+def unindex_deleted_file(sender, instance, origin=None, **kwargs):
+    search.remove_files([instance.id])
+    schedule_archives([instance.group_id])
+    # Tombstoned files were already reported when they were marked deleted.
+    if instance.deleted_at is None and _deleted_directly(origin):
+        record_changes([(instance.patient_id, RecordChange.FILE, instance.id, RecordChange.DELETE)])
+
+
+@receiver(post_save, sender=RecordGroup)
+def reindex_group_files(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    record_changes([(instance.patient_id, RecordChange.GROUP, instance.id, RecordChange.UPSERT)])
+    if created:
+        return
+    search.refresh_files(PatientFile.objects.filter(group=instance).select_related('group'))
+
+
+@receiver(pre_delete, sender=RecordGroup)
+def remember_group_files(sender, instance, **kwargs):
+    # Files are ungrouped via SET_NULL after this, without signals of their own.
+    instance._search_file_ids = list(PatientFile.objects.filter(group=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=RecordGroup)
+def reindex_ungrouped_files(sender, instance, origin=None, **kwargs):
+    file_ids = getattr(instance, '_search_file_ids', None)
+    if file_ids:
+        search.refresh_files(PatientFile.objects.filter(id__in=file_ids))
+    if _deleted_directly(origin):
+        record_changes(
+            [(instance.patient_id, RecordChange.GROUP, instance.id, RecordChange.DELETE)]
+            + [(instance.patient_id, RecordChange.FILE, file_id, RecordChange.UPSERT) for file_id in file_ids or ()]
+        )
+
+
+@receiver(pre_delete, sender=Patient)
+def release_patient_files(sender, instance, **kwargs):
+    """
+    Files deleted along with their patient (or user) go by cascade, without
+    PatientFile.delete(); release their blobs once the delete commits.
+    """
+    files = PatientFile.all_objects.filter(patient=instance)
+    blob_ids = list(files.exclude(blob=None).values_list('blob_id', flat=True))
+    legacy_names = list(files.filter(blob=None).exclude(file='').values_list('file', flat=True))
+    if not blob_ids and not legacy_names:
+        return
+
+    def release_files():
+        release(blob_ids)
+        for name in legacy_names:
+            default_storage.delete(name)
+    transaction.on_commit(release_files)
+
+
+@receiver(post_delete, sender=GroupArchive)
+def delete_archive_file(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.delete(save=False)
@@ -0,0 +1,531 @@
+"""
+Storage backends for patient files.
+
+Every FileField in the project stores through Django's default storage,
+so the backend is chosen with ``STORAGES['default']`` in settings:
+
+* ``django.core.files.storage.FileSystemStorage`` - MEDIA_ROOT on local disk.
+* ``patients.storage.ObjectStorage`` - an S3-compatible object store
+  (AWS S3, MinIO, Ceph...) through boto3. With ``client='local'`` objects
+  are kept in a local directory by ``LocalObjectClient`` instead, a
+  stand-in with object-store semantics (flat keys, no filesystem paths,
+  ranged reads) for development and tests.
+* ``patients.storage.TieredStorage`` - a hot backend plus a gzip-compressed
+  cold backend. ``archive()`` moves a file to the cold tier; any read of
+  an archived file recalls it to the hot tier first.
+* ``patients.storage.EncryptedStorage`` - encrypts files at rest (see
+  ``patients.encryption``) on top of any of the above.
+
+Code that builds files on local disk (archives, imports) hands them over
+with ``store_file()``, which renames them into place when the storage is
+local and uploads them otherwise.
+"""
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage, default_storage
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+from . import encryption
+
+# Objects are read with ranged GETs of this size, so seeking stays cheap.
+READ_BUFFER_SIZE = 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+# Compressing for the cold tier spills to disk above this size.
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def local_path(name, storage=default_storage):
+    """The filesystem path of ``name`` if ``storage`` keeps files on local disk, else None."""
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+def store_file(name, source_path, storage=default_storage):
+    """
+    Move the local file ``source_path`` into ``storage`` as ``name`` and
+    return the stored name. On local disk this is an atomic rename (an
+    existing file of that name is replaced); otherwise the file is uploaded
+    and ``source_path`` removed.
+    """
+    path = local_path(name, storage)
+    if path is not None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+        return name
+    with open(source_path, 'rb') as fh:
+        name = storage.save(name, File(fh, name=os.path.basename(name)))
+    os.unlink(source_path)
+    return name
+
+
+def temp_dir(name, storage=default_storage):
+    """A local directory for building files that will end up under ``name`` (same filesystem when possible)."""
+    path = local_path(name, storage)
+    if path is None:
+        return tempfile.gettempdir()
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _overwrite(storage, name, content):
+    """Replace the content of ``name`` in ``storage`` with the file-like ``content`` in one step."""
+    path = local_path(name, storage)
+    if path is not None:
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(content, dst, COPY_CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    elif isinstance(storage, ObjectStorage):
+        # A PUT replaces the object in one step.
+        storage.client.put(storage._key(name), content)
+    else:
+        raise NotImplementedError(f'Cannot rewrite files of {type(storage).__name__} in place.')
+
+
+def _build(config):
+    if isinstance(config, Storage):
+        return config
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+# -----------------------------------------
+# Object storage
+# -----------------------------------------
+class S3Client:
+    """Object access through boto3 (optional dependency)."""
+
+    def __init__(self, bucket, **options):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise ImproperlyConfigured("ObjectStorage with client='s3' needs boto3 (pip install boto3).")
+        self.bucket = bucket
+        self.s3 = boto3.client('s3', **options)
+        self.ClientError = ClientError
+
+    def put(self, key, fileobj):
+        self.s3.upload_fileobj(fileobj, self.bucket, key)
+
+    def get(self, key, start, end):
+        return self.s3.get_object(Bucket=self.bucket, Key=key, Range=f'bytes={start}-{end}')['Body'].read()
+
+    def head(self, key):
+        """``(size, last_modified)`` or None if there is no such object."""
+        try:
+            response = self.s3.head_object(Bucket=self.bucket, Key=key)
+        except self.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return response['ContentLength'], response['LastModified']
+
+    def delete(self, key):
+        self.s3.delete_object(Bucket=self.bucket, Key=key)
+
+    def list(self, prefix):
+        for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                yield item['Key']
+
+
+class LocalObjectClient:
+    """
+    Stand-in for an S3 bucket in a local directory. Objects appear
+    atomically when fully written, like uploads to an object store.
+    """
+
+    def __init__(self, bucket, location=None):
+        self.root = os.path.join(location or os.path.join(settings.BASE_DIR, 'object_store'), bucket)
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f'Invalid object key {key!r}.')
+        return path
+
+    def put(self, key, fileobj):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as fh:
+            shutil.copyfileobj(fileobj, fh, COPY_CHUNK_SIZE)
+        os.replace(tmp_path, path)
+
+    def get(self, key, start, end):
+        with open(self._path(key), 'rb') as fh:
+            fh.seek(start)
+            return fh.read(end - start + 1)
+
+    def head(self, key):
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return stat.st_size, datetime.fromtimestamp(stat.st_mtime, dt_timezone.utc)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix):
+        base = self._path(prefix) if prefix.strip('/') else self.root
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                if not filename.endswith('.tmp'):
+                    yield os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, '/')
+
+
+class _ObjectReader(io.RawIOBase):
+    """Seekable read-only view of an object; each read is a ranged GET."""
+
+    def __init__(self, client, key, size):
+        self.client = client
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        data = self.client.get(self.key, self.position, end)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+@deconstructible
+class ObjectStorage(Storage):
+    """
+    Files in an S3-compatible bucket. ``client`` is ``'s3'`` (boto3; extra
+    options such as ``endpoint_url``, ``region_name``,
+    ``aws_access_key_id`` and ``aws_secret_access_key`` go to
+    ``boto3.client``) or ``'local'`` (``LocalObjectClient`` under
+    ``location``).
+    """
+
+    def __init__(self, bucket='patient-records', prefix='', client='s3', location=None, **client_options):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        if client == 'local':
+            self.client = LocalObjectClient(bucket, location)
+        elif client == 's3':
+            self.client = S3Client(bucket, **client_options)
+        else:
+            raise ImproperlyConfigured(f"Unknown object storage client {client!r}.")
+
+    def _key(self, name):
+        name = name.replace('\\', '/').lstrip('/')
+        return f'{self.prefix}/{name}' if self.prefix else name
+
+    def _open(self, name, mode='rb'):
+        if 'r' not in mode or '+' in mode:
+            raise ValueError('Objects can only be opened for reading.')
+        head = self.client.head(self._key(name))
+        if head is None:
+            raise FileNotFoundError(name)
+        reader = _ObjectReader(self.client, self._key(name), head[0])
+        return File(io.BufferedReader(reader, buffer_size=READ_BUFFER_SIZE), name=name)
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek') and getattr(content, 'seekable', lambda: True)():
+            content.seek(0)
+        self.client.put(self._key(name), content)
+        return name
+
+    def delete(self, name):
+        self.client.delete(self._key(name))
+
+    def exists(self, name):
+        return self.client.head(self._key(name)) is not None
+
+    def size(self, name):
+        head = self.client.head(self._key(name))
+        if head is None:
+            raise FileNotFoundError(name)
+        return head[0]
+
+    def get_modified_time(self, name):
+        head = self.client.head(self._key(name))
+        if head is None:
+            raise FileNotFoundError(name)
+        return head[1]
+
+    def listdir(self, path):
+        prefix = self._key(path.rstrip('/') + '/') if path.strip('/') else self._key('')
+        dirs, files = set(), []
+        for key in self.client.list(prefix):
+            rest = key[len(prefix):].lstrip('/')
+            if '/' in rest:
+                dirs.add(rest.split('/', 1)[0])
+            elif rest:
+                files.append(rest)
+        return sorted(dirs), sorted(files)
+
+
+# -----------------------------------------
+# Tiered storage
+# -----------------------------------------
+@deconstructible
+class TieredStorage(Storage):
+    """
+    ``hot`` and ``cold`` are storage configs (``{'BACKEND': ..., 'OPTIONS': {...}}``);
+    by default MEDIA_ROOT and ``COLD_STORAGE_ROOT`` on local disk. Cold copies
+    are gzip files named ``<name>.gz``. A recalled file keeps its cold copy,
+    so archiving it again only drops the hot one.
+    """
+
+    COLD_SUFFIX = '.gz'
+
+    def __init__(self, hot=None, cold=None):
+        self.hot = _build(hot) if hot else FileSystemStorage()
+        self.cold = _build(cold) if cold else FileSystemStorage(
+            location=getattr(settings, 'COLD_STORAGE_ROOT', os.path.join(settings.BASE_DIR, 'cold_storage'))
+        )
+
+    def _cold_name(self, name):
+        return name + self.COLD_SUFFIX
+
+    def is_cold(self, name):
+        return not self.hot.exists(name) and self.cold.exists(self._cold_name(name))
+
+    def archive(self, name):
+        """Move ``name`` to the cold tier; False if it has no hot copy."""
+        if not self.hot.exists(name):
+            return False
+        cold_name = self._cold_name(name)
+        if not self.cold.exists(cold_name):
+            with tempfile.SpooledTemporaryFile(SPOOL_MAX_SIZE) as compressed:
+                with self.hot.open(name, 'rb') as src, gzip.GzipFile(fileobj=compressed, mode='wb') as gz:
+                    shutil.copyfileobj(src, gz, COPY_CHUNK_SIZE)
+                compressed.seek(0)
+                saved = self.cold.save(cold_name, File(compressed, name=os.path.basename(cold_name)))
+            if saved != cold_name:
+                # Archived concurrently; keep the first copy.
+                self.cold.delete(saved)
+        self.hot.delete(name)
+        return True
+
+    def recall(self, name):
+        """Bring an archived file back to the hot tier; False if it was not archived."""
+        if not self.is_cold(name):
+            return False
+        with self.cold.open(self._cold_name(name), 'rb') as src, gzip.GzipFile(fileobj=src, mode='rb') as gz:
+            path = local_path(name, self.hot)
+            if path is not None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.{uuid.uuid4().hex}.recall'
+                with open(tmp_path, 'wb') as dst:
+                    shutil.copyfileobj(gz, dst, COPY_CHUNK_SIZE)
+                os.replace(tmp_path, path)
+            else:
+                saved = self.hot.save(name, File(gz, name=os.path.basename(name)))
+                if saved != name:
+                    self.hot.delete(saved)
+        return True
+
+    def read_heads(self, name, size):
+        """The first ``size`` bytes of every stored copy of ``name`` (hot, then cold), without recalling it."""
+        heads = []
+        if self.hot.exists(name):
+            with self.hot.open(name, 'rb') as fh:
+                heads.append(fh.read(size))
+        if self.cold.exists(self._cold_name(name)):
+            with self.cold.open(self._cold_name(name), 'rb') as src, gzip.GzipFile(fileobj=src, mode='rb') as gz:
+                heads.append(gz.read(size))
+        return heads
+
+    def replace(self, name, content, cold=False):
+        """
+        Make the file-like ``content`` the new ``name`` and drop the copies of
+        the old content in both tiers. With ``cold=True`` it goes straight
+        to the cold tier.
+        """
+        cold_name = self._cold_name(name)
+        if not cold:
+            _overwrite(self.hot, name, content)
+            self.cold.delete(cold_name)
+            return
+        with tempfile.SpooledTemporaryFile(SPOOL_MAX_SIZE) as compressed:
+            with gzip.GzipFile(fileobj=compressed, mode='wb') as gz:
+                shutil.copyfileobj(content, gz, COPY_CHUNK_SIZE)
+            compressed.seek(0)
+            self.cold.delete(cold_name)
+            saved = self.cold.save(cold_name, File(compressed, name=os.path.basename(cold_name)))
+        if saved != cold_name:
+            self.cold.delete(saved)
+            raise OSError(f'{cold_name} was written concurrently.')
+        self.hot.delete(name)
+
+    def _open(self, name, mode='rb'):
+        self.recall(name)
+        return self.hot.open(name, mode)
+
+    def _save(self, name, content):
+        return self.hot.save(name, content)
+
+    def delete(self, name):
+        self.hot.delete(name)
+        self.cold.delete(self._cold_name(name))
+
+    def exists(self, name):
+        return self.hot.exists(name) or self.cold.exists(self._cold_name(name))
+
+    def size(self, name):
+        self.recall(name)
+        return self.hot.size(name)
+
+    def path(self, name):
+        self.recall(name)
+        return self.hot.path(name)
+
+    def url(self, name):
+        return self.hot.url(name)
+
+    def get_modified_time(self, name):
+        if self.hot.exists(name):
+            return self.hot.get_modified_time(name)
+        return self.cold.get_modified_time(self._cold_name(name))
+
+    def listdir(self, path):
+        dirs, files = set(), set()
+        for storage, suffix in ((self.hot, ''), (self.cold, self.COLD_SUFFIX)):
+            try:
+                tier_dirs, tier_files = storage.listdir(path)
+            except FileNotFoundError:
+                continue
+            dirs.update(tier_dirs)
+            files.update(f[:-len(suffix)] if suffix else f for f in tier_files if f.endswith(suffix))
+        return sorted(dirs), sorted(files)
+
+
+# -----------------------------------------
+# Encryption at rest
+# -----------------------------------------
+@deconstructible
+class EncryptedStorage(Storage):
+    """
+    Seals files with ``patients.encryption`` before they reach ``inner``
+    (a storage config, by default MEDIA_ROOT on local disk) and decrypts
+    them on read. Files stored before encryption was enabled are read as
+    they are; ``manage.py encrypt_files`` seals them. Other methods of the
+    inner storage (``archive``, ``recall``... of a ``TieredStorage``) are
+    passed through.
+
+    There is no ``path()``: code that needs a local file copies it out,
+    and the web server cannot send these files itself.
+    """
+
+    def __init__(self, inner=None):
+        self.inner = _build(inner) if inner else FileSystemStorage()
+        self.keyring = encryption.Keyring.from_settings()
+
+    def __getattr__(self, name):
+        if name == 'inner':
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def _header(self, name):
+        with self.inner.open(name, 'rb') as fh:
+            return fh.read(encryption.HEADER_SIZE)
+
+    def _open(self, name, mode='rb'):
+        if 'r' not in mode or '+' in mode:
+            raise ValueError('Encrypted files can only be opened for reading.')
+        raw = self.inner.open(name, 'rb')
+        if not encryption.is_sealed(raw.read(len(encryption.MAGIC))):
+            raw.seek(0)
+            return raw
+        try:
+            reader = encryption.DecryptingReader(raw, self.inner.size(name), self.keyring)
+        except Exception:
+            raw.close()
+            raise
+        return File(io.BufferedReader(reader, buffer_size=encryption.CHUNK_SIZE), name=name)
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek') and getattr(content, 'seekable', lambda: True)():
+            content.seek(0)
+        sealed = io.BufferedReader(encryption.EncryptingReader(content, self.keyring), COPY_CHUNK_SIZE)
+        return self.inner.save(name, File(sealed, name=os.path.basename(name)))
+
+    def seal(self, name):
+        """
+        Encrypt ``name`` in place if it is plaintext or sealed with a retired
+        master key; returns False if it already uses the current key. Every
+        tier of a ``TieredStorage`` is rewritten, and a cold file stays cold.
+        """
+        if hasattr(self.inner, 'read_heads'):
+            heads = self.inner.read_heads(name, encryption.HEADER_SIZE)
+        else:
+            heads = [self._header(name)]
+        if heads and all(
+            encryption.is_sealed(head) and encryption.header_key_id(head) == self.keyring.current_id
+            for head in heads
+        ):
+            return False
+        cold = hasattr(self.inner, 'is_cold') and self.inner.is_cold(name)
+        with self.open(name, 'rb') as plain:
+            sealed = encryption.EncryptingReader(plain, self.keyring)
+            if hasattr(self.inner, 'replace'):
+                self.inner.replace(name, sealed, cold=cold)
+            else:
+                _overwrite(self.inner, name, sealed)
+        return True
+
+    def delete(self, name):
+        self.inner.delete(name)
+
+    def exists(self, name):
+        return self.inner.exists(name)
+
+    def size(self, name):
+        size = self.inner.size(name)
+        if size >= encryption.HEADER_SIZE and encryption.is_sealed(self._header(name)):
+            return encryption.plaintext_size(size)
+        return size
+
+    def url(self, name):
+        return self.inner.url(name)
+
+    def get_modified_time(self, name):
+        return self.inner.get_modified_time(name)
+
+    def listdir(self, path):
+        return self.inner.listdir(path)
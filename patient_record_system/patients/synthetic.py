@@ -0,0 +1,145 @@
+"""
+Synthetic patients, groups and files for load testing and benchmarks.
+
+Rows are inserted with ``bulk_create`` and blob content is not real: each
+blob is a sparse file holding a short text header and then zeros up to its
+size, keyed by a made-up digest. Listings, search, downloads and deletes
+behave as with real uploads while generating gigabytes costs almost no
+disk or time (on local storage; other backends receive the zeros). Synthetic users are named ``<prefix>-<run>-<n>`` and have no
+usable password; ``remove()`` deletes everything created under a prefix.
+"""
+import hashlib
+import math
+import os
+import random
+import tempfile
+import uuid
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import search
+from .blobstore import release
+from .models import FileBlob, Patient, PatientFile, RecordChange, RecordGroup, blob_upload_to, record_changes
+from .storage import store_file, temp_dir
+
+DEFAULT_PREFIX = 'synthetic'
+BATCH_SIZE = 1000
+
+GROUP_NAMES = [
+    'Blood Tests', 'X-Rays', 'Prescriptions', 'Discharge Summaries', 'MRI Scans',
+    'Vaccinations', 'Cardiology', 'Dental', 'Eye Checkups', 'Insurance',
+]
+TITLES = [
+    'Complete blood count', 'Lipid profile', 'Chest X-ray', 'Knee MRI', 'ECG report',
+    'Prescription', 'Discharge summary', 'Thyroid panel', 'Vaccination certificate',
+    'Dental X-ray', 'Eye examination', 'Blood sugar report', 'CT scan', 'Ultrasound',
+]
+EXTENSIONS = ['.pdf', '.pdf', '.pdf', '.jpg', '.jpg', '.png', '.txt']
+
+
+def file_size(rng, median, sigma, maximum):
+    """A log-normally distributed size (most files small, a few large), clamped to ``[1, maximum]``."""
+    return max(1, min(int(rng.lognormvariate(math.log(median), sigma)), maximum))
+
+
+def _group_name(n):
+    name = GROUP_NAMES[n % len(GROUP_NAMES)]
+    return f'{name} {n // len(GROUP_NAMES) + 1}' if n >= len(GROUP_NAMES) else name
+
+
+def _write_sparse(name, size, header):
+    fd, tmp_path = tempfile.mkstemp(dir=temp_dir(os.path.dirname(name)))
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(header[:size])
+        fh.truncate(size)
+    return store_file(name, tmp_path)
+
+
+def generate(patients=10, groups=4, files=50, median_size=200 * 1024, sigma=1.5,
+             max_size=50 * 1024 * 1024, ungrouped_ratio=0.2, duplicate_ratio=0.1,
+             prefix=DEFAULT_PREFIX, seed=None):
+    """
+    Create ``patients`` patients with ``groups`` groups and ``files`` files
+    each. ``duplicate_ratio`` of the files reuse the content of an earlier
+    file, exercising blob deduplication. Returns the new Patient objects.
+    """
+    rng = random.Random(seed)
+    run = uuid.uuid4().hex[:8]
+
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}-{run}-{n}', password='!') for n in range(patients)
+    ], batch_size=BATCH_SIZE)
+    new_patients = Patient.objects.bulk_create([
+        Patient(
+            user=user,
+            name=f'Synthetic Patient {run}-{n}',
+            dob=date(1940, 1, 1) + timedelta(days=rng.randrange(30000)),
+        )
+        for n, user in enumerate(users)
+    ], batch_size=BATCH_SIZE)
+
+    new_groups = RecordGroup.objects.bulk_create([
+        RecordGroup(patient=patient, name=_group_name(n))
+        for patient in new_patients for n in range(groups)
+    ], batch_size=BATCH_SIZE)
+    groups_by_patient = {}
+    for group in new_groups:
+        groups_by_patient.setdefault(group.patient_id, []).append(group)
+
+    blobs = []
+    records = []
+    for patient in new_patients:
+        patient_groups = groups_by_patient.get(patient.id, [])
+        for n in range(files):
+            title = rng.choice(TITLES)
+            if blobs and rng.random() < duplicate_ratio:
+                blob = rng.choice(blobs)
+                blob.ref_count += 1
+            else:
+                ext = rng.choice(EXTENSIONS)
+                digest = hashlib.sha256(f'{run}-{len(blobs)}'.encode()).hexdigest()
+                blob = FileBlob(sha256=digest, size=file_size(rng, median_size, sigma, max_size), ref_count=1)
+                blob.file.name = _write_sparse(
+                    blob_upload_to(blob, f'file{ext}'), blob.size, f'{title} {digest}\n'.encode()
+                )
+                blobs.append(blob)
+            group = rng.choice(patient_groups) if patient_groups and rng.random() >= ungrouped_ratio else None
+            records.append(PatientFile(
+                patient=patient,
+                group=group,
+                title=f'{title} {n + 1}',
+                description=f'Synthetic {title.lower()} for load testing',
+                original_name=f'{title.lower().replace(" ", "_")}_{n + 1}{os.path.splitext(blob.file.name)[1]}',
+                file=blob.file.name,
+                size=blob.size,
+                blob=blob,
+            ))
+
+    with transaction.atomic():
+        FileBlob.objects.bulk_create(blobs, batch_size=BATCH_SIZE)
+        PatientFile.objects.bulk_create(records, batch_size=BATCH_SIZE)
+        for start in range(0, len(records), BATCH_SIZE):
+            search.index_files(records[start:start + BATCH_SIZE], extract=False)
+        record_changes(
+            [(g.patient_id, RecordChange.GROUP, g.id, RecordChange.UPSERT) for g in new_groups]
+            + [(f.patient_id, RecordChange.FILE, f.id, RecordChange.UPSERT) for f in records]
+        )
+    return new_patients
+
+
+def remove(prefix=DEFAULT_PREFIX):
+    """Delete all synthetic users under ``prefix`` with their records and blobs; returns the number of users."""
+    users = User.objects.filter(username__startswith=f'{prefix}-')
+    count = users.count()
+    files = PatientFile.all_objects.filter(patient__user__in=users)
+    while True:
+        batch = list(files.values_list('id', 'blob_id')[:BATCH_SIZE])
+        if not batch:
+            break
+        with transaction.atomic():
+            PatientFile.all_objects.filter(id__in=[file_id for file_id, _ in batch]).delete()
+        release([blob_id for _, blob_id in batch])
+    users.delete()
+    return count
@@ -0,0 +1,56 @@
+"""
+Background jobs for the patients app (run by ``manage.py run_jobs``).
+"""
+from jobs.queue import task
+
+from . import search
+from .archives import build_archive
+from .collector import collect_deleted_files as collect_batch
+from .models import PatientFile, RecordGroup
+from .previews import generate_for_blob
+
+INDEX_BATCH_SIZE = 50
+
+
+@task('patients.generate_previews')
+def generate_previews(job, blob_ids):
+    job.set_progress(0, len(blob_ids))
+    for done, blob_id in enumerate(blob_ids, 1):
+        generate_for_blob(blob_id)
+        job.set_progress(done)
+    return {'blobs': len(blob_ids)}
+
+
+@task('patients.index_documents')
+def index_documents(job, file_ids):
+    """Extract and index the text of newly uploaded documents."""
+    job.set_progress(0, len(file_ids))
+    for start in range(0, len(file_ids), INDEX_BATCH_SIZE):
+        batch = file_ids[start:start + INDEX_BATCH_SIZE]
+        # Files deleted in the meantime are simply skipped.
+        search.index_files(PatientFile.objects.filter(id__in=batch).select_related('group'))
+        job.set_progress(start + len(batch))
+    return {'files': len(file_ids)}
+
+
+@task('patients.collect_deleted_files', max_attempts=5)
+def collect_deleted_files(job, batch_size=500):
+    """Remove tombstoned files from disk after a bulk delete."""
+    job.set_progress(0, PatientFile.all_objects.filter(deleted_at__isnull=False).count())
+    total = 0
+    while True:
+        removed = collect_batch(batch_size)
+        total += removed
+        job.set_progress(total)
+        if removed < batch_size:
+            return {'removed': total}
+
+
+@task('patients.build_group_archive')
+def build_group_archive(job, group_id):
+    """Refresh the cached ZIP of a group after its files changed."""
+    group = RecordGroup.objects.filter(id=group_id).first()
+    if group is None:
+        return {'mode': 'removed'}
+    archive, mode = build_archive(group)
+    return {'mode': mode, 'size': archive.size if archive else 0}
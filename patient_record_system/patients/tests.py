@@ -1,3 +1,249 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import archives, blobstore, resumable
+from .models import FileBlob, GroupArchive, Patient, PatientFile, RecordGroup
+
+
+class MediaTestCase(TestCase):
+    """Each test gets its own empty media and upload directories."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media, RESUMABLE_UPLOAD_ROOT=os.path.join(media, 'parts'))
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.user = User.objects.create_user('patient', password='secret')
+        self.patient = Patient.objects.create(user=self.user, name='Test Patient')
+
+    def add_file(self, content, name='report.txt', group=None):
+        patient_file = PatientFile(patient=self.patient, group=group, title=name, file=SimpleUploadedFile(name, content))
+        patient_file.save()
+        return patient_file
+
+
+class BlobReferenceTests(MediaTestCase):
+    def test_identical_uploads_share_one_blob(self):
+        first = self.add_file(b'same content', 'a.txt')
+        second = self.add_file(b'same content', 'b.txt')
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(FileBlob.objects.get().ref_count, 2)
+        self.assertEqual(second.original_name, 'b.txt')
+
+    def test_delete_releases_the_blob(self):
+        first = self.add_file(b'same content')
+        second = self.add_file(b'same content')
+        path = first.blob.file.path
+
+        first.delete()
+        self.assertEqual(FileBlob.objects.get().ref_count, 1)
+        second.delete()
+        self.assertFalse(FileBlob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_save_keeps_the_reference_count(self):
+        existing = self.add_file(b'same content')
+
+        with mock.patch.object(PatientFile, 'save_base', side_effect=DatabaseError('boom')):
+            with self.assertRaises(DatabaseError):
+                self.add_file(b'same content')
+            failed = PatientFile(patient=self.patient, title='new', file=SimpleUploadedFile('new.txt', b'new content'))
+            with self.assertRaises(DatabaseError):
+                failed.save()
+
+        self.assertEqual(FileBlob.objects.get().ref_count, 1)
+        self.assertEqual(FileBlob.objects.get().id, existing.blob_id)
+        self.assertIsNone(failed.blob)
+        self.assertFalse(failed.file._committed)
+        self.assertEqual(os.listdir(os.path.dirname(existing.blob.file.path)), [os.path.basename(existing.blob.file.name)])
+
+    def test_deleting_the_user_releases_blobs(self):
+        shared = self.add_file(b'shared')
+        self.add_file(b'own')
+        other = Patient.objects.create(user=User.objects.create_user('other'), name='Other')
+        PatientFile(patient=other, title='shared', file=SimpleUploadedFile('s.txt', b'shared')).save()
+        shared_path = shared.blob.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+
+        blob = FileBlob.objects.get()
+        self.assertEqual(blob.id, shared.blob_id)
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(shared_path))
+
+
+class AcquireManyTests(MediaTestCase):
+    def test_duplicates_in_a_batch_share_one_blob(self):
+        self.add_file(b'stored before')
+        uploads = [
+            SimpleUploadedFile('a.txt', b'twice'),
+            SimpleUploadedFile('b.txt', b'twice'),
+            SimpleUploadedFile('c.txt', b'stored before'),
+        ]
+
+        blobs = blobstore.acquire_many(uploads)
+
+        self.assertEqual(blobs[0].id, blobs[1].id)
+        self.assertEqual(FileBlob.objects.get(id=blobs[0].id).ref_count, 2)
+        self.assertEqual(FileBlob.objects.get(id=blobs[2].id).ref_count, 2)
+        self.assertEqual(FileBlob.objects.count(), 2)
+
+    def test_content_stored_concurrently_is_shared(self):
+        in_bulk = FileBlob.objects.in_bulk
+        raced = []
+
+        def racing_in_bulk(*args, **kwargs):
+            found = in_bulk(*args, **kwargs)
+            if not raced:
+                # Another upload stores the same content after the lookup.
+                raced.append(blobstore.acquire(SimpleUploadedFile('other.txt', b'raced')))
+            return found
+
+        with mock.patch.object(FileBlob.objects, 'in_bulk', racing_in_bulk):
+            blobs = blobstore.acquire_many([SimpleUploadedFile('a.txt', b'raced'), SimpleUploadedFile('b.txt', b'raced')])
+
+        blob = FileBlob.objects.get()
+        self.assertEqual([b.id for b in blobs], [blob.id, blob.id])
+        self.assertEqual(blob.ref_count, 3)
+        self.assertEqual(os.listdir(os.path.dirname(blob.file.path)), [os.path.basename(blob.file.name)])
+
+
+class ArchiveBuildTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = RecordGroup.objects.create(patient=self.patient, name='Lab')
+        self.add_file(b'one', 'one.txt', self.group)
+        self.add_file(b'two', 'two.txt', self.group)
+
+    def build_during(self, action):
+        """Build the archive, running ``action`` once the build has stored its file."""
+        store_file = archives.store_file
+        started = []
+
+        def racing_store_file(name, path):
+            stored = store_file(name, path)
+            if not started:
+                started.append(True)
+                action()
+            return stored
+
+        with mock.patch.object(archives, 'store_file', racing_store_file):
+            return archives.build_archive(self.group)
+
+    def test_appends_new_files(self):
+        self.assertEqual(archives.build_archive(self.group)[1], 'rebuilt')
+        self.add_file(b'three', 'three.txt', self.group)
+        archive, mode = archives.build_archive(self.group)
+
+        self.assertEqual(mode, 'appended')
+        self.assertEqual(len(archive.entries), 3)
+        self.assertEqual(archives.build_archive(self.group)[1], 'fresh')
+
+    def test_older_build_does_not_replace_a_newer_one(self):
+        def newer_build():
+            self.add_file(b'three', 'three.txt', self.group)
+            return archives.build_archive(self.group)
+
+        archive, mode = self.build_during(newer_build)
+
+        self.assertEqual(mode, 'stale')
+        stored = GroupArchive.objects.get(group=self.group)
+        self.assertEqual(len(stored.entries), 3)
+        self.assertTrue(default_storage.exists(stored.file.name))
+        self.assertEqual(len(os.listdir(os.path.dirname(stored.file.path))), 1)
+
+    def test_overlapping_builds_of_one_version_keep_the_stored_file(self):
+        archive, mode = self.build_during(lambda: archives.build_archive(self.group))
+
+        self.assertEqual(mode, 'stale')
+        stored = GroupArchive.objects.get(group=self.group)
+        self.assertTrue(default_storage.exists(stored.file.name))
+        self.assertIsNotNone(archives.current_archive(self.group, list(archives.group_files(self.group)))[0])
+
+
+class ResumableUploadTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = resumable.create_session(self.patient, 10, {'filename': 'scan.txt'})
+
+    def write(self, offset, data, checksum=None):
+        return resumable.write_chunk(self.session, offset, len(data), io.BytesIO(data), checksum)
+
+    def test_chunks_in_any_order_complete_the_upload(self):
+        self.assertIsNone(self.write(6, b'ghij'))
+        self.assertEqual(resumable.received_offset(self.session), 0)
+        self.assertIsNone(self.write(0, b'abc'))
+        self.assertEqual(resumable.received_ranges(self.session), [(0, 3), (6, 10)])
+
+        patient_file = self.write(3, b'def')
+
+        with PatientFile.objects.get(id=patient_file.id).file.open('rb') as fh:
+            self.assertEqual(fh.read(), b'abcdefghij')
+        self.assertFalse(os.path.exists(resumable.part_path(self.session)))
+
+    def test_overlapping_chunk_is_refused(self):
+        self.write(0, b'abcdef')
+
+        with self.assertRaises(resumable.UploadError) as raised:
+            self.write(4, b'XXXXXX')
+
+        self.assertEqual(raised.exception.status, 409)
+        with open(resumable.part_path(self.session), 'rb') as part:
+            self.assertEqual(part.read(6), b'abcdef')
+        self.assertEqual(resumable.received_ranges(self.session), [(0, 6)])
+
+    def test_exact_resend_is_verified_not_rewritten(self):
+        self.write(0, b'abcdef')
+        self.assertIsNone(self.write(0, b'abcdef'))
+
+        with self.assertRaises(resumable.UploadError) as raised:
+            self.write(0, b'abcdeX')
+        self.assertEqual(raised.exception.status, 409)
+        with open(resumable.part_path(self.session), 'rb') as part:
+            self.assertEqual(part.read(6), b'abcdef')
+
+    def test_truncated_and_corrupt_chunks_are_not_recorded(self):
+        with self.assertRaises(resumable.UploadError):
+            resumable.write_chunk(self.session, 0, 6, io.BytesIO(b'abc'))
+        with self.assertRaises(resumable.UploadError) as raised:
+            self.write(0, b'abcdef', checksum=hashlib.sha256(b'other').hexdigest())
+
+        self.assertEqual(raised.exception.status, 460)
+        self.assertFalse(self.session.chunks.exists())
+        # The range is free again for a correct resend.
+        self.assertIsNone(self.write(0, b'abcdef'))
+
+    def test_patch_reports_overlap_as_conflict(self):
+        self.client.force_login(self.user)
+        url = reverse('patients:resumable_upload', args=[self.session.id])
+
+        def patch(offset, data):
+            return self.client.patch(
+                url, data, content_type='application/offset+octet-stream',
+                headers={
+                    'Upload-Offset': str(offset),
+                    'Upload-Checksum': 'sha256 ' + base64.b64encode(hashlib.sha256(data).digest()).decode(),
+                },
+            )
+
+        response = patch(0, b'abcdef')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Upload-Offset'], '6')
+        self.assertEqual(patch(4, b'XXXXXX').status_code, 409)
+        self.assertEqual(patch(6, b'ghij').status_code, 204)
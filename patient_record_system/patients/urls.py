@@ -8,13 +8,18 @@ urlpatterns = [
     path('upload_file/', views.upload_file, name='upload_file'),
     path('upload/success/', views.upload_success, name='upload_success'),
     path('my-records/', views.my_records, name='my_records'),
+    path('records/page/', views.records_page, name='records_page'),
     path('create-group/', views.create_group, name='create_group'),
     path('batch-upload/', views.batch_upload, name='batch_upload'),
+    path('uploads/', views.resumable_upload_create, name='resumable_upload_create'),
+    path('uploads/<uuid:upload_id>/', views.resumable_upload, name='resumable_upload'),
     path('group/<int:group_id>/add/', views.add_to_group, name='add_to_group'),
     path('delete_group/<int:group_id>/', views.delete_group, name='delete_group'),
     path('group/<int:group_id>/download/', views.download_group, name='download_group'),
     path('batch-upload/', views.batch_upload, name='batch_upload'),
     path('ungrouped/', views.ungrouped_files, name='ungrouped_files'),
+    path('file/<int:file_id>/', views.serve_file, name='serve_file'),
+    path('file/<int:file_id>/<str:kind>/', views.file_preview, name='file_preview'),
     path('delete/<int:file_id>/', views.delete_file, name='delete_file'),
     path('remove/<int:file_id>/', views.remove_from_group, name='remove_from_group'),
     path('group/<int:group_id>/delete_all/', views.delete_all_files_in_group, name='delete_all_files_in_group'),
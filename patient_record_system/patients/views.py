@@ -1,13 +1,25 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse
-from io import BytesIO
-import zipfile
-import os
-
-from .models import Patient, PatientFile, RecordGroup
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q, Sum
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+
+from .models import Derivative, Patient, PatientFile, RecordGroup, UploadSession
+from .archives import current_archive, group_files, schedule_archives
+from .fileserve import patient_file_validators, serve_field_file
 from .forms import PatientFileUploadForm, BatchUploadForm, RecordGroupForm
+from . import blobstore, resumable, search, tasks
+from .pagination import encode_cursor, keyset_page
+from .services import ingest_files, record_listing
+from .zipstream import stream_zip
+
+# Files shown per group on My Records before "load more".
+GROUP_PREVIEW_SIZE = 20
 
 
 # -----------------------------------------
@@ -77,22 +89,15 @@ def batch_upload(request):
             existing_group = form.cleaned_data.get("group")
             new_group_name = form.cleaned_data.get("new_group_name")
 
-            # Decide group
-            group = None
-            if new_group_name:
-                group, _ = RecordGroup.objects.get_or_create(patient=patient, name=new_group_name.strip())
-            elif existing_group:
-                group = existing_group
-
-            # Create each file
-            for f in files:
-                PatientFile.objects.create(
-                    patient=patient,
-                    group=group,
-                    file=f,
-                    title=title or f.name,
-                    description=description,
-                )
+            with transaction.atomic():
+                # Decide group
+                group = None
+                if new_group_name:
+                    group, _ = RecordGroup.objects.get_or_create(patient=patient, name=new_group_name.strip())
+                elif existing_group:
+                    group = existing_group
+
+                ingest_files(patient, files, group=group, title=title, description=description)
 
             messages.success(request, f"{len(files)} file(s) uploaded successfully!")
             return redirect("patients:upload_success")
@@ -107,14 +112,130 @@ def batch_upload(request):
     return render(request, "patients/batch_upload.html", {"form": form})
 
 
+# -----------------------------------------
+# Resumable Upload (tus-style)
+# -----------------------------------------
+def _tus_response(status, **headers):
+    response = HttpResponse(status=status)
+    response['Tus-Resumable'] = resumable.TUS_VERSION
+    response['Cache-Control'] = 'no-store'
+    for name, value in headers.items():
+        response[name.replace('_', '-')] = value
+    return response
+
+
+def _tus_error(error):
+    response = _tus_response(error.status)
+    if error.status == 460:
+        response.reason_phrase = 'Checksum Mismatch'
+    response.content = str(error)
+    return response
+
+
+def _int_header(request, name):
+    try:
+        return int(request.headers[name])
+    except (KeyError, ValueError):
+        raise resumable.UploadError(f"Missing or invalid {name} header.")
+
+
+@login_required
+@require_http_methods(["POST"])
+def resumable_upload_create(request):
+    """Create an upload: Upload-Length plus optional filename/title/description/group metadata."""
+    patient = get_object_or_404(Patient, user=request.user)
+    try:
+        session = resumable.create_session(
+            patient,
+            _int_header(request, 'Upload-Length'),
+            resumable.parse_metadata(request.headers.get('Upload-Metadata')),
+        )
+    except resumable.UploadError as e:
+        return _tus_error(e)
+
+    location = reverse('patients:resumable_upload', args=[session.id])
+    return _tus_response(201, Location=request.build_absolute_uri(location), Upload_Offset=0)
+
+
+@login_required
+@require_http_methods(["HEAD", "PATCH", "DELETE"])
+def resumable_upload(request, upload_id):
+    """HEAD reports progress, PATCH writes a chunk at Upload-Offset, DELETE aborts."""
+    session = get_object_or_404(UploadSession, id=upload_id, patient__user=request.user)
+
+    if request.method == 'DELETE':
+        resumable.abort(session)
+        return _tus_response(204)
+
+    if request.method == 'HEAD':
+        ranges = resumable.received_ranges(session)
+        return _tus_response(
+            200,
+            Upload_Offset=resumable.received_offset(session),
+            Upload_Length=session.length,
+            Upload_Received=','.join(f'{start}-{end - 1}' for start, end in ranges),
+        )
+
+    if request.content_type != 'application/offset+octet-stream':
+        return _tus_response(415)
+    try:
+        offset = _int_header(request, 'Upload-Offset')
+        patient_file = resumable.write_chunk(
+            session,
+            offset,
+            _int_header(request, 'Content-Length'),
+            request,
+            resumable.parse_checksum(request.headers.get('Upload-Checksum')),
+        )
+    except resumable.UploadError as e:
+        return _tus_error(e)
+
+    headers = {'Upload_Offset': resumable.received_offset(session) if patient_file is None else session.length}
+    if patient_file is not None:
+        headers['Upload_File_Id'] = patient_file.id
+    return _tus_response(204, **headers)
+
+
 # -----------------------------------------
 # Ungrouped Files
 # -----------------------------------------
 @login_required
 def ungrouped_files(request):
     patient = get_object_or_404(Patient, user=request.user)
-    files = PatientFile.objects.filter(patient=patient, group__isnull=True).order_by('-uploaded_at')
-    return render(request, 'patients/ungrouped_files.html', {'files': files})
+    files, next_cursor = keyset_page(PatientFile.objects.filter(patient=patient, group__isnull=True).with_previews())
+    return render(request, 'patients/ungrouped_files.html', {'files': files, 'next_cursor': next_cursor})
+
+
+# -----------------------------------------
+# View / Download File
+# -----------------------------------------
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def serve_file(request, file_id):
+    """Send one of the patient's files after checking ownership; ?download=1 forces a download."""
+    file_obj = get_object_or_404(
+        PatientFile.objects.select_related('blob'), id=file_id, patient__user=request.user
+    )
+    etag, last_modified = patient_file_validators(file_obj)
+    blobstore.touch([file_obj.blob])
+    return serve_field_file(
+        request, file_obj.file, file_obj.filename, etag, last_modified,
+        as_attachment=bool(request.GET.get('download')),
+    )
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def file_preview(request, file_id, kind):
+    """Send a file's generated thumbnail or preview image."""
+    file_obj = get_object_or_404(
+        PatientFile.objects.select_related('blob'), id=file_id, patient__user=request.user, blob__isnull=False
+    )
+    derivative = get_object_or_404(Derivative, blob=file_obj.blob, kind=kind, status=Derivative.READY)
+    etag = f'"{file_obj.blob.sha256}-{kind}-{int(derivative.updated_at.timestamp())}"'
+    return serve_field_file(
+        request, derivative.file, f'{kind}.webp', etag, derivative.updated_at.timestamp()
+    )
 
 
 # -----------------------------------------
@@ -149,8 +270,10 @@ def remove_from_group(request, file_id):
             return redirect("patients:my_records")
 
         group_name = file_obj.group.name
+        old_group_id = file_obj.group_id
         file_obj.group = None
         file_obj.save()
+        schedule_archives([old_group_id])
         messages.success(request, f"✅ '{file_obj.title}' removed from group '{group_name}'.")
         return redirect("patients:my_records")
 
@@ -173,15 +296,58 @@ def upload_success(request):
 @login_required
 def my_records(request):
     patient = get_object_or_404(Patient, user=request.user)
-    groups = patient.groups.all()
-    files = patient.files.select_related('group').all()
+    live_files = Q(patientfile__deleted_at__isnull=True)
+    groups = (
+        patient.groups
+        .annotate(
+            file_count=Count('patientfile', filter=live_files),
+            total_size=Coalesce(Sum('patientfile__size', filter=live_files), 0),
+        )
+        .prefetch_related(Prefetch(
+            'patientfile_set',
+            queryset=PatientFile.objects.with_previews().order_by('-uploaded_at', '-id')[:GROUP_PREVIEW_SIZE],
+            to_attr='group_files',
+        ))
+        .order_by('-created_at', '-id')
+    )
+    for group in groups:
+        group.next_cursor = None
+        if group.file_count > len(group.group_files):
+            last = group.group_files[-1]
+            group.next_cursor = encode_cursor(last.uploaded_at, last.pk)
+
+    ungrouped, ungrouped_cursor = keyset_page(patient.files.filter(group__isnull=True).with_previews())
     return render(request, 'patients/my_records.html', {
         'patient': patient,
         'groups': groups,
-        'files': files
+        'ungrouped_files': ungrouped,
+        'ungrouped_cursor': ungrouped_cursor,
     })
 
 
+# -----------------------------------------
+# Record Pages (infinite scroll)
+# -----------------------------------------
+@login_required
+def records_page(request):
+    """
+    Next page of a file listing as JSON: rendered rows plus the cursor for
+    the page after it. Accepts ``cursor``, ``group`` (id or ``none``) and
+    ``q``; searches are ordered by relevance, listings by upload time.
+    """
+    patient = get_object_or_404(Patient, user=request.user)
+    group = request.GET.get('group')
+    query = request.GET.get('q')
+    if query:
+        items, next_cursor = search.search_page(patient, query, group=group, cursor=request.GET.get('cursor'))
+    else:
+        items, next_cursor = keyset_page(record_listing(patient, group=group), request.GET.get('cursor'))
+
+    template = 'patients/partials/ungrouped_items.html' if request.GET.get('layout') == 'list' else 'patients/partials/file_rows.html'
+    html = render_to_string(template, {'files': items, 'grouped': group not in (None, '', 'none')}, request=request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
+
 # -----------------------------------------
 # Create Group
 # -----------------------------------------
@@ -199,25 +365,10 @@ def create_group(request):
             messages.error(request, "Please enter a group name.")
             return redirect('patients:create_group')
 
-        group = RecordGroup.objects.create(patient=patient, name=group_name)
-
-        # Add existing files
-        for fid in selected_files:
-            try:
-                file = PatientFile.objects.get(id=fid, patient=patient)
-                file.group = group
-                file.save()
-            except PatientFile.DoesNotExist:
-                continue
-
-        # Add newly uploaded files
-        for f in uploaded_files:
-            PatientFile.objects.create(
-                patient=patient,
-                title=f.name,
-                file=f,
-                group=group
-            )
+        with transaction.atomic():
+            group = RecordGroup.objects.create(patient=patient, name=group_name)
+            # Add newly uploaded files and move selected existing ones
+            ingest_files(patient, uploaded_files, group=group, existing_ids=selected_files)
 
         messages.success(request, f"✅ Group '{group.name}' created successfully with files!")
         return redirect('patients:my_records')
@@ -238,21 +389,7 @@ def add_to_group(request, group_id):
         selected_files = request.POST.getlist('existing_files')
         uploaded_files = request.FILES.getlist('new_files')
 
-        for fid in selected_files:
-            try:
-                f = PatientFile.objects.get(id=fid, patient=patient)
-                f.group = group
-                f.save()
-            except PatientFile.DoesNotExist:
-                continue
-
-        for f in uploaded_files:
-            PatientFile.objects.create(
-                patient=patient,
-                title=f.name,
-                file=f,
-                group=group
-            )
+        ingest_files(patient, uploaded_files, group=group, existing_ids=selected_files)
 
         messages.success(request, f"✅ Files added to group '{group.name}'.")
         return redirect('patients:my_records')
@@ -281,20 +418,24 @@ def delete_group(request, group_id):
 @login_required
 def download_group(request, group_id):
     group = get_object_or_404(RecordGroup, id=group_id, patient__user=request.user)
-    files = group.patient.files.filter(group=group)
+    files = list(group_files(group))
 
-    if not files.exists():
+    if not files:
         messages.warning(request, "No files found in this group.")
         return redirect('patients:my_records')
-
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-        for f in files:
-            with f.file.open('rb') as file_data:
-                zip_file.writestr(f.file.name.split('/')[-1], file_data.read())
-
-    zip_buffer.seek(0)
-    response = HttpResponse(zip_buffer, content_type='application/zip')
+    blobstore.touch(f.blob for f in files)
+
+    # Serve the prebuilt archive when it matches the group's current files.
+    archive, version = current_archive(group, files)
+    if archive is not None:
+        return serve_field_file(
+            request, archive.file, f'{group.name}.zip', f'"{version}"', archive.built_at.timestamp(),
+            as_attachment=True,
+        )
+
+    schedule_archives([group.id])
+    entries = ((f.filename, f.file, f.uploaded_at) for f in files)
+    response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
     response['Content-Disposition'] = f'attachment; filename="{group.name}.zip"'
     return response
 
@@ -306,10 +447,11 @@ def delete_all_files_in_group(request, group_id):
     group = get_object_or_404(RecordGroup, id=group_id, patient__user=request.user)
     
     if request.method == 'POST':
-        files = PatientFile.objects.filter(group=group)
-        deleted_count = files.count()
-        for f in files:
-            f.delete()  # Ensures the physical file is deleted too
+        # Physical files are removed by a background job
+        deleted_count = PatientFile.objects.filter(group=group).tombstone()
+        if deleted_count:
+            tasks.collect_deleted_files.enqueue(user=request.user)
+            schedule_archives([group.id])
         messages.success(request, f"🗑️ Deleted {deleted_count} files from group '{group.name}'.")
         return redirect('patients:my_records')
 
@@ -321,19 +463,17 @@ def delete_all_files_in_group(request, group_id):
 @login_required
 def download_ungrouped_zip(request):
     patient = get_object_or_404(Patient, user=request.user)
-    files = PatientFile.objects.filter(patient=patient, group__isnull=True)
-    if not files:
+    files = PatientFile.objects.filter(patient=patient, group__isnull=True).exclude(file='')
+    if not files.exists():
         messages.error(request, "No ungrouped files to download.")
         return redirect('patients:my_records')
 
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-        for f in files:
-            if f.file:
-                zip_file.writestr(f.title or os.path.basename(f.file.name), f.file.read())
-    zip_buffer.seek(0)
-
-    response = HttpResponse(zip_buffer, content_type='application/zip')
+    blobstore.touch_files(files)
+    entries = (
+        (f.title or f.filename, f.file, f.uploaded_at)
+        for f in files.order_by('uploaded_at', 'id').iterator()
+    )
+    response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
     response['Content-Disposition'] = 'attachment; filename="Ungrouped_Files.zip"'
     return response
 
@@ -344,7 +484,8 @@ def download_ungrouped_zip(request):
 def delete_all_ungrouped(request):
     patient = get_object_or_404(Patient, user=request.user)
     if request.method == "POST":
-        PatientFile.objects.filter(patient=patient, group__isnull=True).delete()
+        if PatientFile.objects.filter(patient=patient, group__isnull=True).tombstone():
+            tasks.collect_deleted_files.enqueue(user=request.user)
         messages.success(request, "🗑️ All ungrouped files deleted successfully.")
     return redirect('patients:my_records')
 
@@ -0,0 +1,90 @@
+import mimetypes
+import os
+import zipfile
+
+
+# Size of each read from storage while streaming an archive entry.
+ZIP_CHUNK_SIZE = 64 * 1024
+
+# Non-text types we still know to compress well.
+DEFLATE_MIME_TYPES = {
+    'application/json',
+    'application/xml',
+    'application/csv',
+}
+
+
+class _ZipSink:
+    """
+    Write-only, non-seekable file object handed to ZipFile.
+
+    ZipFile falls back to data descriptors when it cannot seek, so each
+    entry can be written as it is read and the buffered bytes drained
+    to the client straight away.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compress_type_for(name):
+    """DEFLATE text files only; PDFs, images and scans are already compressed."""
+    mime_type, _ = mimetypes.guess_type(name)
+    if mime_type and (mime_type.startswith('text/') or mime_type in DEFLATE_MIME_TYPES):
+        return zipfile.ZIP_DEFLATED
+    return zipfile.ZIP_STORED
+
+
+def unique_arcname(name, used):
+    """Return ``name`` or ``name (n).ext`` so entries never overwrite each other."""
+    base, ext = os.path.splitext(name)
+    candidate = name
+    counter = 1
+    while candidate in used:
+        candidate = f'{base} ({counter}){ext}'
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+def stream_zip(entries, chunk_size=ZIP_CHUNK_SIZE):
+    """
+    Yield a ZIP archive built from ``(arcname, field_file, modified)`` tuples.
+
+    Only one chunk of one file is held in memory at a time, so memory stays
+    bounded however many files the archive contains. Files that can no
+    longer be opened are skipped.
+    """
+    sink = _ZipSink()
+    used = set()
+
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as zip_file:
+        for arcname, field_file, modified in entries:
+            try:
+                source = field_file.open('rb')
+            except (OSError, ValueError):
+                continue
+
+            info = zipfile.ZipInfo(unique_arcname(arcname, used), date_time=modified.timetuple()[:6])
+            info.compress_type = compress_type_for(arcname)
+            with source, zip_file.open(info, 'w', force_zip64=True) as dest:
+                for chunk in source.chunks(chunk_size):
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+
+    yield sink.drain()